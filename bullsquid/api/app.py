@@ -2,20 +2,27 @@
 Defines the create_app function used to initialize the application.
 """
 
+from typing import Awaitable, Callable
+
 from asyncpg.exceptions import PostgresError
 from fastapi import Depends, FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from loguru import logger
-from piccolo.engine import engine_finder
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 
 from bullsquid.api.auth import jwt_bearer
 from bullsquid.api.errors import error_response
 from bullsquid.customer_wallet.router import router as customer_wallet_router
+from bullsquid.db import close_connection_pool, identity_map, start_connection_pool
+from bullsquid.engine import read_from_replica, record_queries
 from bullsquid.merchant_data.router import router as merchant_data_router
+from bullsquid.settings import settings
 from bullsquid.status.views import router as status_api
 
+READ_ONLY_METHODS = {"GET", "HEAD"}
+READ_PRIMARY_HEADER = "X-Read-Primary"
+
 
 def create_app() -> FastAPI:
     """Creates and configures the FastAPI application."""
@@ -46,6 +53,49 @@ def create_app() -> FastAPI:
 
     app.mount("/fe2", StaticFiles(directory="fe2", html=True), name="Frontend 2")
 
+    @app.middleware("http")
+    async def request_identity_map(
+        request: Request, call_next: Callable[[Request], Awaitable[Response]]
+    ) -> Response:
+        """Memoises plan, merchant, and other hot lookups for each request."""
+        with identity_map():
+            return await call_next(request)
+
+    @app.middleware("http")
+    async def route_reads(
+        request: Request, call_next: Callable[[Request], Awaitable[Response]]
+    ) -> Response:
+        """
+        Sends reads made by read-only requests to the replica, if there is one.
+        Clients that need to see their own recent writes can send the
+        X-Read-Primary header to read from the primary instead.
+        """
+        if request.method in READ_ONLY_METHODS and not request.headers.get(
+            READ_PRIMARY_HEADER
+        ):
+            with read_from_replica():
+                return await call_next(request)
+        return await call_next(request)
+
+    @app.middleware("http")
+    async def time_queries(
+        request: Request, call_next: Callable[[Request], Awaitable[Response]]
+    ) -> Response:
+        """
+        Reports the number of queries each request ran and the time spent on
+        them in a Server-Timing header, and logs requests that query too much.
+        """
+        with record_queries() as stats:
+            response = await call_next(request)
+
+        response.headers["Server-Timing"] = stats.server_timing()
+        stats.log_if_expensive(
+            f"{request.method} {request.url.path}",
+            max_count=settings.request_query_count_threshold,
+            max_duration=settings.request_query_time_threshold,
+        )
+        return response
+
     @app.exception_handler(Exception)
     async def generic_error_handler(_request: Request, ex: Exception) -> JSONResponse:
         """Handles generic exceptions."""
@@ -77,10 +127,7 @@ def create_app() -> FastAPI:
     async def open_database_connection_pool() -> None:
         """Opens the database connection pool on application startup."""
         try:
-            engine = engine_finder()
-            if not engine:
-                raise RuntimeError("No database engine found")
-            await engine.start_connection_pool()
+            await start_connection_pool()
         except Exception as ex:  # pylint: disable=broad-except
             logger.error(f"Unable to connect to the database: {ex}")
 
@@ -88,10 +135,7 @@ def create_app() -> FastAPI:
     async def close_database_connection_pool() -> None:
         """Closes the database connection pool on application shutdown."""
         try:
-            engine = engine_finder()
-            if not engine:
-                raise RuntimeError("No database engine found")
-            await engine.close_connection_pool()
+            await close_connection_pool()
         except Exception as ex:  # pylint: disable=broad-except
             logger.error(f"Unable to connect to the database: {ex}")
 
@@ -11,6 +11,7 @@ from fastapi import BackgroundTasks, Depends, HTTPException, Request, status
 from fastapi.security import APIKeyHeader, HTTPAuthorizationCredentials, HTTPBearer
 from loguru import logger
 
+from bullsquid.engine import use_primary
 from bullsquid.service.auth0 import Auth0ServiceInterface
 from bullsquid.settings import settings
 from bullsquid.user_data.tables import UserProfile
@@ -176,6 +177,15 @@ else:
 
 
 async def fetch_user_data(user_id: str, auth0: Auth0ServiceInterface) -> None:
+    """
+    Create or refresh the user's profile from Auth0.
+    Always uses the primary, as this runs after GET requests as well.
+    """
+    with use_primary():
+        await _fetch_user_data(user_id, auth0)
+
+
+async def _fetch_user_data(user_id: str, auth0: Auth0ServiceInterface) -> None:
     update_cutoff = datetime.datetime.utcnow() - settings.user_profile_ttl
     exists = (
         await UserProfile()
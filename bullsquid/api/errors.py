@@ -114,6 +114,14 @@ class UniqueError(APIError):
         super().__init__()
 
 
+class BusyError(APIError):
+    """Raised when the server has no room for the request right now."""
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    error = "busy_error"
+    message = "Too many requests of this kind are running, try again later."
+
+
 class DataError(APIError):
     """Raised when a piece of data cannot be used."""
 
@@ -0,0 +1,61 @@
+"""Helpers for streaming large responses."""
+
+import csv
+import io
+import json
+from typing import Any, AsyncIterable, Mapping, Sequence
+
+from fastapi.responses import StreamingResponse
+
+
+def _attachment(filename: str) -> dict[str, str]:
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+
+async def _csv_lines(
+    rows: AsyncIterable[Sequence[Any]], *, header: Sequence[str]
+) -> AsyncIterable[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    async for row in rows:
+        writer.writerow(row)
+        # send what we have, then reuse the buffer for the next row.
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if header_only := buf.getvalue():
+        yield header_only
+
+
+def stream_csv(
+    rows: AsyncIterable[Sequence[Any]], *, header: Sequence[str], filename: str
+) -> StreamingResponse:
+    """
+    Returns a response that sends the given rows as a CSV file download, writing
+    each row as it arrives.
+    """
+    return StreamingResponse(
+        _csv_lines(rows, header=header),
+        media_type="text/csv",
+        headers=_attachment(filename),
+    )
+
+
+async def _json_lines(items: AsyncIterable[Mapping[str, Any]]) -> AsyncIterable[str]:
+    async for item in items:
+        yield json.dumps(item) + "\n"
+
+
+def stream_ndjson(
+    items: AsyncIterable[Mapping[str, Any]], *, filename: str
+) -> StreamingResponse:
+    """
+    Returns a response that sends the given items as a newline delimited JSON
+    file download, writing each item as it arrives.
+    """
+    return StreamingResponse(
+        _json_lines(items),
+        media_type="application/x-ndjson",
+        headers=_attachment(filename),
+    )
@@ -0,0 +1,101 @@
+"""
+Inspect and replay jobs that the task worker has given up on.
+
+Usage:
+    bullsquid-dead-letters summary [--type=<message_type>] [--since=<time>] [--until=<time>]
+    bullsquid-dead-letters replay [--type=<message_type>] [--since=<time>] [--until=<time>] [--batch-size=<n>] [--batch-interval=<seconds>]
+    bullsquid-dead-letters (-h | --help)
+    bullsquid-dead-letters --version
+
+Options:
+    -h --help                   Show this screen.
+    --version                   Show version.
+    --type=<message_type>       Only include jobs of this type, e.g. OnboardPrimaryMIDs.
+    --since=<time>              Only include jobs that failed at or after this ISO 8601 time.
+    --until=<time>              Only include jobs that failed before this ISO 8601 time.
+    --batch-size=<n>            Number of jobs to requeue in each batch [default: 100].
+    --batch-interval=<seconds>  Delay between each batch becoming runnable [default: 10].
+"""  # noqa: E501
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from docopt import docopt
+
+from bullsquid import __version__
+
+
+def parse_time(value: str | None) -> datetime | None:
+    """Parse an ISO 8601 time, assuming UTC if no offset is given."""
+    if value is None:
+        return None
+
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+async def summary(
+    *, message_type: str | None, since: datetime | None, until: datetime | None
+) -> None:
+    """Print the number of dead letters awaiting replay for each message type."""
+    from bullsquid.merchant_data.tasks.dead_letters import count_dead_letters
+
+    counts = await count_dead_letters(
+        message_type=message_type, since=since, until=until
+    )
+    if not counts:
+        print("No dead letters.")
+        return
+
+    width = max(len(name) for name in counts)
+    for name, count in sorted(counts.items()):
+        print(f"{name:<{width}}  {count}")
+
+
+async def replay(
+    *,
+    message_type: str | None,
+    since: datetime | None,
+    until: datetime | None,
+    batch_size: int,
+    batch_interval: timedelta,
+) -> None:
+    """Requeue dead letters matching the given filters."""
+    from bullsquid.merchant_data.tasks.dead_letters import replay_dead_letters
+
+    replayed = await replay_dead_letters(
+        message_type=message_type,
+        since=since,
+        until=until,
+        batch_size=batch_size,
+        batch_interval=batch_interval,
+    )
+    print(f"Requeued {replayed} job(s).")
+
+
+def main() -> None:
+    """Executes the dead letter tool."""
+    args = docopt(__doc__, version=f"bullsquid-dead-letters {__version__}")
+
+    message_type = args["--type"]
+    since = parse_time(args["--since"])
+    until = parse_time(args["--until"])
+
+    if args["summary"]:
+        asyncio.run(summary(message_type=message_type, since=since, until=until))
+    elif args["replay"]:
+        asyncio.run(
+            replay(
+                message_type=message_type,
+                since=since,
+                until=until,
+                batch_size=int(args["--batch-size"]),
+                batch_interval=timedelta(seconds=float(args["--batch-interval"])),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
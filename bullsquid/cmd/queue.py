@@ -0,0 +1,63 @@
+"""
+Report the depth and age of the task queue for each message type.
+
+Usage:
+    bullsquid-queue [--json]
+    bullsquid-queue (-h | --help)
+    bullsquid-queue --version
+
+Options:
+    -h --help   Show this screen.
+    --version   Show version.
+    --json      Print one JSON object per message type instead of a table.
+"""
+
+import asyncio
+
+from docopt import docopt
+
+from bullsquid import __version__
+
+COLUMNS = ("message_type", "pending", "scheduled", "running", "oldest_pending_age")
+
+
+async def report(*, as_json: bool) -> None:
+    """Print queue statistics."""
+    from bullsquid.merchant_data.tasks.stats import queue_stats
+
+    stats = await queue_stats()
+
+    if as_json:
+        for stat in stats:
+            print(stat.json())
+        return
+
+    if not stats:
+        print("The queue is empty.")
+        return
+
+    rows = [
+        [
+            stat.message_type,
+            str(stat.pending),
+            str(stat.scheduled),
+            str(stat.running),
+            "-"
+            if stat.oldest_pending_age is None
+            else f"{stat.oldest_pending_age:.0f}s",
+        ]
+        for stat in stats
+    ]
+    widths = [max(len(value) for value in column) for column in zip(COLUMNS, *rows)]
+    for row in [list(COLUMNS), *rows]:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def main() -> None:
+    """Executes the queue report."""
+    args = docopt(__doc__, version=f"bullsquid-queue {__version__}")
+    asyncio.run(report(as_json=args["--json"]))
+
+
+if __name__ == "__main__":
+    main()
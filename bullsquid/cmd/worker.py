@@ -20,6 +20,44 @@ from bullsquid.settings import settings
 from bullsquid.log_conf import set_loguru_intercept
 
 
+async def run() -> None:
+    """
+    Opens the database connection pool, then runs the task worker alongside its
+    metrics server, stuck job watchdog, and queue housekeeping.
+    """
+    import asyncio
+
+    from bullsquid.db import close_connection_pool, start_connection_pool
+    from bullsquid.merchant_data.tasks import run_worker
+    from bullsquid.merchant_data.tasks.housekeeping import (
+        run_housekeeping_periodically,
+    )
+    from bullsquid.merchant_data.tasks.timeouts import run_watchdog
+    from bullsquid.metrics import serve_metrics
+
+    await start_connection_pool()
+
+    metrics_runner = (
+        await serve_metrics(port=settings.worker_metrics_port)
+        if settings.worker_metrics_port
+        else None
+    )
+
+    background_tasks = [
+        asyncio.create_task(run_watchdog()),
+        asyncio.create_task(run_housekeeping_periodically()),
+    ]
+
+    try:
+        await run_worker()
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await close_connection_pool()
+
+
 def main() -> None:
     """Executes the task worker."""
     docopt(__doc__, version=f"bullsquid-worker {__version__}")
@@ -27,10 +65,8 @@ def main() -> None:
     # importing these here allows --help and --version to finish a little quicker
     import asyncio
 
-    from bullsquid.merchant_data.tasks import run_worker
-
     try:
-        asyncio.run(run_worker())
+        asyncio.run(run())
     except KeyboardInterrupt:
         logger.info("Caught interrupt, exiting.")
 
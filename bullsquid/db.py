@@ -1,13 +1,44 @@
 """Database access layer."""
 
-from typing import Any, Type, TypeVar
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Hashable,
+    Iterator,
+    Type,
+    TypeVar,
+)
 from uuid import UUID
 
+from asyncpg import Record
+
 from piccolo.columns import Column
+from piccolo.engine import engine_finder
+from piccolo.engine.postgres import PostgresEngine
 from piccolo.query import Objects, Select
 from piccolo.table import Table
+from pydantic import BaseModel
 
+from bullsquid.engine import RoutingPostgresEngine, StreamSlot
 from bullsquid.merchant_data.tables import BaseTable
+from bullsquid.metrics import REGISTRY, gauge
+from bullsquid.settings import settings
+
+pool_connections = gauge(
+    "bullsquid_db_pool_connections",
+    "Number of connections in the database pool, by state.",
+    ["state"],
+)
+
+pool_max_connections = gauge(
+    "bullsquid_db_pool_max_connections",
+    "Maximum number of connections the database pool will open.",
+)
 
 
 class NoSuchRecord(Exception):
@@ -26,6 +57,153 @@ class InvalidData(Exception):
         self.table = table
 
 
+T = TypeVar("T")
+
+
+class PoolStats(BaseModel):
+    """Usage of the database connection pool."""
+
+    size: int
+    idle: int
+    busy: int
+    min_size: int
+    max_size: int
+
+
+def _engine() -> PostgresEngine:
+    engine = engine_finder()
+    if not isinstance(engine, PostgresEngine):
+        raise RuntimeError("No database engine found")
+    return engine
+
+
+def _routing_engine() -> RoutingPostgresEngine:
+    engine = _engine()
+    if not isinstance(engine, RoutingPostgresEngine):
+        raise RuntimeError("Streaming queries needs a RoutingPostgresEngine")
+    return engine
+
+
+async def reserve_stream() -> StreamSlot:
+    """
+    Reserve a slot for a streamed query without waiting for one. Raises
+    StreamsBusy if every slot is in use.
+    """
+    return await _routing_engine().reserve_stream()
+
+
+def stream_rows(
+    query: str, *args: Any, prefetch: int, slot: StreamSlot | None = None
+) -> AsyncGenerator[Record, None]:
+    """
+    Yield the rows of a SELECT query through a server-side cursor, holding at
+    most `prefetch` rows in memory at a time. The stream uses the given slot
+    from reserve_stream, or waits for one if it isn't given one.
+    """
+    return _routing_engine().stream(query, *args, prefetch=prefetch, slot=slot)
+
+
+async def start_connection_pool() -> None:
+    """Open the database connection pool using the configured pool settings."""
+    await _engine().start_connection_pool(
+        min_size=settings.database.pool_min_size,
+        max_size=settings.database.pool_max_size,
+        max_queries=settings.database.pool_max_queries,
+        max_inactive_connection_lifetime=(
+            settings.database.pool_max_inactive_connection_lifetime
+        ),
+    )
+
+
+async def close_connection_pool() -> None:
+    """Close the database connection pool."""
+    await _engine().close_connection_pool()
+
+
+def pool_stats(*, replica: bool = False) -> PoolStats | None:
+    """
+    Returns usage of the database connection pool, or None if it isn't open.
+    If `replica` is true, returns usage of the read replica's pool instead.
+    """
+    engine: PostgresEngine | None = _engine()
+    if replica:
+        engine = getattr(engine, "replica", None)
+
+    pool = engine.pool if engine else None
+    if pool is None:
+        return None
+
+    size = pool.get_size()
+    idle = pool.get_idle_size()
+    return PoolStats(
+        size=size,
+        idle=idle,
+        busy=size - idle,
+        min_size=pool.get_min_size(),
+        max_size=pool.get_max_size(),
+    )
+
+
+async def collect_pool_stats() -> None:
+    """Refresh the connection pool gauges."""
+    pool_connections.clear()
+    pool_max_connections.clear()
+    if stats := pool_stats():
+        pool_connections.set(stats.idle, state="idle")
+        pool_connections.set(stats.busy, state="busy")
+        pool_max_connections.set(stats.max_size)
+
+
+REGISTRY.add_collector(collect_pool_stats)
+
+# maps lookup keys to the (possibly still running) lookups made in the current
+# request. None when there is no identity map active, e.g. in the worker.
+_identity_map: ContextVar[dict[Hashable, asyncio.Future] | None] = ContextVar(
+    "identity_map", default=None
+)
+
+
+@contextmanager
+def identity_map() -> Iterator[None]:
+    """
+    Memoise lookups made with `load` until the end of the block.
+    Used to scope an identity map to a single API request.
+    """
+    token = _identity_map.set({})
+    try:
+        yield
+    finally:
+        _identity_map.reset(token)
+
+
+async def load(key: Hashable, fetch: Callable[[], Awaitable[T]]) -> T:
+    """
+    Returns the result of `fetch`, memoised under `key` in the current identity
+    map. Concurrent loads of the same key share a single query, and failures
+    such as NoSuchRecord are memoised along with successful results.
+    Without an active identity map, `fetch` is always awaited.
+    """
+    loaded = _identity_map.get()
+    if loaded is None:
+        return await fetch()
+
+    if key not in loaded:
+        loaded[key] = asyncio.ensure_future(fetch())
+    return await asyncio.shield(loaded[key])
+
+
+def prime(key: Hashable, value: Any) -> None:
+    """
+    Add an already loaded value to the current identity map, if there is one.
+    Used to memoise rows that were loaded as part of another query.
+    """
+    loaded = _identity_map.get()
+    if loaded is not None and key not in loaded:
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+        loaded[key] = future
+
+
 async def fields_are_unique(
     model: Type[BaseTable],
     fields: dict[Column, Any],
@@ -48,14 +226,18 @@ async def fields_are_unique(
     return not await duplicates_exist
 
 
+def escape_like(value: str) -> str:
+    """Escapes the LIKE wildcards in the given value so it only matches itself."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
 Paginatable = TypeVar("Paginatable", Select, Objects)
 
 
-def paginate(query: Paginatable, *, n: int, p: int) -> Paginatable:
+def page_bounds(*, n: int, p: int) -> tuple[int, int]:
     """
-    Applies pagination to the given select query.
-    `n` controls how many results are in the page.
-    `p` controls which page of results is returned, starting with page #1.
+    Returns the limit and offset for page `p` of `n` results, for queries that
+    can't use paginate. Pages start with page #1.
     """
     if n < 1:
         raise ValueError("n must be >= 1")
@@ -63,4 +245,14 @@ def paginate(query: Paginatable, *, n: int, p: int) -> Paginatable:
     if p < 1:
         raise ValueError("p must be >= 1")
 
-    return query.limit(n).offset(n * (p - 1))
+    return n, n * (p - 1)
+
+
+def paginate(query: Paginatable, *, n: int, p: int) -> Paginatable:
+    """
+    Applies pagination to the given select query.
+    `n` controls how many results are in the page.
+    `p` controls which page of results is returned, starting with page #1.
+    """
+    limit, offset = page_bounds(n=n, p=p)
+    return query.limit(limit).offset(offset)
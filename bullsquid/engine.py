@@ -0,0 +1,297 @@
+"""
+A Postgres engine that can send reads to a replica, and records how many
+queries are run and how long they take.
+
+This module is imported by the piccolo configuration, so it must not import any
+table modules.
+"""
+
+import asyncio
+import heapq
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from typing import Any, AsyncGenerator, Iterator
+
+from asyncpg import Connection, Record
+
+from loguru import logger
+from piccolo.engine.postgres import PostgresEngine
+from piccolo.querystring import QueryString
+
+from bullsquid.settings import settings
+
+# how many of the slowest queries are kept for logging.
+SLOWEST_QUERIES = 3
+
+# long queries are cut down to this many characters in logs.
+MAX_LOGGED_QUERY_LENGTH = 500
+
+
+class QueryStats:
+    """The number of queries run in a record_queries block and their timings."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+        self.slowest: list[tuple[float, str]] = []
+
+    def record(self, query: str, duration: float) -> None:
+        """Record a query that took `duration` seconds."""
+        self.count += 1
+        self.duration += duration
+        self.slowest = heapq.nlargest(
+            SLOWEST_QUERIES, [*self.slowest, (duration, query)], key=lambda q: q[0]
+        )
+
+    def server_timing(self) -> str:
+        """Returns a Server-Timing header value for the recorded queries."""
+        return f'db;dur={self.duration * 1000:.1f};desc="{self.count} queries"'
+
+    def log_if_expensive(
+        self, label: str, *, max_count: int, max_duration: timedelta
+    ) -> bool:
+        """
+        Log a warning with the slowest queries if more than `max_count` queries
+        were run, or they took longer than `max_duration` in total.
+        Returns true if a warning was logged.
+        """
+        if self.count <= max_count and self.duration <= max_duration.total_seconds():
+            return False
+
+        slowest = "\n".join(
+            f"  {duration * 1000:.1f}ms: {_truncate(query)}"
+            for duration, query in self.slowest
+        )
+        logger.warning(
+            f"{label} ran {self.count} queries in {self.duration * 1000:.1f}ms. "
+            f"Slowest queries:\n{slowest}"
+        )
+        return True
+
+
+_query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+@contextmanager
+def record_queries() -> Iterator[QueryStats]:
+    """Count and time the queries made in the block."""
+    stats = QueryStats()
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+
+def _truncate(query: str) -> str:
+    query = " ".join(query.split())
+    if len(query) > MAX_LOGGED_QUERY_LENGTH:
+        return query[:MAX_LOGGED_QUERY_LENGTH] + "..."
+    return query
+
+
+class _ReplicaRouting:
+    """Whether reads may currently go to the replica."""
+
+    def __init__(self) -> None:
+        self.enabled = True
+
+
+_routing: ContextVar[_ReplicaRouting | None] = ContextVar(
+    "replica_routing", default=None
+)
+
+
+@contextmanager
+def read_from_replica() -> Iterator[None]:
+    """
+    Send reads made in the block to the replica, if there is one.
+    Once anything is written in the block, reads go back to the primary so
+    that they see the write.
+    """
+    token = _routing.set(_ReplicaRouting())
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+@contextmanager
+def use_primary() -> Iterator[None]:
+    """Send every query made in the block to the primary."""
+    token = _routing.set(None)
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+# statements that make a WITH query a write, wherever they appear in it.
+_WRITE_STATEMENT = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE)\b")
+
+# row locking clauses, which a read only replica refuses.
+_LOCKING_CLAUSE = re.compile(r"\bFOR\s+(NO\s+KEY\s+)?(UPDATE|SHARE|KEY\s+SHARE)\b")
+
+
+def _is_read(query: str) -> bool:
+    query = query.lstrip().upper()
+    if _LOCKING_CLAUSE.search(query):
+        return False
+    if query.startswith("SELECT"):
+        return True
+    # a WITH query only reads if none of its parts modify data.
+    return query.startswith("WITH") and not _WRITE_STATEMENT.search(query)
+
+
+async def _set_stream_timeouts(connection: Connection) -> None:
+    # SET LOCAL only lasts for the transaction, so nothing leaks through
+    # pgbouncer onto other clients' connections.
+    for name, seconds in (
+        ("statement_timeout", settings.database.stream_statement_timeout),
+        ("idle_in_transaction_session_timeout", settings.database.stream_idle_timeout),
+    ):
+        await connection.execute(f"SET LOCAL {name} = {int(seconds * 1000)}")
+
+
+class StreamsBusy(Exception):
+    """Raised when every stream slot is in use."""
+
+
+class StreamSlot:
+    """
+    One of the engine's stream slots, held until it is released. Releasing a
+    slot more than once does nothing.
+    """
+
+    def __init__(self, semaphore: asyncio.Semaphore) -> None:
+        self._semaphore = semaphore
+        self._released = False
+
+    def release(self) -> None:
+        """Give the slot back to the engine."""
+        if not self._released:
+            self._released = True
+            self._semaphore.release()
+
+
+class RoutingPostgresEngine(PostgresEngine):
+    """
+    Runs everything on the primary unless inside a read_from_replica block, in
+    which case plain SELECT statements outside of a transaction run on the
+    replica instead.
+    Every query is timed; slow ones are logged, and all are added to the
+    current record_queries block if there is one.
+    """
+
+    def __init__(
+        self,
+        config: dict[str, Any],
+        *,
+        replica_config: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(config, **kwargs)
+        self.replica = (
+            PostgresEngine(
+                replica_config,
+                # replicas are read only, so extensions must come from the primary.
+                extensions=(),
+                log_queries=self.log_queries,
+                log_responses=self.log_responses,
+            )
+            if replica_config
+            else None
+        )
+        self._streams = asyncio.Semaphore(settings.database.stream_max_concurrent)
+
+    def _replica_for(self, query: str) -> PostgresEngine | None:
+        routing = _routing.get()
+        if (
+            self.replica is None
+            or routing is None
+            or not routing.enabled
+            or self.current_transaction.get()
+        ):
+            return None
+
+        if _is_read(query):
+            return self.replica
+
+        # read your writes for the rest of the block.
+        routing.enabled = False
+        return None
+
+    async def run_querystring(
+        self, querystring: QueryString, in_pool: bool = True
+    ) -> Any:
+        query, _ = querystring.compile_string(engine_type=self.engine_type)
+        started_at = time.perf_counter()
+        try:
+            if replica := self._replica_for(query):
+                return await replica.run_querystring(querystring, in_pool=in_pool)
+            return await super().run_querystring(querystring, in_pool=in_pool)
+        finally:
+            self._record(query, time.perf_counter() - started_at)
+
+    async def reserve_stream(self) -> StreamSlot:
+        """
+        Take a stream slot without waiting for one, or raise StreamsBusy if
+        they are all in use. A response can reserve its slot before it sends
+        its headers, while it can still fail with an error status.
+        """
+        if self._streams.locked():
+            raise StreamsBusy
+        await self._streams.acquire()
+        return StreamSlot(self._streams)
+
+    async def stream(
+        self, query: str, *args: Any, prefetch: int, slot: StreamSlot | None = None
+    ) -> AsyncGenerator[Record, None]:
+        """
+        Yield the rows of a SELECT query from a server-side cursor, fetching
+        `prefetch` rows at a time, so that memory use doesn't grow with the
+        size of the result.
+        The cursor stays open for as long as the caller takes to read it, so
+        it runs on a new connection rather than one from the pool, with its
+        own timeouts, and only a few streams may run at once. The stream waits
+        for a slot unless it is given one from reserve_stream, and releases the
+        slot once it is finished.
+        The query is timed once the stream is finished. By then a response has
+        already sent its headers, so only the slow query log will see it.
+        """
+        engine = self._replica_for(query) or self
+        if slot is None:
+            await self._streams.acquire()
+            slot = StreamSlot(self._streams)
+        try:
+            connection: Connection = await engine.get_new_connection()
+            started_at = time.perf_counter()
+            try:
+                async with connection.transaction():
+                    await _set_stream_timeouts(connection)
+                    async for row in connection.cursor(query, *args, prefetch=prefetch):
+                        yield row
+            finally:
+                self._record(query, time.perf_counter() - started_at)
+                await connection.close()
+        finally:
+            slot.release()
+
+    def _record(self, query: str, duration: float) -> None:
+        if duration > settings.slow_query_threshold.total_seconds():
+            logger.warning(f"Slow query ({duration * 1000:.1f}ms): {_truncate(query)}")
+        if stats := _query_stats.get():
+            stats.record(query, duration)
+
+    async def start_connection_pool(self, **kwargs: Any) -> None:
+        await super().start_connection_pool(**kwargs)
+        if self.replica:
+            await self.replica.start_connection_pool(**kwargs)
+
+    async def close_connection_pool(self) -> None:
+        await super().close_connection_pool()
+        if self.replica:
+            await self.replica.close_connection_pool()
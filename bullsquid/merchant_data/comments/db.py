@@ -6,6 +6,7 @@ from collections import defaultdict
 from typing import Type, TypeVar
 from uuid import UUID
 
+from piccolo.columns.combination import WhereRaw
 from piccolo.table import Table
 
 from bullsquid.db import NoSuchRecord, paginate
@@ -197,8 +198,12 @@ async def list_comments_by_subject(
     List all comments with the given ref as one of their subjects.
     Returns a list of CommentResponse instances.
     """
+    # `subjects @> array[ref]` rather than `ref = any(subjects)` so that the
+    # GIN index on subjects can be used.
     comments = await paginate(
-        Comment.objects().where(Comment.subjects.any(ref), Comment.parent.is_null()),
+        Comment.objects().where(
+            WhereRaw("subjects @> array[{}]::uuid[]", ref), Comment.parent.is_null()
+        ),
         n=n,
         p=p,
     )
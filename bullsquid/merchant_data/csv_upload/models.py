@@ -20,7 +20,7 @@ class LocationFileRecord(BaseModel):
     parent_name: str | None
     name: str | None
     location_id: str
-    merchant_internal_id: str
+    merchant_internal_id: str | None
     is_physical: bool
     address_line_1: str | None
     address_line_2: str | None
@@ -34,13 +34,12 @@ class LocationFileRecord(BaseModel):
     visa_secondary_mids: str
     mastercard_secondary_mids: str
 
-    _ = validator("location_id", "merchant_internal_id", allow_reuse=True)(
-        string_must_not_be_blank
-    )
+    _ = validator("location_id", allow_reuse=True)(string_must_not_be_blank)
     _ = validator(
         "merchant_name",
         "parent_name",
         "name",
+        "merchant_internal_id",
         "address_line_1",
         "address_line_2",
         "town_city",
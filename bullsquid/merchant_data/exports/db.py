@@ -0,0 +1,139 @@
+"""Database access layer for exporting a merchant's data in the CSV import formats."""
+
+from typing import Any, AsyncIterator, Type
+from uuid import UUID
+
+from bullsquid.db import stream_rows
+from bullsquid.engine import StreamSlot
+from bullsquid.merchant_data.csv_upload.models import (
+    IdentifiersFileRecord,
+    LocationFileRecord,
+)
+from bullsquid.merchant_data.enums import ResourceStatus
+from bullsquid.merchant_data.models import BaseModel
+
+# how many rows are fetched from the cursor at a time.
+EXPORT_PREFETCH = 500
+
+_DELETED = f"'{ResourceStatus.DELETED.value}'"
+
+
+def _primary_mids(payment_scheme: str) -> str:
+    """The location's primary MIDs on the payment scheme, separated by spaces."""
+    return f"""coalesce((
+        SELECT string_agg(primary_mid.mid, ' ' ORDER BY primary_mid.mid)
+        FROM primary_mid
+        WHERE primary_mid.location = location.pk
+        AND primary_mid.payment_scheme = '{payment_scheme}'
+        AND primary_mid.status <> {_DELETED}
+    ), '')"""
+
+
+def _secondary_mids(payment_scheme: str) -> str:
+    """The location's linked secondary MIDs on the payment scheme."""
+    return f"""coalesce((
+        SELECT string_agg(
+            secondary_mid.secondary_mid, ' ' ORDER BY secondary_mid.secondary_mid
+        )
+        FROM secondary_mid_location_link AS link
+        JOIN secondary_mid ON secondary_mid.pk = link.secondary_mid
+        WHERE link.location = location.pk
+        AND secondary_mid.payment_scheme = '{payment_scheme}'
+        AND secondary_mid.status <> {_DELETED}
+    ), '')"""
+
+
+_IDENTIFIER_COLUMNS = f"""
+    {_primary_mids("visa")} AS visa_mids,
+    {_primary_mids("amex")} AS amex_mids,
+    {_primary_mids("mastercard")} AS mastercard_mids,
+    {_secondary_mids("visa")} AS visa_secondary_mids,
+    {_secondary_mids("mastercard")} AS mastercard_secondary_mids"""
+
+# Every location on the merchant, with the columns of LocationFileRecord.
+# Top-level locations come first so that re-importing them creates parents
+# before their sub-locations.
+LOCATIONS_EXPORT_QUERY = f"""
+SELECT
+    merchant.name AS merchant_name,
+    parent.name AS parent_name,
+    location.name,
+    location.location_id,
+    location.merchant_internal_id,
+    location.is_physical_location AS is_physical,
+    location.address_line_1,
+    location.address_line_2,
+    location.town_city,
+    location.county,
+    location.country,
+    location.postcode,{_IDENTIFIER_COLUMNS}
+FROM location
+JOIN merchant ON merchant.pk = location.merchant
+LEFT JOIN location AS parent ON parent.pk = location.parent
+WHERE location.merchant = $1 AND location.status <> {_DELETED}
+ORDER BY location.parent IS NOT NULL, location.created, location.pk
+"""
+
+# The MIDs linked to each location on the merchant, with the columns of
+# IdentifiersFileRecord. Locations without any MIDs are left out.
+IDENTIFIERS_EXPORT_QUERY = f"""
+SELECT * FROM (
+    SELECT
+        merchant.name AS merchant_name,
+        location.location_id,{_IDENTIFIER_COLUMNS},
+        location.created,
+        location.pk
+    FROM location
+    JOIN merchant ON merchant.pk = location.merchant
+    WHERE location.merchant = $1 AND location.status <> {_DELETED}
+) AS identifiers
+WHERE concat(
+    visa_mids, amex_mids, mastercard_mids,
+    visa_secondary_mids, mastercard_secondary_mids
+) <> ''
+ORDER BY created, pk
+"""
+
+
+async def _export(
+    query: str,
+    merchant_ref: UUID,
+    *,
+    record_model: Type[BaseModel],
+    slot: StreamSlot | None,
+) -> AsyncIterator[dict[str, Any]]:
+    fields = list(record_model.__fields__)
+    async for row in stream_rows(
+        query, merchant_ref, prefetch=EXPORT_PREFETCH, slot=slot
+    ):
+        yield {field: row[field] for field in fields}
+
+
+def export_locations(
+    merchant_ref: UUID, *, slot: StreamSlot | None = None
+) -> AsyncIterator[dict[str, Any]]:
+    """
+    Yield every location on the merchant as a LocationFileRecord dictionary.
+    Rows are streamed from the database, so memory use doesn't grow with the
+    number of locations. The stream uses the given slot from reserve_stream,
+    if any.
+    """
+    return _export(
+        LOCATIONS_EXPORT_QUERY, merchant_ref, record_model=LocationFileRecord, slot=slot
+    )
+
+
+def export_identifiers(
+    merchant_ref: UUID, *, slot: StreamSlot | None = None
+) -> AsyncIterator[dict[str, Any]]:
+    """
+    Yield the MIDs of every location on the merchant as IdentifiersFileRecord
+    dictionaries. Rows are streamed from the database, so memory use doesn't
+    grow with the number of locations.
+    """
+    return _export(
+        IDENTIFIERS_EXPORT_QUERY,
+        merchant_ref,
+        record_model=IdentifiersFileRecord,
+        slot=slot,
+    )
@@ -0,0 +1,121 @@
+"""Endpoints for exporting a merchant's data in the formats it can be imported from."""
+
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Type
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from bullsquid.api.auth import JWTCredentials
+from bullsquid.api.errors import BusyError, ResourceNotFoundError
+from bullsquid.api.streaming import stream_csv, stream_ndjson
+from bullsquid.db import NoSuchRecord, reserve_stream
+from bullsquid.engine import StreamsBusy, StreamSlot
+from bullsquid.merchant_data.auth import AccessLevel, require_access_level
+from bullsquid.merchant_data.csv_upload.models import (
+    IdentifiersFileRecord,
+    LocationFileRecord,
+)
+from bullsquid.merchant_data.exports import db
+from bullsquid.merchant_data.merchants.db import get_merchant
+from bullsquid.merchant_data.models import BaseModel
+
+router = APIRouter(prefix="/plans/{plan_ref}/merchants/{merchant_ref}/export")
+
+
+class ExportFormat(Enum):
+    """Supported file formats for exporting data to."""
+
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+async def _values(records: AsyncIterator[dict[str, Any]]) -> AsyncIterator[list[Any]]:
+    async for record in records:
+        yield list(record.values())
+
+
+async def export_response(
+    export: Callable[[StreamSlot], AsyncIterator[dict[str, Any]]],
+    *,
+    plan_ref: UUID,
+    merchant_ref: UUID,
+    record_model: Type[BaseModel],
+    export_format: ExportFormat,
+    name: str,
+) -> StreamingResponse:
+    """
+    Returns a response that streams the exported records in the requested
+    format. The merchant is checked and a stream slot reserved first, as errors
+    can't be sent once streaming starts.
+    """
+    try:
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
+    except NoSuchRecord as ex:
+        raise ResourceNotFoundError.from_no_such_record(ex, loc=["path"]) from ex
+
+    try:
+        slot = await reserve_stream()
+    except StreamsBusy as ex:
+        raise BusyError() from ex
+
+    records = export(slot)
+    filename = f"{name}-{merchant_ref}.{export_format.value}"
+    match export_format:
+        case ExportFormat.CSV:
+            response = stream_csv(
+                _values(records),
+                header=list(record_model.__fields__),
+                filename=filename,
+            )
+        case ExportFormat.NDJSON:
+            response = stream_ndjson(records, filename=filename)
+
+    # the stream releases the slot when it finishes, but it never starts if the
+    # client goes away first.
+    response.background = BackgroundTask(slot.release)
+    return response
+
+
+@router.get("/locations", response_class=StreamingResponse)
+async def export_locations(
+    plan_ref: UUID,
+    merchant_ref: UUID,
+    export_format: ExportFormat = Query(default=ExportFormat.CSV, alias="format"),
+    _credentials: JWTCredentials = Depends(require_access_level(AccessLevel.READ_ONLY)),
+) -> StreamingResponse:
+    """
+    Export every location on the merchant, with its MIDs, in the locations file
+    format. The export can be uploaded again through the CSV upload endpoint.
+    """
+    return await export_response(
+        lambda slot: db.export_locations(merchant_ref, slot=slot),
+        plan_ref=plan_ref,
+        merchant_ref=merchant_ref,
+        record_model=LocationFileRecord,
+        export_format=export_format,
+        name="locations",
+    )
+
+
+@router.get("/identifiers", response_class=StreamingResponse)
+async def export_identifiers(
+    plan_ref: UUID,
+    merchant_ref: UUID,
+    export_format: ExportFormat = Query(default=ExportFormat.CSV, alias="format"),
+    _credentials: JWTCredentials = Depends(require_access_level(AccessLevel.READ_ONLY)),
+) -> StreamingResponse:
+    """
+    Export the MIDs on each of the merchant's locations in the identifiers file
+    format. The export can be uploaded again through the CSV upload endpoint.
+    """
+    return await export_response(
+        lambda slot: db.export_identifiers(merchant_ref, slot=slot),
+        plan_ref=plan_ref,
+        merchant_ref=merchant_ref,
+        record_model=IdentifiersFileRecord,
+        export_format=export_format,
+        name="identifiers",
+    )
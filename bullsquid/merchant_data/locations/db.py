@@ -1,26 +1,65 @@
 """Database access layer for operations on locations"""
 
+from collections import defaultdict
 from uuid import UUID
 
-from bullsquid.db import NoSuchRecord, paginate
+from piccolo.columns.combination import WhereRaw
+from piccolo.query import Objects, OrderByRaw
+from piccolo.query.methods.select import Count
+
+from bullsquid.db import NoSuchRecord, escape_like, load, page_bounds, paginate
 from bullsquid.merchant_data.enums import ResourceStatus
 from bullsquid.merchant_data.locations.models import (
     LocationDetailMetadata,
     LocationDetailResponse,
     LocationOverviewMetadata,
     LocationOverviewResponse,
+    LocationTreeMetadata,
+    LocationTreeNode,
 )
 from bullsquid.merchant_data.locations.tables import Location
 from bullsquid.merchant_data.locations_common.db import (
     create_sub_location_overview_response,
 )
-from bullsquid.merchant_data.merchants.db import get_merchant
+from bullsquid.merchant_data.merchants.db import get_merchant, merchant_owns
 from bullsquid.merchant_data.primary_mids.tables import PrimaryMID
 from bullsquid.merchant_data.secondary_mid_location_links.tables import (
     SecondaryMIDLocationLink,
 )
 from bullsquid.merchant_data.secondary_mids.tables import SecondaryMID
 
+_DELETED = f"'{ResourceStatus.DELETED.value}'"
+
+# Selects a page of root locations on a merchant, and every location below
+# them. The roots are filtered by {parent_filter}, which is filled in with
+# str.format and leaves {} placeholders for the query parameters. The path
+# column guards against cycles in the parent links.
+LOCATION_TREE_QUERY = f"""
+WITH RECURSIVE roots AS (
+    SELECT location.*
+    FROM location
+    JOIN merchant ON merchant.pk = location.merchant
+    JOIN plan ON plan.pk = merchant.plan
+    WHERE {{parent_filter}}
+    AND location.status <> {_DELETED}
+    AND merchant.pk = {{{{}}}} AND merchant.status <> {_DELETED}
+    AND plan.pk = {{{{}}}} AND plan.status <> {_DELETED}
+    ORDER BY location.created DESC, location.pk
+    LIMIT {{{{}}}} OFFSET {{{{}}}}
+), tree AS (
+    SELECT roots.*, 0 AS depth, ARRAY[roots.pk] AS path
+    FROM roots
+    UNION ALL
+    SELECT location.*, tree.depth + 1, tree.path || location.pk
+    FROM location
+    JOIN tree ON location.parent = tree.pk
+    WHERE location.status <> {_DELETED}
+    AND location.pk <> ALL(tree.path)
+)
+SELECT * FROM tree
+ORDER BY depth, created DESC, pk
+"""
+
 
 def create_location_overview_metadata(location: Location) -> LocationOverviewMetadata:
     """Creates a LocationMetadataResponse instance from the given location object."""
@@ -51,10 +90,12 @@ def create_location_detail_metadata(location: Location) -> LocationDetailMetadat
     )
 
 
-async def create_location_overview_response(
+def create_location_overview_response(
     location: Location,
     *,
     sub_locations: list[Location] | None,
+    linked_mids_count: int | None = None,
+    linked_secondary_mids_count: int | None = None,
 ) -> LocationOverviewResponse:
     """Creates a LocationOverviewResponse instance from the given merchant object."""
     return LocationOverviewResponse(
@@ -63,28 +104,57 @@ async def create_location_overview_response(
         location_status=location.status,
         location_metadata=create_location_overview_metadata(location),
         sub_locations=[
-            await create_sub_location_overview_response(sub_location)
+            create_sub_location_overview_response(sub_location)
             for sub_location in sub_locations
         ]
         if sub_locations
         else None,
+        linked_mids_count=linked_mids_count,
+        linked_secondary_mids_count=linked_secondary_mids_count,
     )
 
 
+async def count_location_links(
+    location_refs: list[UUID],
+) -> tuple[dict[UUID, int], dict[UUID, int]]:
+    """
+    Count the primary MIDs and secondary MIDs linked to each of the given
+    locations, using two queries however many locations there are.
+    Locations without any links are left out of the returned dictionaries.
+    """
+    if not location_refs:
+        return {}, {}
+
+    mid_counts = {
+        mid_count["location"]: mid_count["count"]
+        for mid_count in await PrimaryMID.all_select(PrimaryMID.location, Count())
+        .where(
+            PrimaryMID.location.is_in(location_refs),
+            PrimaryMID.status != ResourceStatus.DELETED,
+        )
+        .group_by(PrimaryMID.location)
+    }
+    secondary_mid_counts = {
+        link_count["location"]: link_count["count"]
+        for link_count in await SecondaryMIDLocationLink.select(
+            SecondaryMIDLocationLink.location, Count()
+        )
+        .where(SecondaryMIDLocationLink.location.is_in(location_refs))
+        .group_by(SecondaryMIDLocationLink.location)
+    }
+    return mid_counts, secondary_mid_counts
+
+
 async def create_location_detail_response(location: Location) -> LocationDetailResponse:
     """Creates a LocationDetailResponse instance from the given merchant object."""
-
-    mid_count = await PrimaryMID.count().where(PrimaryMID.location == location)
-    secondary_mid_count = await SecondaryMIDLocationLink.count().where(
-        SecondaryMIDLocationLink.location == location
-    )
+    mid_counts, secondary_mid_counts = await count_location_links([location.pk])
 
     return LocationDetailResponse(
         date_added=location.date_added,
         location_ref=location.pk,
         location_status=location.status,
-        linked_mids_count=mid_count,
-        linked_secondary_mids_count=secondary_mid_count,
+        linked_mids_count=mid_counts.get(location.pk, 0),
+        linked_secondary_mids_count=secondary_mid_counts.get(location.pk, 0),
         location_metadata=create_location_detail_metadata(location),
     )
 
@@ -95,14 +165,17 @@ async def list_locations(
     merchant_ref: UUID,
     exclude_secondary_mid: UUID | None,
     include_sub_locations: bool,
+    include_counts: bool,
     n: int,
     p: int,
 ) -> list[LocationOverviewResponse]:
-    """Return a list of all locations on the given merchant."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
-
+    """
+    Return a list of all locations on the given merchant.
+    With `include_counts`, each location also has the number of primary and
+    secondary MIDs linked to it.
+    """
     query = Location.objects().where(
-        Location.merchant == merchant,
+        merchant_owns(Location.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref),
         Location.parent.is_null(),
     )
 
@@ -110,35 +183,139 @@ async def list_locations(
         # validate secondary MID ref
         if not await SecondaryMID.exists().where(
             SecondaryMID.pk == exclude_secondary_mid,
-            SecondaryMID.merchant == merchant,
+            merchant_owns(
+                SecondaryMID.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref
+            ),
         ):
+            await get_merchant(merchant_ref, plan_ref=plan_ref)
             raise NoSuchRecord(SecondaryMID)
 
-        linked_location_pks = (
-            await SecondaryMIDLocationLink.select(SecondaryMIDLocationLink.location.pk)
-            .where(SecondaryMIDLocationLink.secondary_mid == exclude_secondary_mid)
-            .output(as_list=True)
+        query = query.where(
+            WhereRaw(
+                "NOT EXISTS ("
+                "SELECT FROM secondary_mid_location_link AS link "
+                "WHERE link.location = location.pk AND link.secondary_mid = {}"
+                ")",
+                exclude_secondary_mid,
+            )
         )
-        if linked_location_pks:
-            query = query.where(Location.pk.not_in(linked_location_pks))
 
     locations = await paginate(
         query,
         n=n,
         p=p,
     )
+    if not locations:
+        # an empty page could also mean a bad merchant or plan ref.
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
+
+    sub_locations: dict[UUID, list[Location]] = defaultdict(list)
+    if include_sub_locations and locations:
+        # load the sub-locations for the whole page at once.
+        for sub_location in await Location.objects().where(
+            Location.parent.is_in([location.pk for location in locations])
+        ):
+            sub_locations[sub_location.parent].append(sub_location)
+
+    mid_counts, secondary_mid_counts = (
+        await count_location_links([location.pk for location in locations])
+        if include_counts
+        else ({}, {})
+    )
 
     return [
-        await create_location_overview_response(
+        create_location_overview_response(
             location,
-            sub_locations=await Location.objects().where(Location.parent == location.pk)
-            if include_sub_locations
+            sub_locations=sub_locations[location.pk] if include_sub_locations else None,
+            linked_mids_count=mid_counts.get(location.pk, 0)
+            if include_counts
+            else None,
+            linked_secondary_mids_count=secondary_mid_counts.get(location.pk, 0)
+            if include_counts
             else None,
         )
         for location in locations
     ]
 
 
+def create_location_tree_node(
+    location: Location, children: dict[UUID, list[Location]]
+) -> LocationTreeNode:
+    """
+    Creates a LocationTreeNode for the given location, with its descendants
+    taken from `children`, which maps location refs to their sub-locations.
+    """
+    return LocationTreeNode(
+        date_added=location.date_added,
+        location_ref=location.pk,
+        location_status=ResourceStatus(location.status),
+        location_metadata=LocationTreeMetadata(
+            name=location.name,
+            location_id=location.location_id,
+            merchant_internal_id=location.merchant_internal_id,
+            is_physical_location=location.is_physical_location,
+            address_line_1=location.address_line_1,
+            town_city=location.town_city,
+            postcode=location.postcode,
+        ),
+        sub_locations=[
+            create_location_tree_node(child, children)
+            for child in children[location.pk]
+        ],
+    )
+
+
+async def list_location_tree(
+    *,
+    plan_ref: UUID,
+    merchant_ref: UUID,
+    parent_ref: UUID | None,
+    n: int,
+    p: int,
+) -> list[LocationTreeNode]:
+    """
+    Return a page of the merchant's top-level locations, or of the children of
+    `parent_ref`, each with the whole tree of locations below it.
+    The tree is loaded in a single recursive query; pagination only applies to
+    the roots.
+    """
+    params: list[object] = [merchant_ref, plan_ref, *page_bounds(n=n, p=p)]
+    if parent_ref:
+        parent_filter = "location.parent = {}"
+        params.insert(0, parent_ref)
+    else:
+        parent_filter = "location.parent IS NULL"
+
+    rows = await Location.raw(
+        LOCATION_TREE_QUERY.format(parent_filter=parent_filter), *params
+    )
+
+    if not rows:
+        # an empty page could also mean a bad merchant, plan, or parent ref.
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
+        if parent_ref and not await Location.exists().where(
+            Location.pk == parent_ref,
+            merchant_owns(
+                Location.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref
+            ),
+        ):
+            raise NoSuchRecord(Location)
+
+    # rows come out a level at a time, newest first within each level.
+    roots: list[Location] = []
+    children: dict[UUID, list[Location]] = defaultdict(list)
+    for row in rows:
+        depth = row.pop("depth")
+        row.pop("path")
+        location = Location(**row)
+        if depth == 0:
+            roots.append(location)
+        else:
+            children[location.parent].append(location)
+
+    return [create_location_tree_node(root, children) for root in roots]
+
+
 async def create_location(
     location_data: LocationDetailMetadata,
     *,
@@ -163,22 +340,63 @@ async def create_location(
     )
     await location.save()
 
-    return await create_location_overview_response(location, sub_locations=[])
+    return create_location_overview_response(location, sub_locations=[])
 
 
 async def list_available_primary_mids(
     plan_ref: UUID,
     merchant_ref: UUID,
     location_ref: UUID,
+    *,
+    mid_prefix: str | None,
+    payment_scheme_slug: str | None,
+    n: int,
+    p: int,
 ) -> list[PrimaryMID]:
-    """List available mids for association with a location"""
-    await get_location(location_ref, plan_ref=plan_ref, merchant_ref=merchant_ref)
-    return await PrimaryMID.objects(
-        PrimaryMID.payment_scheme, PrimaryMID.location
-    ).where(
+    """
+    List available mids for association with a location, in order of their MID
+    value. Optionally only lists MIDs starting with `mid_prefix`, or on the
+    given payment scheme.
+    """
+    await get_location_instance(
+        location_ref, plan_ref=plan_ref, merchant_ref=merchant_ref
+    )
+    return await paginate(
+        available_primary_mids_query(
+            merchant_ref,
+            location_ref,
+            mid_prefix=mid_prefix,
+            payment_scheme_slug=payment_scheme_slug,
+        ),
+        n=n,
+        p=p,
+    )
+
+
+def available_primary_mids_query(
+    merchant_ref: UUID,
+    location_ref: UUID,
+    *,
+    mid_prefix: str | None,
+    payment_scheme_slug: str | None,
+) -> Objects:
+    """
+    Build the query behind list_available_primary_mids, without pagination.
+    query-plans.py explains it as piccolo compiles it.
+    """
+    query = PrimaryMID.all_objects(PrimaryMID.location).where(
         PrimaryMID.merchant == merchant_ref,
+        PrimaryMID.status != ResourceStatus.DELETED,
         (PrimaryMID.location != location_ref) | (PrimaryMID.location.is_null()),
     )
+    if mid_prefix:
+        query = query.where(PrimaryMID.mid.like(f"{escape_like(mid_prefix)}%"))
+    if payment_scheme_slug:
+        query = query.where(PrimaryMID.payment_scheme == payment_scheme_slug)
+
+    # sorted the same way as the primary_mid_available index, so that pages can
+    # be read straight from it.
+    return query.order_by(OrderByRaw('primary_mid.mid COLLATE "C"'), PrimaryMID.pk)
 
 
 async def get_location(
@@ -188,20 +406,9 @@ async def get_location(
     merchant_ref: UUID,
 ) -> LocationDetailResponse:
     """Return the details of a location with the given primary key."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
-
-    location = await (
-        Location.objects()
-        .where(
-            Location.pk == location_ref,
-            Location.merchant == merchant,
-            Location.parent.is_null(),
-        )
-        .first()
+    location = await get_location_instance(
+        location_ref, plan_ref=plan_ref, merchant_ref=merchant_ref
     )
-    if not location:
-        raise NoSuchRecord(Location)
-
     return await create_location_detail_response(location)
 
 
@@ -212,21 +419,26 @@ async def get_location_instance(
     merchant_ref: UUID,
 ) -> Location:
     """Return a single location object with the given primary key."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
 
-    location = (
-        await Location.objects()
-        .where(
-            Location.pk == location_ref,
-            Location.merchant == merchant,
-            Location.parent.is_null(),
+    async def fetch() -> Location:
+        location = (
+            await Location.objects()
+            .where(
+                Location.pk == location_ref,
+                merchant_owns(
+                    Location.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref
+                ),
+                Location.parent.is_null(),
+            )
+            .first()
         )
-        .first()
-    )
-    if not location:
-        raise NoSuchRecord(Location)
+        if not location:
+            await get_merchant(merchant_ref, plan_ref=plan_ref)
+            raise NoSuchRecord(Location)
+
+        return location
 
-    return location
+    return await load((Location, location_ref, merchant_ref, plan_ref), fetch)
 
 
 async def confirm_locations_exist(
@@ -279,7 +491,9 @@ async def list_associated_primary_mids(
     p: int,
 ) -> list[PrimaryMID]:
     """List available mids in association with a location"""
-    await get_location(location_ref, plan_ref=plan_ref, merchant_ref=merchant_ref)
+    await get_location_instance(
+        location_ref, plan_ref=plan_ref, merchant_ref=merchant_ref
+    )
     return await paginate(
         PrimaryMID.objects(PrimaryMID.payment_scheme).where(
             PrimaryMID.merchant == merchant_ref,
@@ -47,6 +47,24 @@ class LocationOverviewResponse(LocationOverviewBase):
 
     location_metadata: LocationOverviewMetadata
     sub_locations: list[SubLocationOverviewResponse] | None
+    linked_mids_count: int | None
+    linked_secondary_mids_count: int | None
+
+
+class LocationTreeMetadata(LocationOverviewMetadataBase):
+    """Location details in the location tree. Sub-locations have no location_id."""
+
+    location_id: str | None
+
+
+class LocationTreeNode(LocationOverviewBase):
+    """A location with all of the locations below it in the hierarchy."""
+
+    location_metadata: LocationTreeMetadata
+    sub_locations: list["LocationTreeNode"]
+
+
+LocationTreeNode.update_forward_refs()
 
 
 class LocationDetailResponse(LocationOverviewBase):
@@ -19,6 +19,7 @@ from bullsquid.merchant_data.locations.models import (
     LocationDetailMetadata,
     LocationDetailResponse,
     LocationOverviewResponse,
+    LocationTreeNode,
     PrimaryMIDLinkRequest,
     PrimaryMIDLinkResponse,
     SecondaryMIDLinkRequest,
@@ -43,6 +44,7 @@ async def list_locations(  # pylint: disable=too-many-arguments
     merchant_ref: UUID,
     exclude_secondary_mid: UUID | None = Query(default=None),
     include_sub_locations: bool = Query(default=False),
+    include_counts: bool = Query(default=False),
     n: int = Query(default=settings.default_page_size),
     p: int = Query(default=1),
     _credentials: JWTCredentials = Depends(require_access_level(AccessLevel.READ_ONLY)),
@@ -54,6 +56,7 @@ async def list_locations(  # pylint: disable=too-many-arguments
             merchant_ref=merchant_ref,
             exclude_secondary_mid=exclude_secondary_mid,
             include_sub_locations=include_sub_locations,
+            include_counts=include_counts,
             n=n,
             p=p,
         )
@@ -69,6 +72,38 @@ async def list_locations(  # pylint: disable=too-many-arguments
     return locations
 
 
+@router.get("/tree", response_model=list[LocationTreeNode])
+async def list_location_tree(  # pylint: disable=too-many-arguments
+    plan_ref: UUID,
+    merchant_ref: UUID,
+    parent_ref: UUID | None = Query(default=None),
+    n: int = Query(default=settings.default_page_size),
+    p: int = Query(default=1),
+    _credentials: JWTCredentials = Depends(require_access_level(AccessLevel.READ_ONLY)),
+) -> list[LocationTreeNode]:
+    """
+    List a merchant's locations with everything below them in the hierarchy.
+    Pagination applies to the top-level locations, or to the children of
+    `parent_ref` if given.
+    """
+    try:
+        tree = await db.list_location_tree(
+            plan_ref=plan_ref,
+            merchant_ref=merchant_ref,
+            parent_ref=parent_ref,
+            n=n,
+            p=p,
+        )
+    except NoSuchRecord as ex:
+        loc = ["query"] if ex.table == Location else ["path"]
+        override_field_name = "parent_ref" if ex.table == Location else None
+        raise ResourceNotFoundError.from_no_such_record(
+            ex, loc=loc, override_field_name=override_field_name
+        ) from ex
+
+    return tree
+
+
 @router.get("/{location_ref}", response_model=LocationDetailResponse)
 async def get_location(
     plan_ref: UUID,
@@ -259,12 +294,25 @@ async def list_available_mids(
     plan_ref: UUID,
     merchant_ref: UUID,
     location_ref: UUID,
+    mid_prefix: str | None = Query(default=None),
+    payment_scheme_slug: str | None = Query(default=None),
+    n: int = Query(default=settings.default_page_size),
+    p: int = Query(default=1),
     _credentials: JWTCredentials = Depends(require_access_level(AccessLevel.READ_ONLY)),
 ) -> list[AvailablePrimaryMID]:
-    """returns the list of MIDs that are available for association with a location"""
+    """
+    returns the list of MIDs that are available for association with a location,
+    optionally filtered by a MID prefix and payment scheme.
+    """
     try:
         available_mids = await db.list_available_primary_mids(
-            plan_ref, merchant_ref=merchant_ref, location_ref=location_ref
+            plan_ref,
+            merchant_ref=merchant_ref,
+            location_ref=location_ref,
+            mid_prefix=mid_prefix,
+            payment_scheme_slug=payment_scheme_slug,
+            n=n,
+            p=p,
         )
     except NoSuchRecord as ex:
         raise ResourceNotFoundError.from_no_such_record(ex, loc=["path"]) from ex
@@ -283,7 +331,7 @@ async def list_available_mids(
             else None,
             mid=PrimaryMIDLinkResponse(
                 mid_ref=mid.pk,
-                payment_scheme_slug=mid.payment_scheme.slug,
+                payment_scheme_slug=mid.payment_scheme,
                 mid_value=mid.mid,
             ),
         )
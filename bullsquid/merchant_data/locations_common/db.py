@@ -23,7 +23,7 @@ def create_location_overview_metadata_base(
     )
 
 
-async def create_sub_location_overview_response(
+def create_sub_location_overview_response(
     location: Location,
 ) -> SubLocationOverviewResponse:
     """Creates a LocationOverviewResponse instance from the given merchant object."""
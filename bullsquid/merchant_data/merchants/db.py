@@ -1,11 +1,12 @@
 """Database access layer for operations on merchants."""
 
-from typing import Any, Mapping
+from typing import Any, Mapping, Sequence, Type, TypeVar
 from uuid import UUID
 
-from piccolo.columns import Column
+from piccolo.columns import Column, ForeignKey
+from piccolo.columns.combination import Combinable
 
-from bullsquid.db import NoSuchRecord, paginate
+from bullsquid.db import NoSuchRecord, load, paginate, prime
 from bullsquid.merchant_data.enums import ResourceStatus, TXMStatus
 from bullsquid.merchant_data.locations.tables import Location
 from bullsquid.merchant_data.merchants.models import CreateMerchantRequest
@@ -18,6 +19,57 @@ from bullsquid.merchant_data.secondary_mid_location_links.tables import (
     SecondaryMIDLocationLink,
 )
 from bullsquid.merchant_data.secondary_mids.tables import SecondaryMID
+from bullsquid.merchant_data.tables import BaseTable
+
+OwnedTable = TypeVar("OwnedTable", bound=BaseTable)
+
+_DELETED = f"'{ResourceStatus.DELETED.value}'"
+_PENDING_DELETION = f"'{ResourceStatus.PENDING_DELETION.value}'"
+_ONBOARDED = f"'{TXMStatus.ONBOARDED.value}'"
+
+# Finds the given rows, as long as they are on the merchant, and none of the
+# rows, the merchant, or its plan have been deleted.
+# Table and column names in these queries are filled in with str.format, which
+# leaves {} placeholders for the query parameters.
+OWNED_TARGET_CTE = f"""target AS (
+    SELECT {{table}}.pk
+    FROM {{table}}
+    JOIN merchant ON merchant.pk = {{table}}.merchant
+    JOIN plan ON plan.pk = merchant.plan
+    WHERE {{table}}.pk = ANY({{{{}}}}::uuid[])
+    AND {{table}}.status <> {_DELETED}
+    AND merchant.pk = {{{{}}}} AND merchant.status <> {_DELETED}
+    AND plan.pk = {{{{}}}} AND plan.status <> {_DELETED}
+)"""
+
+# Updates the target rows, but only if every one of them was found.
+# Returns the updated rows, or nothing at all if any were missing.
+UPDATE_OWNED_QUERY = f"""
+WITH {OWNED_TARGET_CTE}
+UPDATE {{table}}
+SET {{assignments}}
+WHERE pk IN (SELECT pk FROM target)
+AND (SELECT count(*) FROM target) = {{{{}}}}
+RETURNING *
+"""
+
+# Deletes the target rows, but only if every one of them was found. Rows that
+# are onboarded onto TXM are marked as pending deletion instead, so that they
+# can be offboarded first.
+# Returns the new status of each row, or nothing at all if any were missing.
+DELETE_OWNED_QUERY = f"""
+WITH {OWNED_TARGET_CTE}, updated AS (
+    UPDATE {{table}}
+    SET status = CASE
+        WHEN txm_status = {_ONBOARDED} THEN {_PENDING_DELETION}
+        ELSE {_DELETED}
+    END{{clear}}
+    WHERE pk IN (SELECT pk FROM target)
+    AND (SELECT count(*) FROM target) = {{{{}}}}
+    RETURNING pk, status
+){{unlink}}
+SELECT pk, status FROM updated
+"""
 
 
 async def get_merchant(
@@ -25,23 +77,143 @@ async def get_merchant(
 ) -> Merchant:
     """
     Return a merchant by its primary key.
+    The merchant and its plan are checked with a single query.
     Raises NoSuchRecord if `pk` is not found.
     """
 
-    query = Merchant.objects(Merchant.plan).where(Merchant.pk == pk)
-    if validate_plan:
-        if plan_ref is None:
-            raise ValueError("validate_plan cannot be true if plan_ref is null")
+    if validate_plan and plan_ref is None:
+        raise ValueError("validate_plan cannot be true if plan_ref is null")
+
+    async def fetch() -> Merchant:
+        query = Merchant.objects(Merchant.plan).where(Merchant.pk == pk)
+        if validate_plan:
+            query = query.where(
+                Merchant.plan == plan_ref,
+                Merchant.plan.status != ResourceStatus.DELETED,
+            )
 
-        plan = await get_plan(plan_ref)
-        query = query.where(Merchant.plan == plan)
+        merchant = await query.first()
 
-    merchant = await query.first()
+        if not merchant:
+            # only go back to the database to find out which part of the path
+            # was wrong when the lookup fails.
+            if validate_plan and plan_ref is not None:
+                await get_plan(plan_ref)
+            raise NoSuchRecord(Merchant)
 
-    if not merchant:
-        raise NoSuchRecord(Merchant)
+        if validate_plan:
+            prime((Plan, plan_ref), merchant.plan)
 
-    return merchant
+        return merchant
+
+    return await load((Merchant, pk, plan_ref if validate_plan else None), fetch)
+
+
+def merchant_owns(
+    merchant: ForeignKey, *, merchant_ref: UUID, plan_ref: UUID
+) -> Combinable:
+    """
+    Returns a where clause that matches rows on the given merchant, as long as
+    the merchant is on the given plan and neither has been deleted.
+    This lets a query validate the URL path in the same round-trip as it loads
+    its results. If such a query finds nothing, call get_merchant to find out
+    whether the merchant or plan was the problem.
+    """
+    return (
+        (merchant == merchant_ref)
+        & (merchant.status != ResourceStatus.DELETED)
+        & (merchant.plan == plan_ref)
+        & (merchant.plan.status != ResourceStatus.DELETED)  # type: ignore
+    )
+
+
+async def update_owned(
+    table: Type[OwnedTable],
+    pks: set[UUID],
+    values: Mapping[Column, Any],
+    *,
+    plan_ref: UUID,
+    merchant_ref: UUID,
+) -> list[OwnedTable]:
+    """
+    Set the given values on a number of rows on a merchant in a single query,
+    and return the updated rows newest first.
+    Raises NoSuchRecord without updating anything if any of the rows are not
+    found.
+    """
+    if not pks:
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
+        return []
+
+    query = UPDATE_OWNED_QUERY.format(
+        table=table._meta.tablename,  # pylint: disable=protected-access
+        assignments=", ".join(
+            f"{column._meta.db_column_name} = {{}}"  # pylint: disable=protected-access
+            for column in values
+        ),
+    )
+    rows = await table.raw(
+        query, list(pks), merchant_ref, plan_ref, *values.values(), len(pks)
+    )
+
+    if len(rows) != len(pks):
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
+        raise NoSuchRecord(table)
+
+    return sorted(
+        (table(**row) for row in rows), key=lambda row: row.created, reverse=True
+    )
+
+
+async def delete_owned(
+    table: Type[BaseTable],
+    pks: set[UUID],
+    *,
+    plan_ref: UUID,
+    merchant_ref: UUID,
+    clear: Sequence[Column] = (),
+    unlink: Sequence[ForeignKey] = (),
+) -> tuple[set[UUID], set[UUID]]:
+    """
+    Delete a number of rows on a merchant in a single query. Rows that are
+    onboarded onto TXM are marked as pending deletion instead.
+    Rows that are deleted outright have the columns in `clear` set to null, and
+    any rows in other tables that refer to them through the foreign keys in
+    `unlink` are removed.
+    Returns the refs that are now pending deletion, and those that were deleted.
+    Raises NoSuchRecord without changing anything if any of the rows are not
+    found.
+    """
+    if not pks:
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
+        return set(), set()
+
+    # pylint: disable=protected-access
+    query = DELETE_OWNED_QUERY.format(
+        table=table._meta.tablename,
+        clear="".join(
+            f", {column._meta.db_column_name} = CASE "
+            f"WHEN txm_status = {_ONBOARDED} THEN {column._meta.db_column_name} "
+            "ELSE NULL END"
+            for column in clear
+        ),
+        unlink="".join(
+            f", unlink_{i} AS ("
+            f"DELETE FROM {fk._meta.table._meta.tablename} "
+            f"WHERE {fk._meta.db_column_name} IN "
+            f"(SELECT pk FROM updated WHERE status = {_DELETED}))"
+            for i, fk in enumerate(unlink)
+        ),
+    )
+    rows = await table.raw(query, list(pks), merchant_ref, plan_ref, len(pks))
+
+    if len(rows) != len(pks):
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
+        raise NoSuchRecord(table)
+
+    return {
+        row["pk"] for row in rows if row["status"] == ResourceStatus.PENDING_DELETION
+    }, {row["pk"] for row in rows if row["status"] == ResourceStatus.DELETED}
 
 
 async def list_merchants(plan_ref: UUID, *, n: int, p: int) -> list[Merchant]:
@@ -1,6 +1,6 @@
 """Database access layer for operating on payment schemes."""
 
-from bullsquid.db import NoSuchRecord
+from bullsquid.db import NoSuchRecord, load
 
 from .tables import PaymentScheme
 
@@ -12,7 +12,11 @@ async def list_payment_schemes() -> list[PaymentScheme]:
 
 async def get_payment_scheme(slug: str) -> PaymentScheme:
     """Get a payment scheme object by its slug."""
-    payment_scheme = await PaymentScheme.objects().get(PaymentScheme.slug == slug)
-    if not payment_scheme:
-        raise NoSuchRecord(PaymentScheme)
-    return payment_scheme
+
+    async def fetch() -> PaymentScheme:
+        payment_scheme = await PaymentScheme.objects().get(PaymentScheme.slug == slug)
+        if not payment_scheme:
+            raise NoSuchRecord(PaymentScheme)
+        return payment_scheme
+
+    return await load((PaymentScheme, slug), fetch)
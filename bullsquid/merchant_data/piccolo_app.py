@@ -24,9 +24,12 @@ APP_CONFIG = AppConfig(
             "bullsquid.merchant_data.secondary_mids.tables",
             "bullsquid.merchant_data.secondary_mid_location_links.tables",
             "bullsquid.merchant_data.comments.tables",
+            "bullsquid.merchant_data.tasks.tables",
+            "bullsquid.merchant_data.service.tables",
         ],
         exclude_imported=True,
     ),
-    migration_dependencies=[],
+    # the job queue migrations tune qbert's tables, so they must exist first.
+    migration_dependencies=["qbert.piccolo_app"],
     commands=[],
 )
@@ -0,0 +1,37 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-18T23:41:22:962741"
+VERSION = "0.121.0"
+DESCRIPTION = "add pull index and autovacuum settings to the job queue"
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="merchant_data", description=DESCRIPTION
+    )
+
+    async def tune_job_queue():
+        # the pull query looks for queued jobs in scheduled_for order. qbert
+        # passes the status as a parameter, so a partial index on queued jobs
+        # could only be used by custom plans, never by a cached generic plan.
+        # leading with status serves both. locking the candidates still reads
+        # each row from the table, so covering columns wouldn't help.
+        # blocks writes to qbert_job while it builds; see docs/indexes.md.
+        await Table.raw(
+            "CREATE INDEX IF NOT EXISTS qbert_job_pull "
+            "ON qbert_job (status, scheduled_for)"
+        )
+        # every job is inserted, updated, and deleted within a short time, so
+        # vacuum the table far more eagerly than the default 20% dead tuples.
+        await Table.raw(
+            "ALTER TABLE qbert_job SET ("
+            "autovacuum_vacuum_scale_factor = 0.01, "
+            "autovacuum_analyze_scale_factor = 0.02, "
+            "autovacuum_vacuum_cost_delay = 0"
+            ")"
+        )
+
+    manager.add_raw(tune_job_queue)
+
+    return manager
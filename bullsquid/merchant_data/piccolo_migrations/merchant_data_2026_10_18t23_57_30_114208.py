@@ -0,0 +1,28 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-18T23:57:30:114208"
+VERSION = "0.121.0"
+DESCRIPTION = "add index for live primary MIDs by merchant"
+
+# the list endpoints all filter on merchant, hide deleted rows, and sort by
+# newest first. a partial index on live rows matches that shape exactly, and
+# stays small as soft deleted rows build up.
+#
+# blocks writes to primary_mid while it builds; see docs/indexes.md.
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="merchant_data", description=DESCRIPTION
+    )
+
+    async def create_index():
+        await Table.raw(
+            "CREATE INDEX IF NOT EXISTS primary_mid_merchant_live "
+            "ON primary_mid (merchant, created DESC) WHERE status <> 'deleted'"
+        )
+
+    manager.add_raw(create_index)
+
+    return manager
@@ -0,0 +1,24 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-18T23:57:34:114208"
+VERSION = "0.121.0"
+DESCRIPTION = "add index for sub-location lists"
+
+# blocks writes to location while it builds; see docs/indexes.md.
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="merchant_data", description=DESCRIPTION
+    )
+
+    async def create_index():
+        await Table.raw(
+            "CREATE INDEX IF NOT EXISTS location_parent_live "
+            "ON location (parent, created DESC) WHERE status <> 'deleted'"
+        )
+
+    manager.add_raw(create_index)
+
+    return manager
@@ -0,0 +1,26 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-18T23:57:35:114208"
+VERSION = "0.121.0"
+DESCRIPTION = "add index for location ID lookups"
+
+# location ID uniqueness checks (per plan, via merchant) and imports.
+#
+# blocks writes to location while it builds; see docs/indexes.md.
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="merchant_data", description=DESCRIPTION
+    )
+
+    async def create_index():
+        await Table.raw(
+            "CREATE INDEX IF NOT EXISTS location_location_id "
+            "ON location (location_id, merchant)"
+        )
+
+    manager.add_raw(create_index)
+
+    return manager
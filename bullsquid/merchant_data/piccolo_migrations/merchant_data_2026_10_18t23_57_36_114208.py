@@ -0,0 +1,26 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-18T23:57:36:114208"
+VERSION = "0.121.0"
+DESCRIPTION = "add index for primary MID duplicate checks"
+
+# duplicate MID checks look up MIDs by payment scheme.
+#
+# blocks writes to primary_mid while it builds; see docs/indexes.md.
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="merchant_data", description=DESCRIPTION
+    )
+
+    async def create_index():
+        await Table.raw(
+            "CREATE INDEX IF NOT EXISTS primary_mid_payment_scheme_mid "
+            "ON primary_mid (payment_scheme, mid)"
+        )
+
+    manager.add_raw(create_index)
+
+    return manager
@@ -0,0 +1,24 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-18T23:57:37:114208"
+VERSION = "0.121.0"
+DESCRIPTION = "add index for secondary MID duplicate checks"
+
+# blocks writes to secondary_mid while it builds; see docs/indexes.md.
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="merchant_data", description=DESCRIPTION
+    )
+
+    async def create_index():
+        await Table.raw(
+            "CREATE INDEX IF NOT EXISTS secondary_mid_secondary_mid "
+            "ON secondary_mid (secondary_mid)"
+        )
+
+    manager.add_raw(create_index)
+
+    return manager
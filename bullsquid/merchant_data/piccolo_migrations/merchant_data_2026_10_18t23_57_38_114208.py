@@ -0,0 +1,26 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-18T23:57:38:114208"
+VERSION = "0.121.0"
+DESCRIPTION = "add index for comments by owner"
+
+# top-level comments by owner, listed newest first.
+#
+# blocks writes to comment while it builds; see docs/indexes.md.
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="merchant_data", description=DESCRIPTION
+    )
+
+    async def create_index():
+        await Table.raw(
+            "CREATE INDEX IF NOT EXISTS comment_owner "
+            "ON comment (owner, created_at DESC) WHERE parent IS NULL"
+        )
+
+    manager.add_raw(create_index)
+
+    return manager
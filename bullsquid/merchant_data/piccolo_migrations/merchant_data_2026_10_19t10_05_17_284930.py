@@ -0,0 +1,29 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-19T10:05:17:284930"
+VERSION = "0.121.0"
+DESCRIPTION = "add index for available primary mid search"
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="merchant_data", description=DESCRIPTION
+    )
+
+    async def create_index():
+        # the "C" collation lets the index serve both prefix matches (LIKE 'abc%')
+        # and the MID ordering of the available MIDs list, whatever the database
+        # collation is.
+        # the app sends the status as a parameter, so only custom plans can use
+        # this partial index. `query-plans.py --generic` shows the generic plan.
+        # blocks writes to primary_mid while it builds; see docs/indexes.md.
+        await Table.raw(
+            "CREATE INDEX IF NOT EXISTS primary_mid_available "
+            'ON primary_mid (merchant, mid COLLATE "C") '
+            "WHERE status <> 'deleted'"
+        )
+
+    manager.add_raw(create_index)
+
+    return manager
@@ -0,0 +1,28 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-19T10:41:52:617304"
+VERSION = "0.121.0"
+DESCRIPTION = "add index for location link counts"
+
+# MIDs linked to a location, counted and listed per location. Secondary MID
+# links are already covered by unique_location_secondary_mid, which leads with
+# the location column.
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS primary_mid_location ON primary_mid (location) "
+    "WHERE status <> 'deleted'",
+]
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="merchant_data", description=DESCRIPTION
+    )
+
+    async def create_indexes():
+        for index in INDEXES:
+            await Table.raw(index)
+
+    manager.add_raw(create_indexes)
+
+    return manager
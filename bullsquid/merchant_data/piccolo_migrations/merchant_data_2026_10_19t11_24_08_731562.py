@@ -0,0 +1,28 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-19T11:24:08:731562"
+VERSION = "0.121.0"
+DESCRIPTION = "add trigram index for merchant.name search"
+
+# the search endpoint matches each searched column with ILIKE '%term%',
+# which trigram indexes can serve. each column has a migration of its own.
+#
+# blocks writes to merchant while it builds; see docs/indexes.md.
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="merchant_data", description=DESCRIPTION
+    )
+
+    async def create_index():
+        await Table.raw("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        await Table.raw(
+            "CREATE INDEX IF NOT EXISTS merchant_name_trgm "
+            "ON merchant USING gin (name gin_trgm_ops)"
+        )
+
+    manager.add_raw(create_index)
+
+    return manager
@@ -0,0 +1,24 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-19T11:24:09:731562"
+VERSION = "0.121.0"
+DESCRIPTION = "add trigram index for location.name search"
+
+# blocks writes to location while it builds; see docs/indexes.md.
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="merchant_data", description=DESCRIPTION
+    )
+
+    async def create_index():
+        await Table.raw(
+            "CREATE INDEX IF NOT EXISTS location_name_trgm "
+            "ON location USING gin (name gin_trgm_ops)"
+        )
+
+    manager.add_raw(create_index)
+
+    return manager
@@ -0,0 +1,24 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-19T11:24:10:731562"
+VERSION = "0.121.0"
+DESCRIPTION = "add trigram index for location.address_line_1 search"
+
+# blocks writes to location while it builds; see docs/indexes.md.
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="merchant_data", description=DESCRIPTION
+    )
+
+    async def create_index():
+        await Table.raw(
+            "CREATE INDEX IF NOT EXISTS location_address_line_1_trgm "
+            "ON location USING gin (address_line_1 gin_trgm_ops)"
+        )
+
+    manager.add_raw(create_index)
+
+    return manager
@@ -0,0 +1,24 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-19T11:24:13:731562"
+VERSION = "0.121.0"
+DESCRIPTION = "add trigram index for primary_mid.mid search"
+
+# blocks writes to primary_mid while it builds; see docs/indexes.md.
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="merchant_data", description=DESCRIPTION
+    )
+
+    async def create_index():
+        await Table.raw(
+            "CREATE INDEX IF NOT EXISTS primary_mid_mid_trgm "
+            "ON primary_mid USING gin (mid gin_trgm_ops)"
+        )
+
+    manager.add_raw(create_index)
+
+    return manager
@@ -0,0 +1,24 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-19T11:24:15:731562"
+VERSION = "0.121.0"
+DESCRIPTION = "add trigram index for psimi.value search"
+
+# blocks writes to psimi while it builds; see docs/indexes.md.
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="merchant_data", description=DESCRIPTION
+    )
+
+    async def create_index():
+        await Table.raw(
+            "CREATE INDEX IF NOT EXISTS psimi_value_trgm "
+            "ON psimi USING gin (value gin_trgm_ops)"
+        )
+
+    manager.add_raw(create_index)
+
+    return manager
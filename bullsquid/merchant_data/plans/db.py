@@ -5,7 +5,7 @@ from uuid import UUID
 
 from piccolo.columns import Column
 
-from bullsquid.db import NoSuchRecord, paginate
+from bullsquid.db import NoSuchRecord, load, paginate
 from bullsquid.merchant_data.enums import ResourceStatus, TXMStatus
 from bullsquid.merchant_data.locations.tables import Location
 from bullsquid.merchant_data.merchants.tables import Merchant
@@ -20,10 +20,14 @@ from bullsquid.merchant_data.secondary_mids.tables import SecondaryMID
 
 async def get_plan(pk: UUID) -> Plan:
     """Return a plan by its primary key. Raises NoSuchRecord if `pk` is not found."""
-    plan = await Plan.objects().where(Plan.pk == pk).first()
-    if not plan:
-        raise NoSuchRecord(Plan)
-    return plan
+
+    async def fetch() -> Plan:
+        plan = await Plan.objects().where(Plan.pk == pk).first()
+        if not plan:
+            raise NoSuchRecord(Plan)
+        return plan
+
+    return await load((Plan, pk), fetch)
 
 
 async def list_plans(*, n: int, p: int) -> list[Plan]:
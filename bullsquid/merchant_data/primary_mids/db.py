@@ -1,17 +1,15 @@
 """Database access layer for primary MID operations."""
 
-from typing import Any
 from uuid import UUID
 
-from piccolo.columns import Column
-
 from bullsquid.db import InvalidData, NoSuchRecord, paginate
-from bullsquid.merchant_data.enums import (
-    PaymentEnrolmentStatus,
-    ResourceStatus,
-    TXMStatus,
+from bullsquid.merchant_data.enums import PaymentEnrolmentStatus
+from bullsquid.merchant_data.merchants.db import (
+    delete_owned,
+    get_merchant,
+    merchant_owns,
+    update_owned,
 )
-from bullsquid.merchant_data.merchants.db import get_merchant
 from bullsquid.merchant_data.payment_schemes.db import get_payment_scheme
 from bullsquid.merchant_data.payment_schemes.tables import PaymentScheme
 from bullsquid.merchant_data.primary_mids.models import (
@@ -79,13 +77,15 @@ async def get_primary_mid_instance(
     merchant_ref: UUID,
 ) -> PrimaryMID:
     """Get a primary MID instance by primary key."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
-
     mid = await PrimaryMID.objects(PrimaryMID.payment_scheme, PrimaryMID.location).get(
-        (PrimaryMID.pk == pk) & (PrimaryMID.merchant == merchant)
+        (PrimaryMID.pk == pk)
+        & merchant_owns(
+            PrimaryMID.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref
+        )
     )
 
     if not mid:
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
         raise NoSuchRecord(PrimaryMID)
 
     return mid
@@ -112,13 +112,15 @@ async def get_primary_mids(
     merchant_ref: UUID,
 ) -> list[PrimaryMIDOverviewResponse]:
     """Get a number of primary MIDs by their primary keys."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
     mids = await PrimaryMID.objects(PrimaryMID.payment_scheme).where(
         PrimaryMID.pk.is_in(list(pks)),
-        PrimaryMID.merchant == merchant,
+        merchant_owns(
+            PrimaryMID.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref
+        ),
     )
 
     if len(mids) != len(pks):
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
         raise NoSuchRecord(PrimaryMID)
 
     return [overview_response(mid) for mid in mids]
@@ -128,47 +130,37 @@ async def list_primary_mids(
     *, plan_ref: UUID, merchant_ref: UUID, n: int, p: int
 ) -> list[PrimaryMIDOverviewResponse]:
     """Return a list of all primary MIDs on the given merchant."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
-
     results = await paginate(
         PrimaryMID.objects(PrimaryMID.payment_scheme).where(
-            PrimaryMID.merchant == merchant,
+            merchant_owns(
+                PrimaryMID.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref
+            ),
         ),
         n=n,
         p=p,
     )
+    if not results:
+        # an empty page could also mean a bad merchant or plan ref.
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
 
     return [overview_response(result) for result in results]
 
 
-async def filter_onboarded_mid_refs(
+async def delete_primary_mids(
     mid_refs: set[UUID], *, plan_ref: UUID, merchant_ref: UUID
 ) -> tuple[set[UUID], set[UUID]]:
     """
-    Split the given list of primary MID refs into onboarded and not.
+    Delete the given primary MIDs, or mark them as pending deletion if they are
+    onboarded. Deleted MIDs are unlinked from their location.
+    Returns the refs that are now pending deletion, and those that were deleted.
     """
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
-    q_mid_refs = list(mid_refs)
-
-    count = await PrimaryMID.count().where(PrimaryMID.pk.is_in(q_mid_refs))
-    if count != len(mid_refs):
-        raise NoSuchRecord(PrimaryMID)
-
-    return {
-        result["pk"]
-        for result in await PrimaryMID.select(PrimaryMID.pk).where(
-            PrimaryMID.pk.is_in(q_mid_refs),
-            PrimaryMID.merchant == merchant,
-            PrimaryMID.txm_status == TXMStatus.ONBOARDED,
-        )
-    }, {
-        result["pk"]
-        for result in await PrimaryMID.select(PrimaryMID.pk).where(
-            PrimaryMID.pk.is_in(q_mid_refs),
-            PrimaryMID.merchant == merchant,
-            PrimaryMID.txm_status != TXMStatus.ONBOARDED,
-        )
-    }
+    return await delete_owned(
+        PrimaryMID,
+        mid_refs,
+        plan_ref=plan_ref,
+        merchant_ref=merchant_ref,
+        clear=[PrimaryMID.location],
+    )
 
 
 async def create_primary_mid(
@@ -215,25 +207,6 @@ async def update_primary_mid(
     return overview_response(mid)
 
 
-async def update_primary_mids_status(
-    mid_refs: set[UUID],
-    *,
-    status: ResourceStatus,
-    plan_ref: UUID,
-    merchant_ref: UUID,
-) -> None:
-    """Updates the status for a list of primary MIDs on a merchant."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
-    values: dict[Column | str, Any] = {PrimaryMID.status: status}
-
-    if status == ResourceStatus.DELETED:
-        values[PrimaryMID.location] = None
-
-    await PrimaryMID.update(values).where(
-        PrimaryMID.pk.is_in(list(mid_refs)), PrimaryMID.merchant == merchant
-    )
-
-
 async def bulk_update_primary_mids(
     mid_refs: set[UUID],
     status: PaymentEnrolmentStatus,
@@ -241,13 +214,15 @@ async def bulk_update_primary_mids(
     plan_ref: UUID,
     merchant_ref: UUID,
 ) -> list[PrimaryMIDOverviewResponse]:
-    """Update a primary MID's editable fields."""
-    await get_primary_mids(mid_refs, plan_ref=plan_ref, merchant_ref=merchant_ref)
-
-    await PrimaryMID.update({PrimaryMID.payment_enrolment_status: status}).where(
-        PrimaryMID.pk.is_in(list(mid_refs))
-    )
-    mids = await get_primary_mids(
-        mid_refs, plan_ref=plan_ref, merchant_ref=merchant_ref
+    """Update the payment enrolment status of a number of primary MIDs."""
+    mids = await update_owned(
+        PrimaryMID,
+        mid_refs,
+        {PrimaryMID.payment_enrolment_status: status},
+        plan_ref=plan_ref,
+        merchant_ref=merchant_ref,
     )
-    return mids
+    for mid in mids:
+        # payment schemes are keyed by slug, so there is nothing more to load.
+        mid.payment_scheme = PaymentScheme(slug=mid.payment_scheme)
+    return [overview_response(mid) for mid in mids]
@@ -105,7 +105,9 @@ async def create_primary_mid(
         ) from ex
 
     if mid_data.onboard:
-        await tasks.queue.push(tasks.OnboardPrimaryMIDs(mid_refs=[mid.mid_ref]))
+        await tasks.queue.push(
+            tasks.OnboardPrimaryMIDs(merchant_ref=merchant_ref, mid_refs=[mid.mid_ref])
+        )
 
     return mid
 
@@ -183,7 +185,9 @@ async def onboard_primary_mids(
         ) from ex
 
     await tasks.queue.push(
-        tasks.OnboardPrimaryMIDs(mid_refs=[mid.mid_ref for mid in mids])
+        tasks.OnboardPrimaryMIDs(
+            merchant_ref=merchant_ref, mid_refs=[mid.mid_ref for mid in mids]
+        )
     )
 
     return mids
@@ -212,7 +216,9 @@ async def offboard_primary_mids(
         ) from ex
 
     await tasks.queue.push(
-        tasks.OffboardPrimaryMIDs(mid_refs=[mid.mid_ref for mid in mids])
+        tasks.OffboardPrimaryMIDs(
+            merchant_ref=merchant_ref, mid_refs=[mid.mid_ref for mid in mids]
+        )
     )
 
     return mids
@@ -237,7 +243,7 @@ async def delete_primary_mids(
         return []
 
     try:
-        onboarded, not_onboarded = await db.filter_onboarded_mid_refs(
+        onboarded, not_onboarded = await db.delete_primary_mids(
             set(deletion.mid_refs), plan_ref=plan_ref, merchant_ref=merchant_ref
         )
     except NoSuchRecord as ex:
@@ -248,20 +254,10 @@ async def delete_primary_mids(
         ) from ex
 
     if onboarded:
-        await db.update_primary_mids_status(
-            onboarded,
-            status=ResourceStatus.PENDING_DELETION,
-            plan_ref=plan_ref,
-            merchant_ref=merchant_ref,
-        )
-        await tasks.queue.push(tasks.OffboardAndDeletePrimaryMIDs(mid_refs=onboarded))
-
-    if not_onboarded:
-        await db.update_primary_mids_status(
-            not_onboarded,
-            status=ResourceStatus.DELETED,
-            plan_ref=plan_ref,
-            merchant_ref=merchant_ref,
+        await tasks.queue.push(
+            tasks.OffboardAndDeletePrimaryMIDs(
+                merchant_ref=merchant_ref, mid_refs=onboarded
+            )
         )
 
     return [
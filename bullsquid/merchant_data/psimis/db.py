@@ -3,8 +3,11 @@
 from uuid import UUID
 
 from bullsquid.db import NoSuchRecord, paginate
-from bullsquid.merchant_data.enums import ResourceStatus, TXMStatus
-from bullsquid.merchant_data.merchants.db import get_merchant
+from bullsquid.merchant_data.merchants.db import (
+    delete_owned,
+    get_merchant,
+    merchant_owns,
+)
 from bullsquid.merchant_data.payment_schemes.db import get_payment_scheme
 from bullsquid.merchant_data.psimis.models import PSIMIMetadata, PSIMIResponse
 from bullsquid.merchant_data.psimis.tables import PSIMI
@@ -28,33 +31,33 @@ async def list_psimis(
     *, plan_ref: UUID, merchant_ref: UUID, n: int, p: int
 ) -> list[PSIMIResponse]:
     """Return a list of all PSIMIs on the given merchant."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
-
     results = await paginate(
         PSIMI.objects(PSIMI.payment_scheme).where(
-            PSIMI.merchant == merchant,
+            merchant_owns(PSIMI.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref),
         ),
         n=n,
         p=p,
     )
+    if not results:
+        # an empty page could also mean a bad merchant or plan ref.
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
 
     return [make_response(result) for result in results]
 
 
 async def get_psimi(pk: UUID, *, plan_ref: UUID, merchant_ref: UUID) -> PSIMIResponse:
     """Returns a single PSIMI by its PK."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
-
     psimi = (
         await PSIMI.objects(PSIMI.payment_scheme)
         .where(
             PSIMI.pk == pk,
-            PSIMI.merchant == merchant,
+            merchant_owns(PSIMI.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref),
         )
         .first()
     )
 
     if not psimi:
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
         raise NoSuchRecord(PSIMI)
 
     return make_response(psimi)
@@ -67,46 +70,29 @@ async def get_psimis(
     merchant_ref: UUID,
 ) -> list[PSIMIResponse]:
     """Get a number of PSIMIS by their primary keys."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
     psimis = await PSIMI.objects(PSIMI.payment_scheme).where(
         PSIMI.pk.is_in(list(pks)),
-        PSIMI.merchant == merchant,
+        merchant_owns(PSIMI.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref),
     )
 
     if len(psimis) != len(pks):
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
         raise NoSuchRecord(PSIMI)
 
     return [make_response(psimi) for psimi in psimis]
 
 
-async def filter_onboarded_psimis(
+async def delete_psimis(
     psimi_refs: set[UUID], *, plan_ref: UUID, merchant_ref: UUID
 ) -> tuple[set[UUID], set[UUID]]:
     """
-    Split the given list of PSIMI refs into onboarded and not onboarded/offboarded.
+    Delete the given PSIMIs, or mark them as pending deletion if they are
+    onboarded.
+    Returns the refs that are now pending deletion, and those that were deleted.
     """
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
-    q_psimi_refs = list(psimi_refs)
-
-    count = await PSIMI.count().where(PSIMI.pk.is_in(q_psimi_refs))
-    if count != len(psimi_refs):
-        raise NoSuchRecord(PSIMI)
-
-    return {
-        result["pk"]
-        for result in await PSIMI.select(PSIMI.pk).where(
-            PSIMI.pk.is_in(q_psimi_refs),
-            PSIMI.merchant == merchant,
-            PSIMI.txm_status == TXMStatus.ONBOARDED,
-        )
-    }, {
-        result["pk"]
-        for result in await PSIMI.select(PSIMI.pk).where(
-            PSIMI.pk.is_in(q_psimi_refs),
-            PSIMI.merchant == merchant,
-            PSIMI.txm_status != TXMStatus.ONBOARDED,
-        )
-    }
+    return await delete_owned(
+        PSIMI, psimi_refs, plan_ref=plan_ref, merchant_ref=merchant_ref
+    )
 
 
 async def create_psimi(
@@ -127,17 +113,3 @@ async def create_psimi(
     await psimi.save()
 
     return make_response(psimi)
-
-
-async def update_psimi_status(
-    psimi_refs: set[UUID],
-    *,
-    status: ResourceStatus,
-    plan_ref: UUID,
-    merchant_ref: UUID,
-) -> None:
-    """Updates the status for a list of PSIMIs on a merchant."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
-    await PSIMI.update({PSIMI.status: status}).where(
-        PSIMI.pk.is_in(list(psimi_refs)), PSIMI.merchant == merchant
-    )
@@ -91,7 +91,9 @@ async def create_psimi(
         raise ResourceNotFoundError.from_no_such_record(ex, loc=loc) from ex
 
     if psimi_data.onboard:
-        await tasks.queue.push(tasks.OnboardPSIMIs(psimi_refs=[psimi.psimi_ref]))
+        await tasks.queue.push(
+            tasks.OnboardPSIMIs(merchant_ref=merchant_ref, psimi_refs=[psimi.psimi_ref])
+        )
 
     return psimi
 
@@ -121,7 +123,9 @@ async def onboard_psimis(
         ) from ex
 
     await tasks.queue.push(
-        tasks.OnboardPSIMIs(psimi_refs=[psimi.psimi_ref for psimi in psimis])
+        tasks.OnboardPSIMIs(
+            merchant_ref=merchant_ref, psimi_refs=[psimi.psimi_ref for psimi in psimis]
+        )
     )
 
     return psimis
@@ -152,7 +156,9 @@ async def offboard_psimis(
         ) from ex
 
     await tasks.queue.push(
-        tasks.OffboardPSIMIs(psimi_refs=[psimi.psimi_ref for psimi in psimis])
+        tasks.OffboardPSIMIs(
+            merchant_ref=merchant_ref, psimi_refs=[psimi.psimi_ref for psimi in psimis]
+        )
     )
 
     return psimis
@@ -176,7 +182,7 @@ async def delete_psimis(
         return []
 
     try:
-        onboarded, not_onboarded = await db.filter_onboarded_psimis(
+        onboarded, not_onboarded = await db.delete_psimis(
             set(deletion.psimi_refs), plan_ref=plan_ref, merchant_ref=merchant_ref
         )
     except NoSuchRecord as ex:
@@ -185,21 +191,10 @@ async def delete_psimis(
         raise ResourceNotFoundError.from_no_such_record(ex, loc=loc, plural=plural)
 
     if onboarded:
-        await db.update_psimi_status(
-            onboarded,
-            status=ResourceStatus.PENDING_DELETION,
-            plan_ref=plan_ref,
-            merchant_ref=merchant_ref,
-        )
-
-        await tasks.queue.push(tasks.OffboardAndDeletePSIMIs(psimi_refs=onboarded))
-
-    if not_onboarded:
-        await db.update_psimi_status(
-            not_onboarded,
-            status=ResourceStatus.DELETED,
-            plan_ref=plan_ref,
-            merchant_ref=merchant_ref,
+        await tasks.queue.push(
+            tasks.OffboardAndDeletePSIMIs(
+                merchant_ref=merchant_ref, psimi_refs=onboarded
+            )
         )
 
     return [
@@ -4,11 +4,13 @@ from fastapi import APIRouter
 
 from bullsquid.merchant_data.comments.views import router as comments_router
 from bullsquid.merchant_data.csv_upload.views import router as csv_upload_router
+from bullsquid.merchant_data.exports.views import router as exports_router
 from bullsquid.merchant_data.locations.views import router as locations_router
 from bullsquid.merchant_data.merchants.views import router as merchants_router
 from bullsquid.merchant_data.plans.views import router as plans_router
 from bullsquid.merchant_data.primary_mids.views import router as primary_mids_router
 from bullsquid.merchant_data.psimis.views import router as psimis_router
+from bullsquid.merchant_data.search.views import router as search_router
 from bullsquid.merchant_data.secondary_mid_location_links.views import (
     router as secondary_mid_location_links_router,
 )
@@ -26,3 +28,5 @@ router.include_router(locations_router)
 router.include_router(sub_locations_router)
 router.include_router(secondary_mid_location_links_router)
 router.include_router(csv_upload_router)
+router.include_router(search_router)
+router.include_router(exports_router)
@@ -0,0 +1,129 @@
+"""Database access layer for searching a plan's merchants, locations, and MIDs."""
+
+import re
+from uuid import UUID
+
+from bullsquid.db import escape_like, page_bounds
+from bullsquid.merchant_data.enums import ResourceStatus, ResourceType
+from bullsquid.merchant_data.plans.db import get_plan
+from bullsquid.merchant_data.plans.tables import Plan
+from bullsquid.merchant_data.search.models import SearchResult
+
+_DELETED = f"'{ResourceStatus.DELETED.value}'"
+
+
+def _rank(column: str) -> str:
+    """
+    Ranks an exact match on the column first, then a prefix match, then a match
+    anywhere in the value. Columns that don't match rank as null.
+    """
+    return (
+        f"CASE WHEN lower({column}) = lower(:term::text) THEN 0 "
+        f"WHEN {column} ILIKE :prefix::text THEN 1 "
+        f"WHEN {column} ILIKE :pattern::text THEN 2 END"
+    )
+
+
+def _matches(*columns: str) -> str:
+    return (
+        "(" + " OR ".join(f"{column} ILIKE :pattern::text" for column in columns) + ")"
+    )
+
+
+_LOCATION_COLUMNS = [
+    "location.name",
+    "location.address_line_1",
+    "location.postcode",
+    "location.location_id",
+]
+
+
+def _owned_mids(table: str, column: str, resource_type: ResourceType) -> str:
+    return f"""
+    SELECT '{resource_type.value}', {table}.pk, {table}.merchant, NULL::uuid,
+        {table}.{column}, {_rank(f"{table}.{column}")}
+    FROM merchant
+    JOIN {table} ON {table}.merchant = merchant.pk
+    WHERE merchant.plan = :plan AND merchant.status <> {_DELETED}
+    AND {table}.status <> {_DELETED}
+    AND {table}.{column} ILIKE :pattern::text"""
+
+
+# Finds everything on the plan that matches the search term, best matches first.
+# The patterns are bound directly in each branch, so the planner can estimate
+# them and use the pg_trgm GIN index on each searched column.
+_SEARCH_SQL = f"""
+WITH matches (resource_type, resource_ref, merchant_ref, parent_ref, title, rank) AS (
+    SELECT '{ResourceType.MERCHANT.value}', merchant.pk, merchant.pk, NULL::uuid,
+        merchant.name, {_rank("merchant.name")}
+    FROM merchant
+    WHERE merchant.plan = :plan AND merchant.status <> {_DELETED}
+    AND merchant.name ILIKE :pattern::text
+    UNION ALL
+    SELECT '{ResourceType.LOCATION.value}', location.pk, location.merchant,
+        location.parent, location.name,
+        LEAST({", ".join(_rank(column) for column in _LOCATION_COLUMNS)})
+    FROM merchant
+    JOIN location ON location.merchant = merchant.pk
+    WHERE merchant.plan = :plan AND merchant.status <> {_DELETED}
+    AND location.status <> {_DELETED}
+    AND {_matches(*_LOCATION_COLUMNS)}
+    UNION ALL{_owned_mids("primary_mid", "mid", ResourceType.PRIMARY_MID)}
+    UNION ALL{_owned_mids("secondary_mid", "secondary_mid", ResourceType.SECONDARY_MID)}
+    UNION ALL{_owned_mids("psimi", "value", ResourceType.PSIMI)}
+)
+SELECT resource_type, resource_ref, merchant_ref, parent_ref, title
+FROM matches
+WHERE EXISTS (
+    SELECT FROM plan WHERE plan.pk = :plan AND plan.status <> {_DELETED}
+)
+ORDER BY rank, title, resource_ref
+LIMIT :limit OFFSET :offset
+"""
+
+# raw queries only take positional parameters, so each :name becomes a {}
+# placeholder, and SEARCH_PARAMS lists which value goes in each one.
+_PARAM = re.compile(r"(?<!:):(term|prefix|pattern|plan|limit|offset)\b")
+SEARCH_PARAMS = _PARAM.findall(_SEARCH_SQL)
+SEARCH_QUERY = _PARAM.sub("{}", _SEARCH_SQL)
+
+
+def search_params(
+    term: str, *, plan_ref: UUID, limit: int, offset: int
+) -> list[object]:
+    """Returns the parameters for SEARCH_QUERY, in order."""
+    escaped = escape_like(term)
+    values: dict[str, object] = {
+        "term": term,
+        "prefix": f"{escaped}%",
+        "pattern": f"%{escaped}%",
+        "plan": plan_ref,
+        "limit": limit,
+        "offset": offset,
+    }
+    return [values[name] for name in SEARCH_PARAMS]
+
+
+async def search(
+    term: str,
+    *,
+    plan_ref: UUID,
+    n: int,
+    p: int,
+) -> list[SearchResult]:
+    """
+    Return a page of the merchants, locations, and MIDs on the given plan that
+    match the search term, best matches first.
+    Locations match on their name, first address line, postcode, or location ID.
+    """
+    limit, offset = page_bounds(n=n, p=p)
+    rows = await Plan.raw(
+        SEARCH_QUERY,
+        *search_params(term, plan_ref=plan_ref, limit=limit, offset=offset),
+    )
+
+    if not rows:
+        # an empty page could also mean a bad plan ref.
+        await get_plan(plan_ref)
+
+    return [SearchResult(**row) for row in rows]
@@ -0,0 +1,16 @@
+"""Response model definitions for the search endpoint."""
+
+from pydantic import UUID4
+
+from bullsquid.merchant_data.enums import ResourceType
+from bullsquid.merchant_data.models import BaseModel
+
+
+class SearchResult(BaseModel):
+    """A merchant, location, or MID matching a search."""
+
+    resource_type: ResourceType
+    resource_ref: UUID4
+    merchant_ref: UUID4
+    parent_ref: UUID4 | None  # only set for sub-locations
+    title: str
@@ -0,0 +1,37 @@
+"""Endpoints for searching the merchant data on a plan."""
+
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Query
+
+from bullsquid.api.auth import JWTCredentials
+from bullsquid.api.errors import ResourceNotFoundError
+from bullsquid.db import NoSuchRecord
+from bullsquid.merchant_data.auth import AccessLevel, require_access_level
+from bullsquid.merchant_data.search import db
+from bullsquid.merchant_data.search.models import SearchResult
+from bullsquid.settings import settings
+
+router = APIRouter(prefix="/plans/{plan_ref}/search")
+
+# trigram indexes can't narrow down searches for anything shorter.
+MIN_SEARCH_LENGTH = 3
+
+
+@router.get("", response_model=list[SearchResult])
+async def search(
+    plan_ref: UUID,
+    q: str = Query(min_length=MIN_SEARCH_LENGTH),
+    n: int = Query(default=settings.default_page_size),
+    p: int = Query(default=1),
+    _credentials: JWTCredentials = Depends(require_access_level(AccessLevel.READ_ONLY)),
+) -> list[SearchResult]:
+    """
+    Search the plan's merchants, locations, primary MIDs, secondary MIDs, and
+    PSIMIs. Exact matches come first, then values starting with the search
+    term, then values containing it.
+    """
+    try:
+        return await db.search(q, plan_ref=plan_ref, n=n, p=p)
+    except NoSuchRecord as ex:
+        raise ResourceNotFoundError.from_no_such_record(ex, loc=["path"]) from ex
@@ -52,59 +52,65 @@ async def create_secondary_mid_location_links(
     Returns the created links and a boolean indicating if any links are new.
     """
     merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
+    if not refs:
+        return [], False
 
     secondary_mid_refs = list({r[0] for r in refs})
-    secondary_mids = await SecondaryMID.objects().where(
+    secondary_mid_count = await SecondaryMID.count().where(
         SecondaryMID.pk.is_in(secondary_mid_refs),
         SecondaryMID.merchant == merchant,
     )
 
-    if len(secondary_mid_refs) != len(secondary_mids):
+    if len(secondary_mid_refs) != secondary_mid_count:
         raise NoSuchRecord(SecondaryMID)
 
     location_refs = list({r[1] for r in refs})
-    locations = await Location.objects().where(
+    location_count = await Location.count().where(
         Location.pk.is_in(location_refs),
         Location.merchant == merchant,
         Location.parent.is_null(),
     )
 
-    if len(location_refs) != len(locations):
+    if len(location_refs) != location_count:
         raise NoSuchRecord(Location)
 
-    secondary_mids_by_pk = {
-        secondary_mid.pk: secondary_mid for secondary_mid in secondary_mids
-    }
-    locations_by_pk = {location.pk: location for location in locations}
+    # the unique constraint on the pair makes this idempotent. only the links
+    # that were actually inserted are returned.
+    pairs = set(refs)
+    inserted = (
+        await SecondaryMIDLocationLink.insert(
+            *(
+                SecondaryMIDLocationLink(
+                    secondary_mid=secondary_mid_ref, location=location_ref
+                )
+                for secondary_mid_ref, location_ref in pairs
+            )
+        )
+        .on_conflict(
+            target=(
+                SecondaryMIDLocationLink.secondary_mid,
+                SecondaryMIDLocationLink.location,
+            ),
+            action="DO NOTHING",
+        )
+        .returning(SecondaryMIDLocationLink.pk)
+    )
 
-    links = [
-        await SecondaryMIDLocationLink.objects(
+    # load new and existing links together with their secondary MIDs and
+    # locations for the response.
+    links_by_pair = {
+        (link.secondary_mid.pk, link.location.pk): link
+        for link in await SecondaryMIDLocationLink.objects(
             SecondaryMIDLocationLink.secondary_mid,
             SecondaryMIDLocationLink.location,
-        ).get_or_create(
-            (
-                SecondaryMIDLocationLink.secondary_mid
-                == secondary_mids_by_pk[secondary_mid_ref]
-            )
-            & (SecondaryMIDLocationLink.location == locations_by_pk[location_ref])
+        ).where(
+            SecondaryMIDLocationLink.secondary_mid.is_in(secondary_mid_refs),
+            SecondaryMIDLocationLink.location.is_in(location_refs),
         )
-        for secondary_mid_ref, location_ref in refs
-    ]
-
-    # TEMP: patch to work around https://github.com/piccolo-orm/piccolo/issues/597
-    for link in links:
-        if link._was_created:  # pylint: disable=protected-access
-            link.location = await link.get_related(SecondaryMIDLocationLink.location)
-            link.secondary_mid = await link.get_related(
-                SecondaryMIDLocationLink.secondary_mid
-            )
-
-    created = any(
-        link._was_created
-        for link in links  # pylint: disable=protected-access
-    )
+    }
+    links = [links_by_pair[pair] for pair in refs]
 
-    return links, created
+    return links, bool(inserted)
 
 
 async def delete_secondary_mid_location_link(
@@ -10,7 +10,13 @@ from bullsquid.merchant_data.secondary_mids.tables import SecondaryMID
 
 
 class SecondaryMIDLocationLink(Table):
-    """Represents an association between a secondary MID and a location."""
+    """
+    Represents an association between a secondary MID and a location.
+    Each pair can only be linked once. The unique_location_secondary_mid index
+    on (location, secondary_mid) was added by a migration, as piccolo cannot
+    declare indexes across columns. It was created when the table was still
+    called location_secondary_mid_link.
+    """
 
     pk = UUID(primary_key=True)
     secondary_mid = ForeignKey(SecondaryMID)
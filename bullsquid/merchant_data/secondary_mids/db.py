@@ -2,15 +2,20 @@
 
 from uuid import UUID
 
+from piccolo.columns.combination import WhereRaw
+
 from bullsquid.db import NoSuchRecord
-from bullsquid.merchant_data.enums import (
-    PaymentEnrolmentStatus,
-    ResourceStatus,
-    TXMStatus,
-)
+from bullsquid.merchant_data.enums import PaymentEnrolmentStatus
 from bullsquid.merchant_data.locations.tables import Location
-from bullsquid.merchant_data.merchants.db import get_merchant, paginate
+from bullsquid.merchant_data.merchants.db import (
+    delete_owned,
+    get_merchant,
+    merchant_owns,
+    paginate,
+    update_owned,
+)
 from bullsquid.merchant_data.payment_schemes.db import get_payment_scheme
+from bullsquid.merchant_data.payment_schemes.tables import PaymentScheme
 from bullsquid.merchant_data.secondary_mid_location_links.tables import (
     SecondaryMIDLocationLink,
 )
@@ -42,33 +47,40 @@ async def list_secondary_mids(
     *, plan_ref: UUID, merchant_ref: UUID, exclude_location: UUID | None, n: int, p: int
 ) -> list[SecondaryMIDResponse]:
     """Return a list of all secondary MIDs on the given merchant."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
-
     query = SecondaryMID.objects(SecondaryMID.payment_scheme).where(
-        SecondaryMID.merchant == merchant,
+        merchant_owns(
+            SecondaryMID.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref
+        ),
     )
 
     if exclude_location:
         if not await Location.exists().where(
-            Location.pk == exclude_location, Location.merchant == merchant
+            Location.pk == exclude_location,
+            merchant_owns(
+                Location.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref
+            ),
         ):
+            await get_merchant(merchant_ref, plan_ref=plan_ref)
             raise NoSuchRecord(Location)
 
-        linked_secondary_mid_pks = (
-            await SecondaryMIDLocationLink.select(
-                SecondaryMIDLocationLink.secondary_mid.pk
+        query = query.where(
+            WhereRaw(
+                "NOT EXISTS ("
+                "SELECT FROM secondary_mid_location_link AS link "
+                "WHERE link.secondary_mid = secondary_mid.pk AND link.location = {}"
+                ")",
+                exclude_location,
             )
-            .where(SecondaryMIDLocationLink.location == exclude_location)
-            .output(as_list=True)
         )
-        if linked_secondary_mid_pks:
-            query = query.where(SecondaryMID.pk.not_in(linked_secondary_mid_pks))
 
     results = await paginate(
         query,
         n=n,
         p=p,
     )
+    if not results:
+        # an empty page could also mean a bad merchant or plan ref.
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
 
     return [make_response(result) for result in results]
 
@@ -80,16 +92,18 @@ async def get_secondary_mid_instance(
     merchant_ref: UUID,
 ) -> SecondaryMID:
     """Returns a secondary MID."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
     secondary_mid = (
         await SecondaryMID.objects(SecondaryMID.payment_scheme)
         .where(
             SecondaryMID.pk == pk,
-            SecondaryMID.merchant == merchant,
+            merchant_owns(
+                SecondaryMID.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref
+            ),
         )
         .first()
     )
     if not secondary_mid:
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
         raise NoSuchRecord(SecondaryMID)
     return secondary_mid
 
@@ -101,17 +115,18 @@ async def get_secondary_mid(
     merchant_ref: UUID,
 ) -> SecondaryMIDResponse:
     """Returns a secondary MID."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
-
     secondary_mid = (
         await SecondaryMID.objects(SecondaryMID.payment_scheme)
         .where(
             SecondaryMID.pk == pk,
-            SecondaryMID.merchant == merchant,
+            merchant_owns(
+                SecondaryMID.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref
+            ),
         )
         .first()
     )
     if not secondary_mid:
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
         raise NoSuchRecord(SecondaryMID)
 
     return make_response(secondary_mid)
@@ -124,51 +139,38 @@ async def get_secondary_mids(
     merchant_ref: UUID,
 ) -> list[SecondaryMIDResponse]:
     """Get a number of secondary MIDs by their primary keys."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
     secondary_mids = await SecondaryMID.objects(SecondaryMID.payment_scheme).where(
         SecondaryMID.pk.is_in(list(pks)),
-        SecondaryMID.merchant == merchant,
+        merchant_owns(
+            SecondaryMID.merchant, merchant_ref=merchant_ref, plan_ref=plan_ref
+        ),
     )
 
     if len(secondary_mids) != len(pks):
+        await get_merchant(merchant_ref, plan_ref=plan_ref)
         raise NoSuchRecord(SecondaryMID)
 
     return [make_response(mid) for mid in secondary_mids]
 
 
-async def filter_onboarded_secondary_mids(
+async def delete_secondary_mids(
     secondary_mid_refs: set[UUID],
     *,
     plan_ref: UUID,
     merchant_ref: UUID,
 ) -> tuple[set[UUID], set[UUID]]:
     """
-    Split the given list of secondary MID refs into onboarded and not.
+    Delete the given secondary MIDs, or mark them as pending deletion if they
+    are onboarded. Deleted secondary MIDs are unlinked from their locations.
+    Returns the refs that are now pending deletion, and those that were deleted.
     """
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
-    q_secondary_mid_refs = list(secondary_mid_refs)
-
-    count = await SecondaryMID.count().where(
-        SecondaryMID.pk.is_in(q_secondary_mid_refs)
+    return await delete_owned(
+        SecondaryMID,
+        secondary_mid_refs,
+        plan_ref=plan_ref,
+        merchant_ref=merchant_ref,
+        unlink=[SecondaryMIDLocationLink.secondary_mid],
     )
-    if count != len(secondary_mid_refs):
-        raise NoSuchRecord(SecondaryMID)
-
-    return {
-        result["pk"]
-        for result in await SecondaryMID.select(SecondaryMID.pk).where(
-            SecondaryMID.pk.is_in(q_secondary_mid_refs),
-            SecondaryMID.merchant == merchant,
-            SecondaryMID.txm_status == TXMStatus.ONBOARDED,
-        )
-    }, {
-        result["pk"]
-        for result in await SecondaryMID.select(SecondaryMID.pk).where(
-            SecondaryMID.pk.is_in(q_secondary_mid_refs),
-            SecondaryMID.merchant == merchant,
-            SecondaryMID.txm_status != TXMStatus.ONBOARDED,
-        )
-    }
 
 
 async def create_secondary_mid(
@@ -192,26 +194,6 @@ async def create_secondary_mid(
     return make_response(secondary_mid)
 
 
-async def update_secondary_mids_status(
-    secondary_mid_refs: set[UUID],
-    *,
-    status: ResourceStatus,
-    plan_ref: UUID,
-    merchant_ref: UUID,
-) -> None:
-    """Updates the status for a list of secondary MIDs on a merchant."""
-    merchant = await get_merchant(merchant_ref, plan_ref=plan_ref)
-    q_secondary_mid_refs = list(secondary_mid_refs)
-    await SecondaryMID.update({SecondaryMID.status: status}).where(
-        SecondaryMID.pk.is_in(q_secondary_mid_refs), SecondaryMID.merchant == merchant
-    )
-
-    if status == ResourceStatus.DELETED:
-        await SecondaryMIDLocationLink.delete().where(
-            SecondaryMIDLocationLink.secondary_mid.is_in(q_secondary_mid_refs)
-        )
-
-
 async def list_associated_locations(
     plan_ref: UUID,
     merchant_ref: UUID,
@@ -269,15 +251,15 @@ async def bulk_update_secondary_mids(
     plan_ref: UUID,
     merchant_ref: UUID,
 ) -> list[SecondaryMIDResponse]:
-    """Update a secondary MID's editable fields."""
-    await get_secondary_mids(
-        secondary_mid_refs, plan_ref=plan_ref, merchant_ref=merchant_ref
-    )
-
-    await SecondaryMID.update({SecondaryMID.payment_enrolment_status: status}).where(
-        SecondaryMID.pk.is_in(list(secondary_mid_refs))
-    )
-    secondary_mids = await get_secondary_mids(
-        secondary_mid_refs, plan_ref=plan_ref, merchant_ref=merchant_ref
+    """Update the payment enrolment status of a number of secondary MIDs."""
+    secondary_mids = await update_owned(
+        SecondaryMID,
+        secondary_mid_refs,
+        {SecondaryMID.payment_enrolment_status: status},
+        plan_ref=plan_ref,
+        merchant_ref=merchant_ref,
     )
-    return secondary_mids
+    for secondary_mid in secondary_mids:
+        # payment schemes are keyed by slug, so there is nothing more to load.
+        secondary_mid.payment_scheme = PaymentScheme(slug=secondary_mid.payment_scheme)
+    return [make_response(secondary_mid) for secondary_mid in secondary_mids]
@@ -147,7 +147,8 @@ async def create_secondary_mid(
     if secondary_mid_data.onboard:
         await tasks.queue.push(
             tasks.OnboardSecondaryMIDs(
-                secondary_mid_refs=[secondary_mid.secondary_mid_ref]
+                merchant_ref=merchant_ref,
+                secondary_mid_refs=[secondary_mid.secondary_mid_ref],
             )
         )
 
@@ -180,9 +181,10 @@ async def onboard_secondary_mids(
 
     await tasks.queue.push(
         tasks.OnboardSecondaryMIDs(
+            merchant_ref=merchant_ref,
             secondary_mid_refs=[
                 secondary_mid.secondary_mid_ref for secondary_mid in secondary_mids
-            ]
+            ],
         )
     )
 
@@ -215,9 +217,10 @@ async def offboard_secondary_mids(
 
     await tasks.queue.push(
         tasks.OffboardSecondaryMIDs(
+            merchant_ref=merchant_ref,
             secondary_mid_refs=[
                 secondary_mid.secondary_mid_ref for secondary_mid in secondary_mids
-            ]
+            ],
         )
     )
 
@@ -242,7 +245,7 @@ async def delete_secondary_mids(
         return []
 
     try:
-        onboarded, not_onboarded = await db.filter_onboarded_secondary_mids(
+        onboarded, not_onboarded = await db.delete_secondary_mids(
             set(deletion.secondary_mid_refs),
             plan_ref=plan_ref,
             merchant_ref=merchant_ref,
@@ -255,23 +258,10 @@ async def delete_secondary_mids(
         ) from ex
 
     if onboarded:
-        await db.update_secondary_mids_status(
-            onboarded,
-            status=ResourceStatus.PENDING_DELETION,
-            plan_ref=plan_ref,
-            merchant_ref=merchant_ref,
-        )
-
         await tasks.queue.push(
-            tasks.OffboardAndDeleteSecondaryMIDs(secondary_mid_refs=onboarded)
-        )
-
-    if not_onboarded:
-        await db.update_secondary_mids_status(
-            not_onboarded,
-            status=ResourceStatus.DELETED,
-            plan_ref=plan_ref,
-            merchant_ref=merchant_ref,
+            tasks.OffboardAndDeleteSecondaryMIDs(
+                merchant_ref=merchant_ref, secondary_mid_refs=onboarded
+            )
         )
 
     return [
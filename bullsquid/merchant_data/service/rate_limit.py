@@ -0,0 +1,139 @@
+"""
+A token bucket rate limiter shared between processes via the database.
+"""
+
+import asyncio
+from datetime import timedelta
+
+from loguru import logger
+
+from bullsquid.merchant_data.service.tables import RateLimitBucket
+
+# Refills the bucket for the time elapsed since it was last used, then takes
+# the requested number of tokens. The balance is allowed to go negative; a
+# negative balance is a debt that the caller pays off by waiting before it
+# proceeds. This reserves capacity in a single statement, with no retry loop,
+# and callers are served in the order they arrive.
+TAKE_TOKENS_QUERY = """
+INSERT INTO rate_limit_bucket AS bucket (name, tokens, updated_at)
+VALUES ({}, {}::float8 - {}::float8, clock_timestamp())
+ON CONFLICT (name) DO UPDATE
+SET
+    tokens = LEAST(
+        {}::float8,
+        bucket.tokens
+            + extract(epoch FROM clock_timestamp() - bucket.updated_at) * {}::float8
+    ) - {}::float8,
+    updated_at = clock_timestamp()
+RETURNING tokens
+"""
+
+# Gives back tokens that were taken but not used.
+REFUND_TOKENS_QUERY = """
+UPDATE rate_limit_bucket
+SET tokens = LEAST({}::float8, tokens + {}::float8)
+WHERE name = {}
+"""
+
+
+class RateLimited(Exception):
+    """
+    The rate limit's budget is taken for longer ahead than a caller may wait.
+    Jobs that raise this are retried later.
+    """
+
+
+class TokenBucket:
+    """
+    A token bucket that refills at `rate` tokens per second, up to `capacity`.
+    Every process using a bucket with the same name shares the same budget.
+    """
+
+    def __init__(self, name: str, *, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+
+    async def take(self, tokens: float = 1, *, max_wait: float | None = None) -> float:
+        """
+        Take tokens from the bucket. Returns the number of seconds the caller
+        must wait before proceeding, which is zero if enough tokens were free.
+        If the wait would be longer than `max_wait` seconds, the tokens are
+        given back and RateLimited is raised, so the debt stays bounded.
+        """
+        (row,) = await RateLimitBucket.raw(
+            TAKE_TOKENS_QUERY,
+            self.name,
+            self.capacity,
+            tokens,
+            self.capacity,
+            self.rate,
+            tokens,
+        )
+        delay = max(0.0, -row["tokens"] / self.rate)
+        if max_wait is not None and delay > max_wait:
+            await self.refund(tokens)
+            raise RateLimited(
+                f"{self.name} is booked up for {delay:.1f}s, "
+                f"more than the {max_wait:.1f}s allowed"
+            )
+        return delay
+
+    async def refund(self, tokens: float) -> None:
+        """Give back tokens that were taken but not used."""
+        await RateLimitBucket.raw(REFUND_TOKENS_QUERY, self.capacity, tokens, self.name)
+
+
+class RateLimiter:
+    """
+    Limits calls to a service by requests per second and optionally by the
+    number of items (e.g. identifiers) sent per second.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        requests_per_second: float | None,
+        items_per_second: float | None = None,
+        max_wait: timedelta | None = None,
+    ) -> None:
+        self.name = name
+        self.max_wait = max_wait.total_seconds() if max_wait else None
+        self.requests = (
+            TokenBucket(f"{name}:requests", rate=requests_per_second)
+            if requests_per_second
+            else None
+        )
+        self.items = (
+            TokenBucket(f"{name}:items", rate=items_per_second)
+            if items_per_second
+            else None
+        )
+
+    async def acquire(self, items: int = 0) -> None:
+        """
+        Wait until a request carrying the given number of items may be sent.
+        Raises RateLimited instead if that would take longer than `max_wait`.
+        If the wait is cancelled, the tokens taken for it are given back.
+        """
+        taken: list[tuple[TokenBucket, float]] = []
+        try:
+            delay = 0.0
+            if self.requests:
+                delay = max(delay, await self.requests.take(max_wait=self.max_wait))
+                taken.append((self.requests, 1))
+            if self.items and items:
+                delay = max(delay, await self.items.take(items, max_wait=self.max_wait))
+                taken.append((self.items, items))
+
+            if delay:
+                logger.debug(f"Rate limited calls to {self.name}, waiting {delay:.2f}s")
+                await asyncio.sleep(delay)
+        except (RateLimited, asyncio.CancelledError):
+            for bucket, tokens in taken:
+                await bucket.refund(tokens)
+            raise
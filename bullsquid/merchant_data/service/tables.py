@@ -0,0 +1,15 @@
+"""Service interface table definitions."""
+
+from piccolo.columns import DoublePrecision, Timestamptz, Varchar
+from piccolo.table import Table
+
+
+class RateLimitBucket(Table):
+    """
+    Token bucket state shared by every process that calls a rate limited
+    service. Tokens are refilled lazily based on the time since updated_at.
+    """
+
+    name = Varchar(length=100, primary_key=True)
+    tokens = DoublePrecision()
+    updated_at = Timestamptz()
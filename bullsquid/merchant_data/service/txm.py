@@ -1,11 +1,13 @@
 """Harmonia service class."""
 
+from typing import Mapping
 from unittest.mock import MagicMock, create_autospec
 from uuid import UUID
 
 from bullsquid.merchant_data.primary_mids.tables import PrimaryMID
 from bullsquid.merchant_data.psimis.tables import PSIMI
 from bullsquid.merchant_data.secondary_mids.tables import SecondaryMID
+from bullsquid.merchant_data.service.rate_limit import RateLimiter
 from bullsquid.service import ServiceInterface
 from bullsquid.settings import settings
 
@@ -16,6 +18,20 @@ class TXMServiceInterface(ServiceInterface):
     def __init__(self, base_url: str) -> None:
         super().__init__(base_url)
         self.headers = {"Authorization": f"Token {settings.txm.api_key}"}
+        self.rate_limiter = RateLimiter(
+            "txm",
+            requests_per_second=settings.txm_requests_per_second,
+            items_per_second=settings.txm_identifiers_per_second,
+            max_wait=settings.txm_rate_limit_max_wait,
+        )
+
+    async def post(self, path: str, json: Mapping) -> dict:
+        """
+        Perform a POST request once the rate limiter allows it.
+        Returns the JSON response.
+        """
+        await self.rate_limiter.acquire(items=len(json.get("identifiers", [])))
+        return await super().post(path, json)
 
     async def onboard_mids(self, mid_refs: set[UUID]) -> dict:
         """Onboard MIDs into Harmonia."""
@@ -1,9 +1,9 @@
 """Database access layer for operations on locations"""
 
-from uuid import UUID
+from uuid import UUID, uuid4
 
 from bullsquid.db import NoSuchRecord, paginate
-from bullsquid.merchant_data.locations.db import get_location, get_location_instance
+from bullsquid.merchant_data.locations.db import get_location_instance
 from bullsquid.merchant_data.locations.tables import Location
 from bullsquid.merchant_data.locations_common.db import (
     create_sub_location_overview_response,
@@ -80,9 +80,7 @@ async def list_sub_locations(
         p=p,
     )
 
-    return [
-        await create_sub_location_overview_response(location) for location in locations
-    ]
+    return [create_sub_location_overview_response(location) for location in locations]
 
 
 async def create_sub_location(
@@ -93,11 +91,11 @@ async def create_sub_location(
     parent: UUID,
 ) -> SubLocationOverviewResponse:
     """Create and return response for a sub-location."""
-    await get_location(
-        location_ref=parent, plan_ref=plan_ref, merchant_ref=merchant_ref
-    )
+    await get_location_instance(parent, plan_ref=plan_ref, merchant_ref=merchant_ref)
     location = Location(
-        location_id=None,
+        # location IDs are required, so sub-locations get a UUID like the ones
+        # given to existing ID-less locations when the column was made required.
+        location_id=str(uuid4()),
         name=location_data.name,
         is_physical_location=location_data.is_physical_location,
         address_line_1=location_data.address_line_1,
@@ -112,7 +110,7 @@ async def create_sub_location(
     )
     await location.save()
 
-    return await create_sub_location_overview_response(location)
+    return create_sub_location_overview_response(location)
 
 
 async def get_sub_location(
@@ -1,19 +1,18 @@
 """Tasks to be performed off the main thread."""
 
 import asyncio
-from typing import cast
+import itertools
+import time
 from uuid import UUID
 
 import sentry_sdk
 from loguru import logger
 from pydantic import BaseModel
 from qbert import Queue
+from qbert.queue import Job
 
+from bullsquid.engine import record_queries
 from bullsquid.merchant_data.enums import ResourceStatus, TXMStatus
-from bullsquid.merchant_data.merchants.db import merchant_has_onboarded_resources
-from bullsquid.merchant_data.merchants.tables import Merchant
-from bullsquid.merchant_data.plans.db import plan_has_onboarded_resources
-from bullsquid.merchant_data.plans.tables import Plan
 from bullsquid.merchant_data.primary_mids.tables import PrimaryMID
 from bullsquid.merchant_data.psimis.tables import PSIMI
 from bullsquid.merchant_data.secondary_mid_location_links.tables import (
@@ -21,6 +20,7 @@ from bullsquid.merchant_data.secondary_mid_location_links.tables import (
 )
 from bullsquid.merchant_data.secondary_mids.tables import SecondaryMID
 from bullsquid.merchant_data.service.txm import txm
+from bullsquid.merchant_data.tasks.dead_letters import fail_job
 from bullsquid.merchant_data.tasks.import_identifiers import (
     ImportIdentifiersFileRecord,
     import_identifiers_file_record,
@@ -33,58 +33,73 @@ from bullsquid.merchant_data.tasks.import_merchants import (
     ImportMerchantsFileRecord,
     import_merchant_file_record,
 )
+from bullsquid.merchant_data.tasks.metrics import record_job
+from bullsquid.merchant_data.tasks.offboarding import (
+    delete_fully_offboarded_merchants,
+    offboard_and_delete_merchants,
+    offboard_and_delete_plan,
+)
+from bullsquid.merchant_data.tasks.timeouts import run_with_timeout
 from bullsquid.settings import settings
 
 
-class OnboardPrimaryMIDs(BaseModel):
+class MerchantResourceMessage(BaseModel):
+    """A message that acts on resources belonging to a single merchant."""
+
+    # used as the partition key for the job. optional for compatibility with
+    # jobs that were queued before it was added.
+    merchant_ref: UUID | None = None
+
+
+class OnboardPrimaryMIDs(MerchantResourceMessage):
     """Onboard MIDs into Harmonia."""
 
     mid_refs: list[UUID]
 
 
-class OnboardSecondaryMIDs(BaseModel):
+class OnboardSecondaryMIDs(MerchantResourceMessage):
     """Onboard Secondary MIDs into Harmonia."""
 
     secondary_mid_refs: list[UUID]
 
 
-class OnboardPSIMIs(BaseModel):
+class OnboardPSIMIs(MerchantResourceMessage):
     """Onboard PSIMIs into Harmonia."""
 
     psimi_refs: list[UUID]
 
 
-class OffboardPrimaryMIDs(BaseModel):
+class OffboardPrimaryMIDs(MerchantResourceMessage):
     """Offboard MIDs from Harmonia."""
 
     mid_refs: list[UUID]
 
 
-class OffboardSecondaryMIDs(BaseModel):
+class OffboardSecondaryMIDs(MerchantResourceMessage):
     """Offboard Secondary MIDs from Harmonia."""
 
     secondary_mid_refs: list[UUID]
 
 
-class OffboardPSIMIs(BaseModel):
+class OffboardPSIMIs(MerchantResourceMessage):
     """Offboard PSIMIs from Harmonia."""
 
     psimi_refs: list[UUID]
 
 
-class OffboardAndDeletePrimaryMIDs(BaseModel):
+class OffboardAndDeletePrimaryMIDs(MerchantResourceMessage):
     """Offboard MIDs from Harmonia, then mark them as deleted."""
 
     mid_refs: list[UUID]
 
 
-class OffboardAndDeleteSecondaryMIDs(BaseModel):
+class OffboardAndDeleteSecondaryMIDs(MerchantResourceMessage):
     """Offboard Secondary MIDs from Harmonia, then mark them as deleted."""
 
     secondary_mid_refs: list[UUID]
 
 
-class OffboardAndDeletePSIMIs(BaseModel):
+class OffboardAndDeletePSIMIs(MerchantResourceMessage):
     """Offboard PSIMIs from Harmonia, then mark them as deleted."""
 
     psimi_refs: list[UUID]
@@ -118,37 +133,11 @@ queue = Queue(
         ImportLocationFileRecord,
         ImportMerchantsFileRecord,
         ImportIdentifiersFileRecord,
-    ]
+    ],
+    max_attempts=settings.worker_max_attempts,
 )
 
 
-async def delete_fully_offboarded_plan(plan_ref: UUID) -> None:
-    """Delete the given plan if it is fully offboarded."""
-    if not await plan_has_onboarded_resources(plan_ref):
-        await Plan.update({Plan.status: ResourceStatus.DELETED}).where(
-            Plan.pk == plan_ref,
-            Plan.status == ResourceStatus.PENDING_DELETION,
-        )
-
-
-async def delete_fully_offboarded_merchants(merchant_refs: set[UUID]) -> None:
-    """Delete the given merchants if they are fully offboarded."""
-    for merchant_ref in merchant_refs:
-        if not await merchant_has_onboarded_resources(merchant_ref):
-            # we cast for mypy's benefit here, because we know that the merchant exists
-            merchant = cast(
-                Merchant, await Merchant.objects().get(Merchant.pk == merchant_ref)
-            )
-
-            if merchant.status != ResourceStatus.PENDING_DELETION:
-                continue
-
-            merchant.status = ResourceStatus.DELETED
-            await merchant.save()
-
-            await delete_fully_offboarded_plan(merchant.plan)
-
-
 async def _run_job(message: BaseModel) -> None:
     match message:
         case OnboardPrimaryMIDs():
@@ -244,64 +233,11 @@ async def _run_job(message: BaseModel) -> None:
                 )
             )
         case OffboardAndDeleteMerchant():
-            # TODO: split these into separate functions
-
-            # primary mids
-            onboarded_primary_mids = (
-                await PrimaryMID.select(PrimaryMID.pk)
-                .where(
-                    PrimaryMID.merchant == message.merchant_ref,
-                    PrimaryMID.txm_status == TXMStatus.ONBOARDED,
-                )
-                .output(as_list=True)
-            )
-            await PrimaryMID.update(
-                {PrimaryMID.status: ResourceStatus.PENDING_DELETION}
-            ).where(PrimaryMID.pk.is_in(onboarded_primary_mids))
-            await queue.push(
-                OffboardAndDeletePrimaryMIDs(mid_refs=onboarded_primary_mids)
-            )
-
-            # secondary mids
-            onboarded_secondary_mids = (
-                await SecondaryMID.select(SecondaryMID.pk)
-                .where(
-                    SecondaryMID.merchant == message.merchant_ref,
-                    SecondaryMID.txm_status == TXMStatus.ONBOARDED,
-                )
-                .output(as_list=True)
-            )
-            await SecondaryMID.update(
-                {SecondaryMID.status: ResourceStatus.PENDING_DELETION}
-            ).where(SecondaryMID.pk.is_in(onboarded_secondary_mids))
-            await queue.push(
-                OffboardAndDeleteSecondaryMIDs(
-                    secondary_mid_refs=onboarded_secondary_mids
-                )
-            )
-
-            # psimis
-            onboarded_psimis = (
-                await PSIMI.select(PSIMI.pk)
-                .where(
-                    PSIMI.merchant == message.merchant_ref,
-                    PSIMI.txm_status == TXMStatus.ONBOARDED,
-                )
-                .output(as_list=True)
-            )
-            await PSIMI.update({PSIMI.status: ResourceStatus.PENDING_DELETION}).where(
-                PSIMI.pk.is_in(onboarded_psimis)
-            )
-            await queue.push(OffboardAndDeletePSIMIs(psimi_refs=onboarded_psimis))
+            await offboard_and_delete_merchants([message.merchant_ref])
 
         case OffboardAndDeletePlan():
-            merchants = await Merchant.objects().where(
-                Merchant.plan == message.plan_ref
-            )
-            for merchant in merchants:
-                merchant.status = ResourceStatus.PENDING_DELETION
-                await merchant.save()
-                await queue.push(OffboardAndDeleteMerchant(merchant_ref=merchant.pk))
+            await offboard_and_delete_plan(message.plan_ref)
+
         case ImportLocationFileRecord():
             await import_location_file_record(
                 message.record,
@@ -318,30 +254,105 @@ async def _run_job(message: BaseModel) -> None:
             )
 
 
+def partition_key(message: BaseModel) -> str | None:
+    """
+    Returns the partition that the given message belongs to.
+    Jobs in the same partition are run one at a time in the order they were
+    scheduled, while jobs in different partitions may run in parallel.
+    Messages without a merchant or plan ref are not partitioned.
+    Plan partitions can overlap with merchant partitions, so stage_jobs keeps
+    them from running at the same time.
+    """
+    if merchant_ref := getattr(message, "merchant_ref", None):
+        return f"merchant:{merchant_ref}"
+    if plan_ref := getattr(message, "plan_ref", None):
+        return f"plan:{plan_ref}"
+    return None
+
+
+def partition_jobs(jobs: list[Job]) -> list[list[Job]]:
+    """
+    Group jobs by their partition key, preserving the order of jobs within each
+    partition. Unpartitioned jobs are each given a partition of their own.
+    """
+    partitions: dict[str | UUID, list[Job]] = {}
+    for job in jobs:
+        key = partition_key(job.message) or job.id
+        partitions.setdefault(key, []).append(job)
+    return list(partitions.values())
+
+
+def _is_plan_scoped(job: Job) -> bool:
+    return (partition_key(job.message) or "").startswith("plan:")
+
+
+def stage_jobs(jobs: list[Job]) -> list[list[Job]]:
+    """
+    Split jobs into stages that must run one after another, keeping the order
+    of the jobs. A plan-scoped job may touch any merchant on the plan, so runs
+    of plan-scoped jobs get stages of their own instead of sharing one with
+    merchant-scoped jobs.
+    """
+    return [list(stage) for _, stage in itertools.groupby(jobs, key=_is_plan_scoped)]
+
+
+async def _process_job(job: Job) -> None:
+    logger.debug(f"Running job: {job}")
+    message_type = type(job.message).__name__
+    started_at = time.perf_counter()
+    try:
+        with record_queries() as stats:
+            try:
+                await run_with_timeout(message_type, _run_job(job.message))
+            finally:
+                # failed and timed out jobs are often the expensive ones.
+                stats.log_if_expensive(
+                    f"{message_type} job {job.id}",
+                    max_count=settings.worker_job_query_count_threshold,
+                    max_duration=settings.worker_job_query_time_threshold,
+                )
+    except Exception as ex:  # pylint: disable=broad-except
+        # we catch all exceptions to prevent bad jobs from crashing the worker.
+        if settings.debug:
+            logger.exception(ex)
+
+        event_id = sentry_sdk.capture_exception()
+        logger.warning(f"Job {job} failed: {ex!r} (event ID: {event_id})")
+
+        retrying = await fail_job(job.id, ex, max_attempts=settings.worker_max_attempts)
+        record_job(
+            job.message,
+            started_at=started_at,
+            outcome="retried" if retrying else "failed",
+        )
+    else:
+        record_job(job.message, started_at=started_at, outcome="succeeded")
+
+        logger.debug(f"Job {job} succeeded")
+        await queue.delete_job(job.id)
+
+
+async def _process_partition(jobs: list[Job]) -> None:
+    for job in jobs:
+        await _process_job(job)
+
+
 async def run_worker(*, burst: bool = False) -> None:
     """
     Run the task worker.
+    Each batch of jobs is split into stages, which run one after another. The
+    jobs in a stage are split into partitions, which are run concurrently.
     Burst mode causes the worker to stop when the queue is empty.
     """
     logger.info("Bullsquid task worker starting up.")
     while True:
-        for job in await queue.pull(settings.worker_concurrency):
-            logger.debug(f"Running job: {job}")
-            try:
-                await _run_job(job.message)
-            except Exception as ex:  # pylint: disable=broad-except
-                # we catch all exceptions to prevent bad jobs from crashing the worker.
-
-                if settings.debug:
-                    logger.exception(ex)
-
-                event_id = sentry_sdk.capture_exception()
-                logger.warning(f"Job {job} failed: {ex!r} (event ID: {event_id})")
-
-                await queue.fail_job(job.id)
-            else:
-                logger.debug(f"Job {job} succeeded")
-                await queue.delete_job(job.id)
+        # the pull query doesn't return jobs in order, but their ULID ids sort by
+        # the time they were pushed (or, for replayed jobs, when they failed.)
+        jobs = sorted(await queue.pull(settings.worker_concurrency), key=lambda j: j.id)
+        for stage in stage_jobs(jobs):
+            await asyncio.gather(
+                *(_process_partition(partition) for partition in partition_jobs(stage))
+            )
 
         if burst:
             return
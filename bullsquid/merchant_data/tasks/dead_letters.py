@@ -0,0 +1,214 @@
+"""
+Retry scheduling for failed jobs, and the dead letter store for jobs that
+cannot be retried.
+"""
+
+import asyncio
+import traceback
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+import aiohttp
+import ulid
+from asyncpg import exceptions as pg_exceptions
+from fastapi import status
+from piccolo.query.methods.select import Count
+from qbert.enums import JobStatus
+from qbert.queue import squash
+from qbert.tables import Job
+
+from bullsquid.merchant_data.service.rate_limit import RateLimited
+from bullsquid.merchant_data.tasks.tables import DeadLetter
+from bullsquid.settings import settings
+
+RETRY_JOB_QUERY = squash(
+    """
+    UPDATE qbert_job
+    SET
+        failed_attempts = failed_attempts + 1,
+        status = {},
+        scheduled_for = {}::timestamptz
+            + LEAST({}::interval * power(2, failed_attempts), {}::interval),
+        updated_at = {}
+    WHERE id = {}
+    AND failed_attempts + 1 < {}
+    RETURNING id
+    """
+)
+
+DEAD_LETTER_QUERY = squash(
+    """
+    WITH job AS (
+        DELETE FROM qbert_job
+        WHERE id = {}
+        RETURNING *
+    )
+    INSERT INTO dead_letter (
+        pk, message_type, message, error, failed_attempts, created_at, failed_at
+    )
+    SELECT id, message_type, message, {}, failed_attempts + 1, created_at, {}
+    FROM job
+    """
+)
+
+REPLAY_BATCH_QUERY = squash(
+    """
+    WITH batch AS (
+        SELECT pk, failed_at
+        FROM dead_letter
+        WHERE replayed_at IS NULL
+        AND ({}::text IS NULL OR message_type = {})
+        AND ({}::timestamptz IS NULL OR failed_at >= {})
+        AND ({}::timestamptz IS NULL OR failed_at < {})
+        ORDER BY failed_at
+        LIMIT {}
+        FOR UPDATE SKIP LOCKED
+    ), numbered AS (
+        SELECT pk, row_number() OVER (ORDER BY failed_at, pk) AS n
+        FROM batch
+    ), replayed AS (
+        UPDATE dead_letter
+        SET replayed_at = {}
+        FROM batch
+        WHERE dead_letter.pk = batch.pk
+        RETURNING dead_letter.pk, dead_letter.message_type, dead_letter.message
+    )
+    INSERT INTO qbert_job (
+        id, created_at, updated_at, scheduled_for, failed_attempts, status,
+        message_type, message
+    )
+    SELECT ({}::uuid[])[numbered.n], {}, {}, {}, 0, {}, message_type, message
+    FROM replayed
+    JOIN numbered ON numbered.pk = replayed.pk
+    RETURNING id
+    """
+)
+
+RETRYABLE_DATABASE_ERRORS = (
+    pg_exceptions.PostgresConnectionError,
+    pg_exceptions.InterfaceError,
+    pg_exceptions.TooManyConnectionsError,
+    pg_exceptions.DeadlockDetectedError,
+    pg_exceptions.SerializationError,
+)
+
+
+def is_retryable(ex: BaseException) -> bool:
+    """
+    Returns true if the given error is likely to be transient, such as a
+    connection failure or a 5xx/429 response from another service.
+    """
+    match ex:
+        case aiohttp.ClientResponseError():
+            return (
+                ex.status == status.HTTP_429_TOO_MANY_REQUESTS
+                or ex.status >= status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        case (
+            aiohttp.ClientError()
+            | asyncio.TimeoutError()
+            | ConnectionError()
+            | RateLimited()
+        ):
+            return True
+        case _:
+            return isinstance(ex, RETRYABLE_DATABASE_ERRORS)
+
+
+async def fail_job(job_id: UUID, error: BaseException, *, max_attempts: int) -> bool:
+    """
+    Fail a job. Retryable errors put the job back in the queue with an
+    exponential backoff if it has any attempts remaining. Otherwise the job is
+    moved into the dead letter store.
+    Returns true if the job will be retried.
+    """
+    now = datetime.now(timezone.utc)
+
+    if is_retryable(error) and await Job.raw(
+        RETRY_JOB_QUERY,
+        JobStatus.QUEUED,
+        now,
+        settings.worker_retry_backoff,
+        settings.worker_max_retry_backoff,
+        now,
+        job_id,
+        max_attempts,
+    ):
+        return True
+
+    await DeadLetter.raw(
+        DEAD_LETTER_QUERY,
+        job_id,
+        "".join(traceback.format_exception(error)),
+        now,
+    )
+    return False
+
+
+async def count_dead_letters(
+    *,
+    message_type: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> dict[str, int]:
+    """Returns the number of unreplayed dead letters for each message type."""
+    query = DeadLetter.select(DeadLetter.message_type, Count()).where(
+        DeadLetter.replayed_at.is_null()
+    )
+    if message_type:
+        query = query.where(DeadLetter.message_type == message_type)
+    if since:
+        query = query.where(DeadLetter.failed_at >= since)
+    if until:
+        query = query.where(DeadLetter.failed_at < until)
+
+    return {
+        row["message_type"]: row["count"]
+        for row in await query.group_by(DeadLetter.message_type)
+    }
+
+
+async def replay_dead_letters(
+    *,
+    message_type: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    batch_size: int = 100,
+    batch_interval: timedelta = timedelta(seconds=10),
+) -> int:
+    """
+    Put unreplayed dead letters matching the given filters back on the queue.
+    Jobs are requeued in batches of `batch_size`, with each batch scheduled
+    `batch_interval` after the last so that a large replay is spread out over
+    time instead of hitting downstream services all at once.
+    Replayed jobs get ULIDs in the order they failed, like the ones qbert
+    gives new jobs, so the worker runs them in that order.
+    Returns the number of jobs requeued.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be >= 1")
+
+    now = datetime.now(timezone.utc)
+    scheduled_for = now
+    replayed = 0
+    while jobs := await DeadLetter.raw(
+        REPLAY_BATCH_QUERY,
+        message_type,
+        message_type,
+        since,
+        since,
+        until,
+        until,
+        batch_size,
+        now,
+        # monotonic, so ids made in the same millisecond still sort in order.
+        [ulid.monotonic.new().uuid for _ in range(batch_size)],
+        now,
+        now,
+        scheduled_for,
+        JobStatus.QUEUED,
+    ):
+        replayed += len(jobs)
+        scheduled_for += batch_interval
+
+    return replayed
@@ -0,0 +1,152 @@
+"""
+Periodic maintenance of the job queue and dead letter tables.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+
+from loguru import logger
+from pydantic import BaseModel
+from qbert.enums import JobStatus
+from qbert.queue import squash
+from qbert.tables import Job
+
+from bullsquid.merchant_data.tasks.tables import DeadLetter
+from bullsquid.settings import settings
+
+HOUSEKEEPING_TABLES = ["qbert_job", "dead_letter"]
+
+# Jobs only reach the failed status through qbert's own fail_job, which the
+# worker no longer uses. Any that remain are moved into the dead letter store
+# so that they can still be inspected and replayed.
+ARCHIVE_FAILED_JOBS_QUERY = squash(
+    """
+    WITH jobs AS (
+        DELETE FROM qbert_job
+        WHERE id IN (
+            SELECT id
+            FROM qbert_job
+            WHERE status = {}
+            LIMIT {}
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+    )
+    INSERT INTO dead_letter (
+        pk, message_type, message, error, failed_attempts, created_at, failed_at
+    )
+    SELECT id, message_type, message, {}, failed_attempts, created_at, updated_at
+    FROM jobs
+    RETURNING pk
+    """
+)
+
+PURGE_DEAD_LETTERS_QUERY = squash(
+    """
+    DELETE FROM dead_letter
+    WHERE pk IN (
+        SELECT pk
+        FROM dead_letter
+        WHERE failed_at < {}
+        LIMIT {}
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING pk
+    """
+)
+
+TABLE_STATS_QUERY = squash(
+    """
+    SELECT
+        relname AS table,
+        n_live_tup AS live_tuples,
+        n_dead_tup AS dead_tuples,
+        pg_table_size(relid) AS table_bytes,
+        pg_indexes_size(relid) AS index_bytes,
+        greatest(last_vacuum, last_autovacuum) AS last_vacuum
+    FROM pg_stat_user_tables
+    WHERE relname = ANY({})
+    ORDER BY relname
+    """
+)
+
+ARCHIVED_JOB_ERROR = "Archived from the job queue by housekeeping; no error recorded."
+
+
+class TableStats(BaseModel):
+    """Size and bloat statistics for a single table."""
+
+    table: str
+    live_tuples: int
+    dead_tuples: int
+    table_bytes: int
+    index_bytes: int
+    last_vacuum: datetime | None
+
+
+async def archive_failed_jobs(*, batch_size: int) -> int:
+    """
+    Move failed jobs into the dead letter store in batches.
+    Returns the number of jobs archived.
+    """
+    archived = 0
+    while batch := await Job.raw(
+        ARCHIVE_FAILED_JOBS_QUERY, JobStatus.FAILED, batch_size, ARCHIVED_JOB_ERROR
+    ):
+        archived += len(batch)
+    return archived
+
+
+async def purge_dead_letters(*, older_than: datetime, batch_size: int) -> int:
+    """
+    Delete dead letters that failed before the given time, in batches.
+    Returns the number of dead letters deleted.
+    """
+    purged = 0
+    while batch := await DeadLetter.raw(
+        PURGE_DEAD_LETTERS_QUERY, older_than, batch_size
+    ):
+        purged += len(batch)
+    return purged
+
+
+async def table_stats() -> list[TableStats]:
+    """Returns size and bloat statistics for the queue tables."""
+    return [
+        TableStats(**row)
+        for row in await Job.raw(TABLE_STATS_QUERY, HOUSEKEEPING_TABLES)
+    ]
+
+
+async def run_housekeeping() -> None:
+    """Archive failed jobs, purge expired dead letters, and report table bloat."""
+    batch_size = settings.worker_housekeeping_batch_size
+
+    archived = await archive_failed_jobs(batch_size=batch_size)
+    purged = await purge_dead_letters(
+        older_than=datetime.now(timezone.utc) - settings.worker_dead_letter_retention,
+        batch_size=batch_size,
+    )
+    logger.info(
+        f"Housekeeping archived {archived} failed job(s) "
+        f"and purged {purged} dead letter(s)."
+    )
+
+    for stats in await table_stats():
+        logger.info(
+            f"{stats.table}: {stats.live_tuples} live / {stats.dead_tuples} dead "
+            f"tuples, {stats.table_bytes} table bytes, {stats.index_bytes} index "
+            f"bytes, last vacuumed {stats.last_vacuum or 'never'}"
+        )
+
+
+async def run_housekeeping_periodically() -> None:
+    """Run housekeeping every worker_housekeeping_interval until cancelled."""
+    while True:
+        try:
+            await run_housekeeping()
+        except Exception as ex:  # pylint: disable=broad-except
+            # a failed run shouldn't stop housekeeping for good.
+            logger.warning(f"Housekeeping failed: {ex!r}")
+
+        await asyncio.sleep(settings.worker_housekeeping_interval.total_seconds())
@@ -44,6 +44,10 @@ class DuplicateLocation(LocationFileRecordError):
     """Location already exists."""
 
 
+class InvalidParent(LocationFileRecordError):
+    """Parent location could not be found."""
+
+
 class DuplicatePrimaryMID(LocationFileRecordError):
     """MID already exists."""
 
@@ -98,11 +102,29 @@ async def find_merchant(
     return merchant
 
 
+async def find_parent(parent_name: str, *, merchant: Merchant) -> Location:
+    """
+    Load the merchant's top-level location with the given name.
+    Raises InvalidParent unless there is exactly one such location.
+    """
+    parents = await Location.objects().where(
+        Location.merchant == merchant,
+        Location.parent.is_null(),
+        Location.name == parent_name,
+    )
+    if len(parents) != 1:
+        raise InvalidParent(
+            f"Expected one location named {parent_name!r}, found {len(parents)}"
+        )
+    return parents[0]
+
+
 async def import_location(
     record: LocationFileRecord, *, merchant: Merchant
 ) -> Location:
     """
-    Import a location under the given merchant.
+    Import a location under the given merchant. Records with a parent_name are
+    imported as sub-locations of the merchant's location with that name.
     """
     # use the same validation as a creation via the API.
     try:
@@ -121,6 +143,12 @@ async def import_location(
     except ValidationError as ex:
         raise InvalidRecord(str(ex)) from ex
 
+    parent = (
+        await find_parent(record.parent_name, merchant=merchant)
+        if record.parent_name
+        else None
+    )
+
     # TODO: use locations.db.create_location when it is merged!!!!!!!!!!!!
     location = Location(
         location_id=record.location_id,
@@ -134,6 +162,7 @@ async def import_location(
         postcode=record.postcode,
         merchant_internal_id=record.merchant_internal_id,
         merchant=merchant,
+        parent=parent,
     )
 
     if not fields_are_unique(
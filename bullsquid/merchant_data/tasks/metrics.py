@@ -0,0 +1,139 @@
+"""
+Metrics recorded by the task worker.
+"""
+
+import time
+
+from piccolo.query.methods.select import Count
+from pydantic import BaseModel
+from qbert.enums import JobStatus
+from qbert.tables import Job
+
+from bullsquid.merchant_data.tasks.housekeeping import table_stats
+from bullsquid.merchant_data.tasks.stats import queue_stats
+from bullsquid.merchant_data.tasks.tables import DeadLetter
+from bullsquid.metrics import REGISTRY, counter, gauge, histogram
+
+jobs_total = counter(
+    "bullsquid_worker_jobs",
+    "Number of jobs run by the worker, by message type and outcome.",
+    ["message_type", "outcome"],
+)
+
+job_duration_seconds = histogram(
+    "bullsquid_worker_job_duration_seconds",
+    "Time taken to run a job, by message type.",
+    ["message_type"],
+)
+
+queue_jobs = gauge(
+    "bullsquid_queue_jobs",
+    "Number of jobs in the queue, by message type and state.",
+    ["message_type", "state"],
+)
+
+dead_letters = gauge(
+    "bullsquid_dead_letters",
+    "Number of dead-lettered jobs awaiting replay, by message type.",
+    ["message_type"],
+)
+
+oldest_pending_job_age = gauge(
+    "bullsquid_queue_oldest_pending_job_age_seconds",
+    "Time since the oldest pending job became ready to run, by message type.",
+    ["message_type"],
+)
+
+stuck_jobs = gauge(
+    "bullsquid_queue_stuck_jobs",
+    "Number of jobs locked for longer than their timeout, by message type.",
+    ["message_type"],
+)
+
+table_dead_tuples = gauge(
+    "bullsquid_queue_table_dead_tuples",
+    "Estimated number of dead tuples in each queue table.",
+    ["table"],
+)
+
+table_size_bytes = gauge(
+    "bullsquid_queue_table_size_bytes",
+    "Size of each queue table and its indexes.",
+    ["table", "kind"],
+)
+
+JOB_STATES = {
+    JobStatus.QUEUED: "pending",
+    JobStatus.RUNNING: "locked",
+    JobStatus.FAILED: "failed",
+}
+
+
+def record_job(message: BaseModel, *, started_at: float, outcome: str) -> None:
+    """
+    Record the outcome and duration of a job.
+    `started_at` is the time.perf_counter() value from when the job started.
+    """
+    message_type = type(message).__name__
+    job_duration_seconds.observe(
+        time.perf_counter() - started_at, message_type=message_type
+    )
+    jobs_total.inc(message_type=message_type, outcome=outcome)
+
+
+async def collect_queue_jobs() -> None:
+    """Refresh the queue_jobs gauge from the job table."""
+    counts = await Job.select(Job.message_type, Job.status, Count()).group_by(
+        Job.message_type, Job.status
+    )
+
+    queue_jobs.clear()
+    for row in counts:
+        queue_jobs.set(
+            row["count"],
+            message_type=row["message_type"],
+            state=JOB_STATES.get(row["status"], str(row["status"])),
+        )
+
+
+async def collect_dead_letters() -> None:
+    """Refresh the dead_letters gauge from the dead letter table."""
+    counts = (
+        await DeadLetter.select(DeadLetter.message_type, Count())
+        .where(DeadLetter.replayed_at.is_null())
+        .group_by(DeadLetter.message_type)
+    )
+
+    dead_letters.clear()
+    for row in counts:
+        dead_letters.set(row["count"], message_type=row["message_type"])
+
+
+async def collect_oldest_pending_job_age() -> None:
+    """Refresh the oldest_pending_job_age gauge from the job table."""
+    stats = await queue_stats()
+
+    oldest_pending_job_age.clear()
+    for row in stats:
+        if row.oldest_pending_age is not None:
+            oldest_pending_job_age.set(
+                row.oldest_pending_age, message_type=row.message_type
+            )
+
+
+async def collect_table_stats() -> None:
+    """Refresh the queue table size and bloat gauges."""
+    stats = await table_stats()
+
+    table_dead_tuples.clear()
+    table_size_bytes.clear()
+    for table in stats:
+        table_dead_tuples.set(table.dead_tuples, table=table.table)
+        table_size_bytes.set(table.table_bytes, table=table.table, kind="table")
+        table_size_bytes.set(table.index_bytes, table=table.table, kind="index")
+
+
+REGISTRY.add_collector(collect_queue_jobs)
+REGISTRY.add_collector(collect_oldest_pending_job_age)
+REGISTRY.add_collector(collect_dead_letters)
+REGISTRY.add_collector(collect_table_stats)
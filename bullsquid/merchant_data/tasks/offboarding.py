@@ -0,0 +1,174 @@
+"""
+Set-based offboarding and deletion of merchants and plans.
+"""
+
+from typing import Any, AsyncIterator, Awaitable, Callable, Type, TypeVar
+from uuid import UUID
+
+from piccolo.columns import Column
+
+from bullsquid.merchant_data.enums import ResourceStatus, TXMStatus
+from bullsquid.merchant_data.merchants.tables import Merchant
+from bullsquid.merchant_data.primary_mids.tables import PrimaryMID
+from bullsquid.merchant_data.psimis.tables import PSIMI
+from bullsquid.merchant_data.secondary_mid_location_links.tables import (
+    SecondaryMIDLocationLink,
+)
+from bullsquid.merchant_data.secondary_mids.tables import SecondaryMID
+from bullsquid.merchant_data.service.txm import txm
+from bullsquid.settings import settings
+
+IdentifierTable = TypeVar("IdentifierTable", PrimaryMID, SecondaryMID, PSIMI)
+
+_ONBOARDED = f"txm_status = '{TXMStatus.ONBOARDED.value}'"
+_NOT_DELETED = f"status <> '{ResourceStatus.DELETED.value}'"
+_PENDING_DELETION = f"status = '{ResourceStatus.PENDING_DELETION.value}'"
+
+# Marks the given merchants as deleted if they have no onboarded identifiers
+# left, and then does the same for their plans. Every merchant in the affected
+# plans is considered when deciding if a plan is fully offboarded.
+FINALISE_DELETION_QUERY = f"""
+WITH scope AS (
+    SELECT pk, plan
+    FROM merchant
+    WHERE plan IN (SELECT plan FROM merchant WHERE pk = ANY({{}}::uuid[]))
+), onboarded AS (
+    SELECT merchant FROM primary_mid
+    WHERE merchant IN (SELECT pk FROM scope) AND {_ONBOARDED} AND {_NOT_DELETED}
+    UNION
+    SELECT merchant FROM secondary_mid
+    WHERE merchant IN (SELECT pk FROM scope) AND {_ONBOARDED} AND {_NOT_DELETED}
+    UNION
+    SELECT merchant FROM psimi
+    WHERE merchant IN (SELECT pk FROM scope) AND {_ONBOARDED} AND {_NOT_DELETED}
+), onboarded_plans AS (
+    SELECT DISTINCT scope.plan
+    FROM onboarded
+    JOIN scope ON scope.pk = onboarded.merchant
+), deleted_merchants AS (
+    UPDATE merchant
+    SET status = '{ResourceStatus.DELETED.value}'
+    WHERE pk = ANY({{}}::uuid[])
+    AND {_PENDING_DELETION}
+    AND pk NOT IN (SELECT merchant FROM onboarded)
+)
+UPDATE plan
+SET status = '{ResourceStatus.DELETED.value}'
+WHERE pk IN (SELECT plan FROM scope)
+AND {_PENDING_DELETION}
+AND pk NOT IN (SELECT plan FROM onboarded_plans)
+"""
+
+
+async def delete_fully_offboarded_merchants(merchant_refs: set[UUID]) -> None:
+    """
+    Delete any of the given merchants that are pending deletion and fully
+    offboarded, along with their plans if those are also pending deletion and
+    fully offboarded.
+    This is done in a single query regardless of the number of merchants.
+    """
+    if not merchant_refs:
+        return
+
+    refs = list(merchant_refs)
+    await Merchant.raw(FINALISE_DELETION_QUERY, refs, refs)
+
+
+async def _onboarded_identifier_chunks(
+    table: Type[IdentifierTable], merchant_refs: list[UUID]
+) -> AsyncIterator[list[UUID]]:
+    """
+    Yields the refs of onboarded identifiers belonging to the given merchants in
+    chunks of `worker_offboard_chunk_size`, paging through them by primary key.
+    """
+    last_ref: UUID | None = None
+    while True:
+        # select() would order by created first, which breaks the pk paging.
+        query = table.all_select(table.pk).where(
+            table.merchant.is_in(merchant_refs),
+            table.txm_status == TXMStatus.ONBOARDED,
+            table.status != ResourceStatus.DELETED,
+        )
+        if last_ref is not None:
+            query = query.where(table.pk > last_ref)
+
+        chunk = (
+            await query.order_by(table.pk)
+            .limit(settings.worker_offboard_chunk_size)
+            .output(as_list=True)
+        )
+        if not chunk:
+            return
+
+        yield chunk
+        last_ref = chunk[-1]
+
+
+async def _offboard_and_delete_identifiers(
+    table: Type[IdentifierTable],
+    merchant_refs: list[UUID],
+    *,
+    offboard: Callable[[set[UUID]], Awaitable[dict]],
+) -> None:
+    await table.update({table.status: ResourceStatus.PENDING_DELETION}).where(
+        table.merchant.is_in(merchant_refs),
+        table.txm_status == TXMStatus.ONBOARDED,
+        table.status != ResourceStatus.DELETED,
+    )
+
+    async for refs in _onboarded_identifier_chunks(table, merchant_refs):
+        await offboard(set(refs))
+
+        fields: dict[Column | str, Any] = {
+            table.txm_status: TXMStatus.OFFBOARDED,
+            table.status: ResourceStatus.DELETED,
+        }
+        if table is PrimaryMID:
+            fields[PrimaryMID.location] = None
+
+        await table.update(fields).where(table.pk.is_in(refs))
+
+        if table is SecondaryMID:
+            await SecondaryMIDLocationLink.delete().where(
+                SecondaryMIDLocationLink.secondary_mid.is_in(refs)
+            )
+
+
+async def offboard_and_delete_merchants(merchant_refs: list[UUID]) -> None:
+    """
+    Offboard every onboarded identifier belonging to the given merchants, then
+    delete the merchants and their plans if they are pending deletion.
+    Identifiers are sent to TXM in chunks, so the number of queries depends on
+    the number of chunks rather than the number of merchants or identifiers.
+    """
+    if not merchant_refs:
+        return
+
+    await _offboard_and_delete_identifiers(
+        PrimaryMID, merchant_refs, offboard=txm.offboard_mids
+    )
+    await _offboard_and_delete_identifiers(
+        SecondaryMID, merchant_refs, offboard=txm.offboard_secondary_mids
+    )
+    await _offboard_and_delete_identifiers(
+        PSIMI, merchant_refs, offboard=txm.offboard_psimis
+    )
+
+    await delete_fully_offboarded_merchants(set(merchant_refs))
+
+
+async def offboard_and_delete_plan(plan_ref: UUID) -> None:
+    """
+    Mark every merchant in the plan as pending deletion, then offboard and
+    delete them all at once.
+    """
+    merchants = (
+        await Merchant.update({Merchant.status: ResourceStatus.PENDING_DELETION})
+        .where(
+            Merchant.plan == plan_ref,
+            Merchant.status != ResourceStatus.DELETED,
+        )
+        .returning(Merchant.pk)
+    )
+
+    await offboard_and_delete_merchants([merchant["pk"] for merchant in merchants])
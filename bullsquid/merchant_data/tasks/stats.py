@@ -0,0 +1,50 @@
+"""
+Queue depth and age statistics, used for monitoring and autoscaling workers.
+"""
+
+from pydantic import BaseModel
+from qbert.enums import JobStatus
+from qbert.queue import squash
+from qbert.tables import Job
+
+# A single pass over queued and running jobs. Both the status and
+# scheduled_for columns are indexed, and failed jobs are never read.
+QUEUE_STATS_QUERY = squash(
+    """
+    SELECT
+        message_type,
+        count(*) FILTER (
+            WHERE status = {queued} AND scheduled_for <= now()
+        ) AS pending,
+        count(*) FILTER (
+            WHERE status = {queued} AND scheduled_for > now()
+        ) AS scheduled,
+        count(*) FILTER (WHERE status = {running}) AS running,
+        extract(epoch FROM now() - min(scheduled_for) FILTER (
+            WHERE status = {queued} AND scheduled_for <= now()
+        )) AS oldest_pending_age
+    FROM qbert_job
+    WHERE status IN ({queued}, {running})
+    GROUP BY message_type
+    ORDER BY message_type
+    """.format(queued=int(JobStatus.QUEUED), running=int(JobStatus.RUNNING))
+)
+
+
+class QueueStats(BaseModel):
+    """Queue statistics for a single message type."""
+
+    message_type: str
+    # jobs that are ready to run now.
+    pending: int
+    # jobs waiting for a future scheduled time, e.g. retries and replays.
+    scheduled: int
+    # jobs currently locked by a worker.
+    running: int
+    # seconds since the oldest pending job became ready to run.
+    oldest_pending_age: float | None
+
+
+async def queue_stats() -> list[QueueStats]:
+    """Returns queue statistics for every message type with queued or running jobs."""
+    return [QueueStats(**row) for row in await Job.raw(QUEUE_STATS_QUERY)]
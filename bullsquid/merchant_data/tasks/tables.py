@@ -0,0 +1,20 @@
+"""Task queue table definitions."""
+
+from piccolo.columns import JSONB, UUID, Integer, Text, Timestamptz
+from piccolo.table import Table
+
+
+class DeadLetter(Table):
+    """
+    A job that failed permanently, either because it ran out of attempts or
+    because it raised a non-retryable error. Kept for inspection and replay.
+    """
+
+    pk = UUID(primary_key=True)
+    message_type = Text(required=True)
+    message = JSONB(required=True)
+    error = Text(required=True)
+    failed_attempts = Integer(default=0)
+    created_at = Timestamptz()
+    failed_at = Timestamptz(index=True)
+    replayed_at = Timestamptz(null=True, default=None)
@@ -0,0 +1,91 @@
+"""
+Job timeouts, and a watchdog for jobs that have been locked for too long.
+"""
+
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Coroutine
+
+from loguru import logger
+from qbert.enums import JobStatus
+from qbert.tables import Job
+
+from bullsquid.merchant_data.tasks.metrics import stuck_jobs
+from bullsquid.settings import settings
+
+
+class JobTimeoutError(asyncio.TimeoutError):
+    """Raised when a job runs for longer than its timeout."""
+
+
+def job_timeout(message_type: str) -> timedelta:
+    """Returns the maximum time a job of the given message type may run for."""
+    return settings.worker_job_timeouts.get(message_type, settings.worker_job_timeout)
+
+
+async def run_with_timeout(message_type: str, coro: Coroutine[Any, Any, None]) -> None:
+    """
+    Run a job coroutine, cancelling it and raising JobTimeoutError if it takes
+    longer than the timeout for its message type.
+    """
+    timeout = job_timeout(message_type)
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    try:
+        await asyncio.wait_for(coro, timeout.total_seconds())
+    except asyncio.TimeoutError as ex:
+        # timeouts raised from within the job (e.g. by aiohttp) are passed on as-is.
+        if loop.time() - started_at < timeout.total_seconds():
+            raise
+        raise JobTimeoutError(f"{message_type} job timed out after {timeout}") from ex
+
+
+async def find_stuck_jobs() -> list[dict[str, Any]]:
+    """
+    Returns jobs that have been locked for longer than their timeout plus the
+    watchdog grace period.
+    """
+    now = datetime.now(timezone.utc)
+    shortest_timeout = min(
+        [settings.worker_job_timeout, *settings.worker_job_timeouts.values()]
+    )
+    candidates = await Job.select(Job.id, Job.message_type, Job.updated_at).where(
+        Job.status == JobStatus.RUNNING,
+        Job.updated_at < now - shortest_timeout - settings.worker_watchdog_grace,
+    )
+    return [
+        job
+        for job in candidates
+        if job["updated_at"]
+        < now - job_timeout(job["message_type"]) - settings.worker_watchdog_grace
+    ]
+
+
+async def report_stuck_jobs() -> list[dict[str, Any]]:
+    """Log a warning for each stuck job and update the stuck jobs gauge."""
+    jobs = await find_stuck_jobs()
+
+    stuck_jobs.clear()
+    for message_type, count in Counter(job["message_type"] for job in jobs).items():
+        stuck_jobs.set(count, message_type=message_type)
+
+    for job in jobs:
+        logger.warning(
+            f"{job['message_type']} job {job['id']} has been locked since "
+            f"{job['updated_at'].isoformat()}"
+        )
+
+    return jobs
+
+
+async def run_watchdog() -> None:
+    """Report stuck jobs every worker_watchdog_interval until cancelled."""
+    while True:
+        try:
+            await report_stuck_jobs()
+        except Exception as ex:  # pylint: disable=broad-except
+            # a failed check shouldn't stop the watchdog for good.
+            logger.warning(f"Stuck job check failed: {ex!r}")
+
+        await asyncio.sleep(settings.worker_watchdog_interval.total_seconds())
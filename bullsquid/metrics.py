@@ -0,0 +1,272 @@
+"""
+A small in-process metrics registry that renders the Prometheus text exposition
+format, plus a tiny HTTP server to expose it for scraping.
+"""
+
+import math
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Iterable
+
+from aiohttp import web
+from loguru import logger
+
+LabelValues = tuple[str, ...]
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    math.inf,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric(ABC):
+    """Base class for all metric types."""
+
+    kind = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Iterable[str] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _label_values(self, labels: dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterable[tuple[str, LabelValues, tuple[str, ...], float]]:
+        """
+        Yields (suffix, label values, extra label names & values, value) for each
+        sample in this metric.
+        """
+
+    def render(self) -> str:
+        """Render this metric in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for suffix, values, extra, value in self.samples():
+            names = self.labelnames + extra[::2]
+            all_values = values + extra[1::2]
+            lines.append(
+                f"{self.name}{suffix}{_format_labels(names, all_values)} "
+                f"{_format_value(value)}"
+            )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """A monotonically increasing value."""
+
+    kind = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Iterable[str] = ()
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Increment the counter for the given labels."""
+        if amount < 0:
+            raise ValueError("Counters can only be incremented.")
+        key = self._label_values(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Return the current value for the given labels."""
+        return self._values.get(self._label_values(labels), 0)
+
+    def samples(self) -> Iterable[tuple[str, LabelValues, tuple[str, ...], float]]:
+        for values, value in self._values.items():
+            yield "_total", values, (), value
+
+
+class Gauge(Metric):
+    """A value that can go up and down."""
+
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Iterable[str] = ()
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the gauge to the given value."""
+        self._values[self._label_values(labels)] = value
+
+    def value(self, **labels: str) -> float:
+        """Return the current value for the given labels."""
+        return self._values.get(self._label_values(labels), 0)
+
+    def clear(self) -> None:
+        """Remove all label sets, e.g. before repopulating from a collector."""
+        self._values.clear()
+
+    def samples(self) -> Iterable[tuple[str, LabelValues, tuple[str, ...], float]]:
+        for values, value in self._values.items():
+            yield "", values, (), value
+
+
+class Histogram(Metric):
+    """Samples observations into cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        *,
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(set(buckets) | {math.inf}))
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record an observation for the given labels."""
+        key = self._label_values(labels)
+        counts = self._counts.setdefault(key, [0] * len(self.buckets))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self._sums[key] = self._sums.get(key, 0) + value
+
+    def count(self, **labels: str) -> int:
+        """Return the number of observations for the given labels."""
+        counts = self._counts.get(self._label_values(labels))
+        return counts[-1] if counts else 0
+
+    def samples(self) -> Iterable[tuple[str, LabelValues, tuple[str, ...], float]]:
+        for values, counts in self._counts.items():
+            for bound, count in zip(self.buckets, counts):
+                yield "_bucket", values, ("le", _format_value(bound)), count
+            yield "_sum", values, (), self._sums[values]
+            yield "_count", values, (), counts[-1]
+
+
+Collector = Callable[[], Awaitable[None]]
+
+
+class Registry:
+    """Holds a set of metrics and the collectors that refresh them on scrape."""
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+        self.collectors: list[Collector] = []
+
+    def register(self, metric: Metric) -> None:
+        """Add a metric to the registry. Metric names must be unique."""
+        if metric.name in self.metrics:
+            raise ValueError(f"Duplicate metric name: {metric.name}")
+        self.metrics[metric.name] = metric
+
+    def add_collector(self, collector: Collector) -> None:
+        """
+        Add a coroutine function to be awaited before every render.
+        Collectors are used to refresh gauges from external state.
+        """
+        self.collectors.append(collector)
+
+    async def render(self) -> str:
+        """Run all collectors then render every metric."""
+        for collector in self.collectors:
+            try:
+                await collector()
+            except Exception as ex:  # pylint: disable=broad-except
+                # a broken collector shouldn't take down the whole scrape.
+                logger.warning(f"Metrics collector {collector!r} failed: {ex!r}")
+
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    """Create and register a counter."""
+    metric = Counter(name, documentation, labelnames)
+    REGISTRY.register(metric)
+    return metric
+
+
+def gauge(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+    """Create and register a gauge."""
+    metric = Gauge(name, documentation, labelnames)
+    REGISTRY.register(metric)
+    return metric
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: Iterable[str] = (),
+    *,
+    buckets: Iterable[float] = DEFAULT_BUCKETS,
+) -> Histogram:
+    """Create and register a histogram."""
+    metric = Histogram(name, documentation, labelnames, buckets=buckets)
+    REGISTRY.register(metric)
+    return metric
+
+
+async def metrics_handler(_request: web.Request) -> web.Response:
+    """Serves the contents of the default registry."""
+    return web.Response(
+        text=await REGISTRY.render(),
+        content_type="text/plain",
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+async def serve_metrics(*, host: str = "0.0.0.0", port: int) -> web.AppRunner:
+    """
+    Start serving metrics on the given host and port at /metrics.
+    Returns the app runner, which should be cleaned up on shutdown.
+    """
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
@@ -1,14 +1,26 @@
 """Piccolo ORM configuration."""
 
 from piccolo.conf.apps import AppRegistry
-from piccolo.engine.postgres import PostgresEngine
 
+from bullsquid.engine import RoutingPostgresEngine
 from bullsquid.settings import settings
 
-DB = PostgresEngine(
+CONNECTION_CONFIG = {
+    "command_timeout": settings.database.command_timeout,
+    "statement_cache_size": settings.database.statement_cache_size,
+}
+
+DB = RoutingPostgresEngine(
     config={
         "dsn": settings.database.dsn.format(settings.database.dbname),
+        **CONNECTION_CONFIG,
     },
+    replica_config={
+        "dsn": settings.database.replica_dsn.format(settings.database.dbname),
+        **CONNECTION_CONFIG,
+    }
+    if settings.database.replica_dsn
+    else None,
     log_queries=settings.trace_queries,
 )
 
@@ -5,6 +5,8 @@ from typing import Any, Mapping
 import aiohttp
 from loguru import logger
 
+from bullsquid.settings import settings
+
 
 class ServiceInterface:
     """Base class for all service interfaces."""
@@ -12,6 +14,10 @@ class ServiceInterface:
     def __init__(self, base_url: str) -> None:
         self.base_url = base_url
         self.headers: dict[str, str] = {}
+        self.timeout = aiohttp.ClientTimeout(
+            total=settings.service_request_timeout.total_seconds(),
+            connect=settings.service_connect_timeout.total_seconds(),
+        )
 
     @staticmethod
     def _urljoin(*args: str) -> str:
@@ -28,7 +34,7 @@ class ServiceInterface:
         Keyword arguments are placed into the query string.
         """
         url = self._build_url(path)
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(timeout=self.timeout) as session:
             async with session.get(
                 url, params=kwargs, headers=self.headers
             ) as response:
@@ -44,7 +50,7 @@ class ServiceInterface:
         Perform a POST request. Returns the JSON response.
         """
         url = self._build_url(path)
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(timeout=self.timeout) as session:
             async with session.post(url, json=json, headers=self.headers) as response:
                 if not response.ok:
                     logger.debug(
@@ -2,6 +2,9 @@
 
 from pydantic import BaseModel
 
+from bullsquid.db import PoolStats
+from bullsquid.merchant_data.tasks.stats import QueueStats
+
 
 class ReadinessResultServices(BaseModel):
     """
@@ -18,3 +21,24 @@ class ReadinessResult(BaseModel):
 
     status: str
     services: ReadinessResultServices
+
+
+class QueueResult(BaseModel):
+    """
+    Queue depth check result model.
+    """
+
+    pending: int
+    scheduled: int
+    running: int
+    oldest_pending_age: float | None
+    message_types: list[QueueStats]
+
+
+class PoolResult(BaseModel):
+    """
+    Database connection pool check result model.
+    """
+
+    pool: PoolStats | None
+    replica: PoolStats | None
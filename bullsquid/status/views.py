@@ -7,7 +7,10 @@ from piccolo.apps.migrations.commands.check import (
 )
 from piccolo.engine import engine_finder
 
-from bullsquid.status.models import ReadinessResult
+from bullsquid.db import pool_stats
+from bullsquid.engine import use_primary
+from bullsquid.merchant_data.tasks.stats import queue_stats
+from bullsquid.status.models import PoolResult, QueueResult, ReadinessResult
 
 router = APIRouter()
 
@@ -30,6 +33,11 @@ async def readiness_check() -> dict:
     Readiness check. Returns 200 OK if all required services are reachable,
     the database schema is up to date, and the server is ready to serve requests.
     """
+    with use_primary():
+        return await _check_readiness()
+
+
+async def _check_readiness() -> dict:
     engine = engine_finder()
     if not engine:
         raise HTTPException(
@@ -61,3 +69,34 @@ async def readiness_check() -> dict:
             "postgres": await engine.get_version(),
         },
     }
+
+
+@router.get("/queuez", status_code=status.HTTP_200_OK, response_model=QueueResult)
+async def queue_check(response: Response) -> QueueResult:
+    """
+    Queue depth check. Returns the number of pending, scheduled, and running jobs
+    and the age in seconds of the oldest pending job, both in total and for each
+    message type. Cheap enough to be scraped frequently by an autoscaler.
+    """
+    response.headers["Cache-Control"] = "no-store"
+
+    stats = await queue_stats()
+    ages = [s.oldest_pending_age for s in stats if s.oldest_pending_age is not None]
+    return QueueResult(
+        pending=sum(s.pending for s in stats),
+        scheduled=sum(s.scheduled for s in stats),
+        running=sum(s.running for s in stats),
+        oldest_pending_age=max(ages, default=None),
+        message_types=stats,
+    )
+
+
+@router.get("/poolz", status_code=status.HTTP_200_OK, response_model=PoolResult)
+async def pool_check(response: Response) -> PoolResult:
+    """
+    Database connection pool check. Returns the size of this process's pools
+    for the primary and read replica, and how many of their connections are
+    idle and busy. Either is null if that pool is not open.
+    """
+    response.headers["Cache-Control"] = "no-store"
+    return PoolResult(pool=pool_stats(), replica=pool_stats(replica=True))
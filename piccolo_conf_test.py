@@ -1,11 +1,10 @@
 """Piccolo ORM configuration."""
 
-from piccolo.engine.postgres import PostgresEngine
-
+from bullsquid.engine import RoutingPostgresEngine
 from bullsquid.piccolo_conf import APP_REGISTRY  # noqa: F401
 from bullsquid.settings import settings
 
-DB = PostgresEngine(
+DB = RoutingPostgresEngine(
     config={
         "dsn": settings.database.dsn.format(f"{settings.database.dbname}_test"),
     },
@@ -0,0 +1,264 @@
+"""
+Show how Postgres plans the hot merchant data queries.
+
+Run this before and after applying index migrations to compare plans. The seed
+option creates a plan with a single large merchant first, so that comparisons
+are meaningful on an otherwise empty development database.
+
+Usage:
+    query-plans.py [--seed=<n>] [--generic] [--verbose]
+
+Options:
+    --seed=<n>  Seed a merchant with n locations, MIDs, and comments first.
+    --generic   Explain generic plans instead of plans for the given parameters.
+    --verbose   Print the full plan for each query, not just a summary.
+"""
+
+import asyncio
+import json
+from typing import Any
+from uuid import UUID
+
+import asyncpg
+from docopt import docopt
+from piccolo.query import Objects, Select
+
+from bullsquid.db import paginate
+from bullsquid.merchant_data.locations.db import available_primary_mids_query
+from bullsquid.merchant_data.search.db import SEARCH_QUERY, search_params
+from bullsquid.settings import settings
+
+SEED_QUERIES = [
+    "INSERT INTO payment_scheme (slug) VALUES ('visa') ON CONFLICT DO NOTHING",
+    """
+    INSERT INTO plan (name) VALUES ('query plans ' || gen_random_uuid())
+    RETURNING pk
+    """,
+    """
+    INSERT INTO merchant (name, plan) VALUES ('query plans ' || gen_random_uuid(), $1)
+    RETURNING pk
+    """,
+    """
+    INSERT INTO location (location_id, name, merchant, status, created)
+    SELECT
+        'qp-' || i, 'Location ' || i, $1,
+        CASE WHEN i % 10 = 0 THEN 'deleted' ELSE 'active' END,
+        now() - i * interval '1 minute'
+    FROM generate_series(1, $2) AS i
+    """,
+    """
+    INSERT INTO primary_mid (mid, payment_scheme, merchant, status, created)
+    SELECT
+        'qp-' || gen_random_uuid(), 'visa', $1,
+        CASE WHEN i % 10 = 0 THEN 'deleted' ELSE 'active' END,
+        now() - i * interval '1 minute'
+    FROM generate_series(1, $2) AS i
+    """,
+    """
+    INSERT INTO secondary_mid (secondary_mid, payment_scheme, merchant, created)
+    SELECT 'qp-' || gen_random_uuid(), 'visa', $1, now() - i * interval '1 minute'
+    FROM generate_series(1, $2) AS i
+    """,
+    """
+    INSERT INTO comment (
+        text, owner, owner_type, subjects, subject_type, created_by, created_at
+    )
+    SELECT
+        'Comment ' || i, $1, 'merchant', array[location.pk], 'location', 'query-plans',
+        now() - i * interval '1 minute'
+    FROM generate_series(1, $2) AS i
+    JOIN location ON location.location_id = 'qp-' || i AND location.merchant = $1
+    """,
+]
+
+# each query is run against the merchant with the most primary MIDs.
+HOT_QUERIES = {
+    "list primary MIDs": """
+        SELECT * FROM primary_mid
+        WHERE merchant = $1 AND status <> 'deleted'
+        ORDER BY created DESC LIMIT 50
+    """,
+    "list secondary MIDs": """
+        SELECT * FROM secondary_mid
+        WHERE merchant = $1 AND status <> 'deleted'
+        ORDER BY created DESC LIMIT 50
+    """,
+    "list PSIMIs": """
+        SELECT * FROM psimi
+        WHERE merchant = $1 AND status <> 'deleted'
+        ORDER BY created DESC LIMIT 50
+    """,
+    "list locations": """
+        SELECT * FROM location
+        WHERE merchant = $1 AND parent IS NULL AND status <> 'deleted'
+        ORDER BY created DESC LIMIT 50
+    """,
+    "list sub-locations": """
+        SELECT * FROM location
+        WHERE parent = (SELECT pk FROM location WHERE merchant = $1 LIMIT 1)
+            AND status <> 'deleted'
+        ORDER BY created DESC LIMIT 50
+    """,
+    "duplicate MID check": """
+        SELECT EXISTS (
+            SELECT FROM primary_mid
+            WHERE payment_scheme = 'visa'
+                AND mid = ANY (SELECT mid FROM primary_mid WHERE merchant = $1 LIMIT 5)
+        )
+    """,
+    "location ID uniqueness check": """
+        SELECT EXISTS (
+            SELECT FROM location
+            JOIN merchant ON merchant.pk = location.merchant
+            WHERE merchant.plan = (SELECT plan FROM merchant WHERE pk = $1)
+                AND location.location_id = 'qp-1'
+        )
+    """,
+    "comments by owner": """
+        SELECT * FROM comment
+        WHERE owner = $1 AND parent IS NULL
+        ORDER BY created_at DESC LIMIT 50
+    """,
+    "comments by subject": """
+        SELECT * FROM comment
+        WHERE subjects @> array[(SELECT pk FROM location WHERE merchant = $1 LIMIT 1)]
+            AND parent IS NULL
+        ORDER BY created_at DESC LIMIT 50
+    """,
+}
+
+
+def positional(query: str) -> str:
+    """Numbers the {} placeholders of a piccolo raw query for asyncpg."""
+    return query.format(*(f"${i}" for i in range(1, query.count("{}") + 1)))
+
+
+def compiled(query: Select | Objects) -> tuple[str, list[Any]]:
+    """Compiles a piccolo query into the SQL and parameters it sends."""
+    (querystring,) = query.querystrings
+    sql, params = querystring.compile_string(engine_type="postgres")
+    return sql, list(params)
+
+
+def app_queries(
+    plan_ref: UUID, merchant_ref: UUID, location_ref: UUID
+) -> dict[str, tuple[str, list[Any]]]:
+    """
+    Queries that the app builds itself, with the parameters it would send, so
+    that their plans match the ones the app gets.
+    """
+    return {
+        "available MIDs search": compiled(
+            paginate(
+                available_primary_mids_query(
+                    merchant_ref,
+                    location_ref,
+                    mid_prefix="qp-a",
+                    payment_scheme_slug=None,
+                ),
+                n=50,
+                p=1,
+            )
+        ),
+        "search": (
+            positional(SEARCH_QUERY),
+            search_params("qp-1", plan_ref=plan_ref, limit=50, offset=0),
+        ),
+    }
+
+
+async def seed(conn: asyncpg.Connection, n: int) -> UUID:
+    """Create a plan with one merchant that has n of each resource."""
+    payment_scheme, plan, merchant, *resources = SEED_QUERIES
+    async with conn.transaction():
+        await conn.execute(payment_scheme)
+        plan_ref = await conn.fetchval(plan)
+        merchant_ref = await conn.fetchval(merchant, plan_ref)
+        for query in resources:
+            await conn.execute(query, merchant_ref, n)
+    await conn.execute("ANALYZE")
+    return merchant_ref
+
+
+def scans(node: dict[str, Any]) -> list[str]:
+    """Returns a description of each scan in the given plan node and its children."""
+    found = []
+    if "Scan" in node["Node Type"]:
+        found.append(
+            f"{node['Node Type']} on {node.get('Relation Name', '?')}"
+            + (f" using {node['Index Name']}" if "Index Name" in node else "")
+        )
+    for child in node.get("Plans", []):
+        found.extend(scans(child))
+    return found
+
+
+async def explain(
+    conn: asyncpg.Connection, query: str, params: list[Any], *, generic: bool
+) -> dict[str, Any]:
+    """
+    Runs EXPLAIN ANALYZE on the query. Postgres plans a parameterised EXPLAIN
+    with the values inlined, so a generic plan (the one a cached prepared
+    statement may switch to) needs an explicit PREPARE and EXECUTE. EXECUTE
+    only takes literals, which postgres quotes for us.
+    """
+    explain = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)"
+    if not generic:
+        (plan,) = json.loads(await conn.fetchval(f"{explain} {query}", *params))
+        return plan
+
+    literals = [
+        await conn.fetchval("SELECT quote_nullable($1::text)", str(param))
+        for param in params
+    ]
+    async with conn.transaction():
+        await conn.execute("SET LOCAL plan_cache_mode = force_generic_plan")
+        await conn.execute(f"PREPARE explained AS {query}")
+        try:
+            (plan,) = json.loads(
+                await conn.fetchval(
+                    f"{explain} EXECUTE explained({', '.join(literals)})"
+                )
+            )
+        finally:
+            await conn.execute("DEALLOCATE explained")
+    return plan
+
+
+async def main(args: dict[str, Any]) -> None:
+    """Seed the database if requested, then explain each hot query."""
+    conn = await asyncpg.connect(settings.database.dsn.format(settings.database.dbname))
+    try:
+        if args["--seed"]:
+            merchant_ref = await seed(conn, int(args["--seed"]))
+        else:
+            merchant_ref = await conn.fetchval(
+                "SELECT merchant FROM primary_mid GROUP BY merchant "
+                "ORDER BY count(*) DESC LIMIT 1"
+            )
+        if merchant_ref is None:
+            raise SystemExit("No merchants with primary MIDs found, try --seed.")
+
+        plan_ref = await conn.fetchval(
+            "SELECT plan FROM merchant WHERE pk = $1", merchant_ref
+        )
+        location_ref = await conn.fetchval(
+            "SELECT pk FROM location WHERE merchant = $1 LIMIT 1", merchant_ref
+        )
+        queries = {
+            **{name: (query, [merchant_ref]) for name, query in HOT_QUERIES.items()},
+            **app_queries(plan_ref, merchant_ref, location_ref),
+        }
+        for name, (query, params) in queries.items():
+            plan = await explain(conn, query, params, generic=args["--generic"])
+            print(f"{name}: {plan['Execution Time']:.2f}ms")
+            for scan in scans(plan["Plan"]):
+                print(f"    {scan}")
+            if args["--verbose"]:
+                print(json.dumps(plan["Plan"], indent=2))
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(docopt(__doc__)))
@@ -13,7 +13,11 @@ from aioresponses import aioresponses  # noqa: E402
 from asyncpg import DuplicateTableError  # noqa: E402
 from fastapi.testclient import TestClient  # noqa: E402
 from piccolo.conf.apps import Finder  # noqa: E402
-from piccolo.table import create_db_tables_sync, drop_db_tables_sync  # noqa: E402
+from piccolo.table import (  # noqa: E402
+    Table,
+    create_db_tables_sync,
+    drop_db_tables_sync,
+)
 from piccolo.utils.warnings import (  # noqa: E402
     colored_warning,
 )
@@ -49,6 +53,13 @@ def database() -> Generator[None, None, None]:
             "\n\n"
         )
         raise
+
+    # indexes that piccolo cannot declare on the table classes, and which are
+    # added by migrations instead.
+    Table.raw(
+        "CREATE UNIQUE INDEX unique_location_secondary_mid "
+        "ON secondary_mid_location_link (location, secondary_mid)"
+    ).run_sync()
     yield
     drop_db_tables_sync(*tables)
 
@@ -0,0 +1,143 @@
+"""Tests for the shared rate limiter."""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from aioresponses import aioresponses
+from fastapi import status
+
+from bullsquid.merchant_data.primary_mids.tables import PrimaryMID
+from bullsquid.merchant_data.service.rate_limit import (
+    RateLimited,
+    RateLimiter,
+    TokenBucket,
+)
+from bullsquid.merchant_data.service.tables import RateLimitBucket
+from bullsquid.merchant_data.service.txm import TXMServiceInterface
+from tests.helpers import Factory
+
+
+def test_invalid_rate() -> None:
+    with pytest.raises(ValueError):
+        TokenBucket("test", rate=0)
+
+
+async def test_take_within_capacity(database: None) -> None:
+    bucket = TokenBucket("test", rate=10)
+    for _ in range(10):
+        assert await bucket.take() == 0
+
+
+async def test_take_beyond_capacity(database: None) -> None:
+    bucket = TokenBucket("test", rate=10)
+    assert await bucket.take(10) == 0
+
+    # the bucket is empty, so five more tokens takes half a second to refill.
+    assert await bucket.take(5) == pytest.approx(0.5, abs=0.05)
+    # the next caller waits behind the first.
+    assert await bucket.take(5) == pytest.approx(1.0, abs=0.05)
+
+
+async def test_buckets_are_shared(database: None) -> None:
+    assert await TokenBucket("test", rate=10).take(10) == 0
+    assert await TokenBucket("test", rate=10).take(10) > 0
+    assert await TokenBucket("other", rate=10).take(10) == 0
+
+
+async def test_refill_is_capped(database: None) -> None:
+    bucket = TokenBucket("test", rate=10, capacity=20)
+    await bucket.take(20)
+
+    # pretend the bucket was last used an hour ago.
+    await RateLimitBucket.update(
+        {RateLimitBucket.updated_at: datetime.now(timezone.utc) - timedelta(hours=1)}
+    ).where(RateLimitBucket.name == "test")
+
+    assert await bucket.take(20) == 0
+    assert await bucket.take(1) > 0
+
+
+async def test_rate_limiter_waits(database: None) -> None:
+    limiter = RateLimiter("test", requests_per_second=100, items_per_second=10)
+
+    with patch(
+        "bullsquid.merchant_data.service.rate_limit.asyncio.sleep"
+    ) as mock_sleep:
+        await limiter.acquire(items=10)
+        mock_sleep.assert_not_awaited()
+
+        await limiter.acquire(items=10)
+        mock_sleep.assert_awaited_once()
+        assert mock_sleep.await_args is not None
+        assert mock_sleep.await_args.args[0] == pytest.approx(1.0, abs=0.05)
+
+
+async def bucket_tokens(name: str) -> float:
+    bucket = await RateLimitBucket.objects().get(RateLimitBucket.name == name)
+    assert bucket is not None
+    return bucket.tokens
+
+
+async def test_take_beyond_max_wait(database: None) -> None:
+    bucket = TokenBucket("test", rate=10)
+    assert await bucket.take(15, max_wait=1) == pytest.approx(0.5, abs=0.05)
+
+    # another ten tokens would mean waiting 1.5s, so none are taken.
+    with pytest.raises(RateLimited):
+        await bucket.take(10, max_wait=1)
+    assert await bucket_tokens("test") == pytest.approx(-5, abs=0.5)
+
+
+async def test_rate_limiter_max_wait(database: None) -> None:
+    limiter = RateLimiter(
+        "test",
+        requests_per_second=10,
+        items_per_second=10,
+        max_wait=timedelta(seconds=1),
+    )
+    await limiter.acquire(items=10)
+
+    with pytest.raises(RateLimited):
+        await limiter.acquire(items=20)
+    # the request token taken before the items were refused is given back.
+    assert await bucket_tokens("test:requests") == pytest.approx(9, abs=0.5)
+
+
+async def test_rate_limiter_refunds_cancelled_wait(database: None) -> None:
+    limiter = RateLimiter("test", requests_per_second=None, items_per_second=10)
+    await limiter.acquire(items=10)
+
+    waiting = asyncio.create_task(limiter.acquire(items=10))
+    await asyncio.sleep(0.1)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    # without the refund, the bucket would be ten tokens in debt.
+    assert await bucket_tokens("test:items") == pytest.approx(0, abs=0.5)
+
+
+async def test_rate_limiter_disabled(database: None) -> None:
+    limiter = RateLimiter("test", requests_per_second=None, items_per_second=None)
+    await limiter.acquire(items=1_000_000)
+    assert await RateLimitBucket.count() == 0
+
+
+async def test_txm_calls_are_rate_limited(
+    primary_mid_factory: Factory[PrimaryMID],
+    mock_responses: aioresponses,
+) -> None:
+    primary_mids = [await primary_mid_factory() for _ in range(3)]
+    mock_responses.post(
+        "https://testbink.com/txm/identifiers",
+        status=status.HTTP_200_OK,
+        payload={"test": "success"},
+    )
+    txm = TXMServiceInterface("https://testbink.com")
+
+    with patch.object(txm.rate_limiter, "acquire", new_callable=AsyncMock) as acquire:
+        await txm.onboard_mids({primary_mid.pk for primary_mid in primary_mids})
+
+    acquire.assert_awaited_once_with(items=3)
@@ -12,6 +12,7 @@ from bullsquid.merchant_data.service.txm import (
     TXMServiceInterface,
     create_txm_service_interface,
 )
+from bullsquid.settings import settings
 from tests.helpers import Factory
 
 
@@ -118,3 +119,9 @@ def test_mock_interface() -> None:
     with patch("bullsquid.merchant_data.service.txm.settings.txm.base_url", None):
         txm = create_txm_service_interface()
         assert isinstance(txm, MagicMock)
+
+
+def test_request_timeout() -> None:
+    txm = TXMServiceInterface("https://testbink.com")
+    assert txm.timeout.total == settings.service_request_timeout.total_seconds()
+    assert txm.timeout.connect == settings.service_connect_timeout.total_seconds()
@@ -7,11 +7,16 @@ import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
 
+from bullsquid.merchant_data.csv_upload.models import LocationFileRecord
 from bullsquid.merchant_data.locations.tables import Location
 from bullsquid.merchant_data.merchants.tables import Merchant
 from bullsquid.merchant_data.plans.tables import Plan
 from bullsquid.merchant_data.primary_mids.tables import PrimaryMID
 from bullsquid.merchant_data.tasks import run_worker
+from bullsquid.merchant_data.tasks.import_locations import (
+    InvalidParent,
+    import_location,
+)
 from bullsquid.merchant_data.tasks.import_merchants import (
     InvalidRecord,
     import_merchant_file_record,
@@ -492,6 +497,37 @@ async def test_process_invalid_merchant_file_record(
         )
 
 
+async def test_import_location_missing_parent(
+    merchant_factory: Factory[Merchant],
+) -> None:
+    """Sub-location records need their parent to be imported first."""
+    merchant = await merchant_factory()
+
+    with pytest.raises(InvalidParent):
+        await import_location(
+            LocationFileRecord(
+                merchant_name=None,
+                parent_name="Main Store",
+                name="Annex",
+                location_id="annex-1",
+                merchant_internal_id="",
+                is_physical=False,
+                address_line_1="",
+                address_line_2="",
+                town_city="",
+                county="",
+                country="",
+                postcode="",
+                visa_mids="",
+                amex_mids="",
+                mastercard_mids="",
+                visa_secondary_mids="",
+                mastercard_secondary_mids="",
+            ),
+            merchant=merchant,
+        )
+
+
 @pytest.mark.usefixtures("default_payment_schemes")
 async def test_load_locations_with_merchant_ref_file(
     test_client: TestClient,
@@ -0,0 +1,183 @@
+"""Tests for job retries and the dead letter store."""
+
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
+
+import aiohttp
+import pytest
+from qbert.enums import JobStatus
+from qbert.tables import Job
+
+from bullsquid.merchant_data.service.rate_limit import RateLimited
+from bullsquid.merchant_data.tasks import OnboardPrimaryMIDs, OnboardPSIMIs, queue
+from bullsquid.merchant_data.tasks.dead_letters import (
+    count_dead_letters,
+    fail_job,
+    is_retryable,
+    replay_dead_letters,
+)
+from bullsquid.merchant_data.tasks.metrics import collect_dead_letters, dead_letters
+from bullsquid.merchant_data.tasks.tables import DeadLetter
+
+
+def response_error(status: int) -> aiohttp.ClientResponseError:
+    return aiohttp.ClientResponseError(
+        request_info=None,  # type: ignore
+        history=(),
+        status=status,
+    )
+
+
+@pytest.mark.parametrize(
+    "error,retryable",
+    [
+        (aiohttp.ServerDisconnectedError(), True),
+        (TimeoutError(), True),
+        (ConnectionResetError(), True),
+        (response_error(503), True),
+        (response_error(429), True),
+        (RateLimited(), True),
+        (response_error(400), False),
+        (response_error(404), False),
+        (ValueError(), False),
+        (Exception(), False),
+    ],
+)
+def test_is_retryable(error: BaseException, retryable: bool) -> None:
+    assert is_retryable(error) == retryable
+
+
+async def push_job(message: OnboardPrimaryMIDs) -> UUID:
+    await queue.push(message)
+    job = await Job.objects().first()
+    assert job is not None
+    return job.id
+
+
+async def test_fail_job_retryable_backs_off(database: None) -> None:
+    job_id = await push_job(OnboardPrimaryMIDs(mid_refs=[]))
+
+    delays = []
+    for attempt in range(1, 4):
+        before = datetime.now(timezone.utc)
+        assert await fail_job(job_id, TimeoutError(), max_attempts=5)
+
+        job = await Job.objects().get(Job.id == job_id)
+        assert job is not None
+        assert job.failed_attempts == attempt
+        assert job.status == JobStatus.QUEUED
+        delays.append(job.scheduled_for - before)
+
+    assert delays[0] < delays[1] < delays[2]
+
+
+async def test_fail_job_retryable_out_of_attempts(database: None) -> None:
+    job_id = await push_job(OnboardPrimaryMIDs(mid_refs=[]))
+
+    assert await fail_job(job_id, TimeoutError(), max_attempts=2)
+    assert not await fail_job(job_id, TimeoutError(), max_attempts=2)
+
+    assert await Job.count() == 0
+    dead_letter = await DeadLetter.objects().get(DeadLetter.pk == job_id)
+    assert dead_letter is not None
+    assert dead_letter.failed_attempts == 2
+    assert dead_letter.message_type == OnboardPrimaryMIDs.__name__
+    assert "TimeoutError" in dead_letter.error
+
+
+async def test_fail_job_not_retryable(database: None) -> None:
+    job_id = await push_job(OnboardPrimaryMIDs(mid_refs=[]))
+
+    assert not await fail_job(job_id, ValueError("bad data"), max_attempts=5)
+
+    assert await Job.count() == 0
+    dead_letter = await DeadLetter.objects().get(DeadLetter.pk == job_id)
+    assert dead_letter is not None
+    assert dead_letter.failed_attempts == 1
+    assert "bad data" in dead_letter.error
+
+
+async def dead_letter_jobs(messages: list[OnboardPrimaryMIDs | OnboardPSIMIs]) -> None:
+    for message in messages:
+        await queue.push(message)
+    for job in await Job.objects():
+        await fail_job(job.id, ValueError(), max_attempts=1)
+
+
+async def test_replay_dead_letters_in_batches(database: None) -> None:
+    await dead_letter_jobs([OnboardPrimaryMIDs(mid_refs=[]) for _ in range(5)])
+
+    replayed = await replay_dead_letters(
+        batch_size=2, batch_interval=timedelta(minutes=1)
+    )
+
+    assert replayed == 5
+    assert await DeadLetter.count().where(DeadLetter.replayed_at.is_null()) == 0
+
+    jobs = await Job.objects()
+    assert len(jobs) == 5
+    assert all(job.failed_attempts == 0 for job in jobs)
+    assert all(job.status == JobStatus.QUEUED for job in jobs)
+    # five jobs in batches of two gives three distinct schedules.
+    assert len({job.scheduled_for for job in jobs}) == 3
+
+
+async def test_replay_dead_letters_in_failure_order(database: None) -> None:
+    failed_at = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    mid_refs = [uuid4() for _ in range(10)]
+    for i in random.sample(range(10), 10):
+        await DeadLetter.insert(
+            DeadLetter(
+                message_type=OnboardPrimaryMIDs.__name__,
+                message=OnboardPrimaryMIDs(mid_refs=[mid_refs[i]]).dict(),
+                failed_at=failed_at + timedelta(minutes=i),
+            )
+        )
+
+    assert await replay_dead_letters(batch_size=10) == 10
+
+    # the worker runs pulled jobs in id order.
+    jobs = sorted(await Job.objects(), key=lambda job: job.id)
+    assert [UUID(json.loads(job.message)["mid_refs"][0]) for job in jobs] == mid_refs
+
+
+async def test_replay_dead_letters_filters(database: None) -> None:
+    await dead_letter_jobs(
+        [OnboardPrimaryMIDs(mid_refs=[]), OnboardPSIMIs(psimi_refs=[])]
+    )
+
+    assert (
+        await replay_dead_letters(message_type=OnboardPSIMIs.__name__, batch_size=10)
+        == 1
+    )
+    assert (
+        await replay_dead_letters(
+            since=datetime.now(timezone.utc) + timedelta(hours=1), batch_size=10
+        )
+        == 0
+    )
+    assert (
+        await replay_dead_letters(
+            until=datetime.now(timezone.utc) - timedelta(hours=1), batch_size=10
+        )
+        == 0
+    )
+
+    jobs = await Job.objects()
+    assert [job.message_type for job in jobs] == [OnboardPSIMIs.__name__]
+    assert await count_dead_letters() == {OnboardPrimaryMIDs.__name__: 1}
+
+
+async def test_replay_dead_letters_invalid_batch_size(database: None) -> None:
+    with pytest.raises(ValueError):
+        await replay_dead_letters(batch_size=0)
+
+
+async def test_collect_dead_letters(database: None) -> None:
+    await dead_letter_jobs([OnboardPrimaryMIDs(mid_refs=[]) for _ in range(2)])
+
+    await collect_dead_letters()
+
+    assert dead_letters.value(message_type=OnboardPrimaryMIDs.__name__) == 2
@@ -0,0 +1,285 @@
+import asyncio
+import csv
+import io
+import json
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from piccolo.engine import engine_finder
+
+from bullsquid.merchant_data.csv_upload.file_handling import csv_model_reader
+from bullsquid.merchant_data.csv_upload.models import LocationFileRecord
+from bullsquid.merchant_data.enums import ResourceStatus
+from bullsquid.merchant_data.locations.tables import Location
+from bullsquid.merchant_data.merchants.tables import Merchant
+from bullsquid.merchant_data.payment_schemes.tables import PaymentScheme
+from bullsquid.merchant_data.plans.tables import Plan
+from bullsquid.merchant_data.primary_mids.tables import PrimaryMID
+from bullsquid.merchant_data.secondary_mid_location_links.tables import (
+    SecondaryMIDLocationLink,
+)
+from bullsquid.merchant_data.secondary_mids.tables import SecondaryMID
+from bullsquid.merchant_data.tasks import run_worker
+from tests.helpers import Factory, assert_is_not_found_error
+
+
+async def test_export_locations(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    primary_mid_factory: Factory[PrimaryMID],
+    secondary_mid_factory: Factory[SecondaryMID],
+    secondary_mid_location_link_factory: Factory[SecondaryMIDLocationLink],
+    default_payment_schemes: list[PaymentScheme],
+    test_client: TestClient,
+) -> None:
+    visa, mastercard, amex = (
+        next(scheme for scheme in default_payment_schemes if scheme.slug == slug)
+        for slug in ("visa", "mastercard", "amex")
+    )
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan, name="Export Merchant")
+    location = await location_factory(
+        merchant=merchant,
+        name="Main Store",
+        location_id="store-1",
+        merchant_internal_id="internal-1",
+        is_physical_location=True,
+        address_line_1="1 Test Street",
+        address_line_2=None,
+        town_city="Testville",
+        county=None,
+        country="UK",
+        postcode="T35 7ST",
+    )
+    resp = test_client.post(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/locations/{location.pk}"
+        "/sub_locations",
+        json={"name": "Annex", "is_physical_location": False},
+    )
+    assert resp.status_code == status.HTTP_201_CREATED, resp.text
+    sub_location = (
+        await Location.select(Location.location_id)
+        .where(Location.parent == location)
+        .first()
+    )
+    assert sub_location is not None
+    sub_location_id = sub_location["location_id"]
+    await location_factory(merchant=merchant, status=ResourceStatus.DELETED)
+    await location_factory()
+    for mid, scheme in (("2", visa), ("1", visa), ("3", amex)):
+        await primary_mid_factory(
+            merchant=merchant, location=location, mid=mid, payment_scheme=scheme
+        )
+    await primary_mid_factory(
+        merchant=merchant,
+        location=location,
+        payment_scheme=mastercard,
+        status=ResourceStatus.DELETED,
+    )
+    await secondary_mid_location_link_factory(
+        location=location,
+        secondary_mid=await secondary_mid_factory(
+            merchant=merchant, secondary_mid="s1", payment_scheme=mastercard
+        ),
+    )
+
+    resp = test_client.get(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/export/locations"
+    )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.headers["content-type"].startswith("text/csv")
+    assert "attachment" in resp.headers["content-disposition"]
+
+    header, *_ = csv.reader(io.StringIO(resp.text))
+    assert header == list(LocationFileRecord.__fields__)
+
+    # the export can be read back in by the CSV import.
+    records = list(
+        csv_model_reader(io.BytesIO(resp.content), row_model=LocationFileRecord)
+    )
+    assert records == [
+        LocationFileRecord(
+            merchant_name="Export Merchant",
+            parent_name=None,
+            name="Main Store",
+            location_id="store-1",
+            merchant_internal_id="internal-1",
+            is_physical=True,
+            address_line_1="1 Test Street",
+            address_line_2=None,
+            town_city="Testville",
+            county=None,
+            country="UK",
+            postcode="T35 7ST",
+            visa_mids="1 2",
+            amex_mids="3",
+            mastercard_mids="",
+            visa_secondary_mids="",
+            mastercard_secondary_mids="s1",
+        ),
+        LocationFileRecord(
+            merchant_name="Export Merchant",
+            parent_name="Main Store",
+            name="Annex",
+            location_id=sub_location_id,
+            merchant_internal_id=None,
+            is_physical=False,
+            address_line_1=None,
+            address_line_2=None,
+            town_city=None,
+            county=None,
+            country=None,
+            postcode=None,
+            visa_mids="",
+            amex_mids="",
+            mastercard_mids="",
+            visa_secondary_mids="",
+            mastercard_secondary_mids="",
+        ),
+    ]
+
+
+@pytest.mark.usefixtures("default_payment_schemes")
+async def test_export_locations_round_trip(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    location = await location_factory(
+        merchant=merchant,
+        name="Main Store",
+        location_id="store-1",
+        merchant_internal_id=None,
+        is_physical_location=False,
+    )
+    resp = test_client.post(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/locations/{location.pk}"
+        "/sub_locations",
+        json={"name": "Annex", "is_physical_location": False},
+    )
+    assert resp.status_code == status.HTTP_201_CREATED, resp.text
+
+    resp = test_client.get(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/export/locations"
+    )
+    assert resp.status_code == status.HTTP_200_OK
+
+    # merchant names are unique, so move the exported one out of the way.
+    await Merchant.update({Merchant.name: f"{merchant.name} (old)"}).where(
+        Merchant.pk == merchant.pk
+    )
+    target_plan = await plan_factory()
+    target = await merchant_factory(plan=target_plan, name=merchant.name)
+    resp = test_client.post(
+        "/api/v1/plans/csv_upload",
+        files={"file": ("locations.csv", resp.content)},
+        data={
+            "file_type": "locations",
+            "plan_ref": str(target_plan.pk),
+            "merchant_ref": str(target.pk),
+        },
+    )
+    assert resp.status_code == status.HTTP_202_ACCEPTED, resp.text
+    await run_worker(burst=True)
+
+    imported = await Location.objects().where(Location.merchant == target)
+    parent = next(location for location in imported if location.parent is None)
+    child = next(location for location in imported if location.parent is not None)
+    assert (parent.name, parent.location_id) == ("Main Store", "store-1")
+    assert (child.name, child.parent) == ("Annex", parent.pk)
+
+
+async def test_export_identifiers_ndjson(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    primary_mid_factory: Factory[PrimaryMID],
+    default_payment_schemes: list[PaymentScheme],
+    test_client: TestClient,
+) -> None:
+    visa = next(scheme for scheme in default_payment_schemes if scheme.slug == "visa")
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan, name="Export Merchant")
+    location = await location_factory(merchant=merchant, location_id="store-1")
+    await location_factory(merchant=merchant)
+    await primary_mid_factory(
+        merchant=merchant, location=location, mid="1", payment_scheme=visa
+    )
+    await primary_mid_factory(merchant=merchant, location=None)
+
+    resp = test_client.get(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/export/identifiers",
+        params={"format": "ndjson"},
+    )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in resp.text.splitlines()] == [
+        {
+            "merchant_name": "Export Merchant",
+            "location_id": "store-1",
+            "visa_mids": "1",
+            "amex_mids": "",
+            "mastercard_mids": "",
+            "visa_secondary_mids": "",
+            "mastercard_secondary_mids": "",
+        }
+    ]
+
+
+async def test_export_empty_merchant(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+
+    resp = test_client.get(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/export/identifiers"
+    )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.text.splitlines() == [
+        "merchant_name,location_id,visa_mids,amex_mids,mastercard_mids,"
+        "visa_secondary_mids,mastercard_secondary_mids"
+    ]
+
+
+async def test_export_with_invalid_merchant(
+    plan_factory: Factory[Plan],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+
+    resp = test_client.get(
+        f"/api/v1/plans/{plan.pk}/merchants/{uuid4()}/export/locations"
+    )
+
+    assert_is_not_found_error(resp, loc=["path", "merchant_ref"])
+
+
+async def test_export_when_streams_are_busy(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+
+    # no stream slots are free, so the export fails before it starts streaming.
+    with patch.object(engine_finder(), "_streams", asyncio.Semaphore(0)):
+        resp = test_client.get(
+            f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/export/locations"
+        )
+
+    assert resp.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert resp.json()["detail"][0]["type"] == "busy_error"
@@ -0,0 +1,68 @@
+"""Tests for job queue housekeeping."""
+
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from qbert.enums import JobStatus
+from qbert.tables import Job
+
+from bullsquid.merchant_data.tasks import OnboardPrimaryMIDs, queue
+from bullsquid.merchant_data.tasks.housekeeping import (
+    ARCHIVED_JOB_ERROR,
+    archive_failed_jobs,
+    purge_dead_letters,
+    run_housekeeping,
+    table_stats,
+)
+from bullsquid.merchant_data.tasks.metrics import collect_table_stats, table_size_bytes
+from bullsquid.merchant_data.tasks.tables import DeadLetter
+
+
+async def test_archive_failed_jobs(database: None) -> None:
+    for _ in range(3):
+        await queue.push(OnboardPrimaryMIDs(mid_refs=[]))
+    jobs = await Job.objects()
+    failed = [job.id for job in jobs[:2]]
+    await Job.update({Job.status: JobStatus.FAILED}).where(Job.id.is_in(failed))
+
+    assert await archive_failed_jobs(batch_size=1) == 2
+
+    assert await Job.select(Job.id).output(as_list=True) == [jobs[2].id]
+    dead_letters = await DeadLetter.objects()
+    assert {dead_letter.pk for dead_letter in dead_letters} == set(failed)
+    assert all(dead_letter.error == ARCHIVED_JOB_ERROR for dead_letter in dead_letters)
+
+
+async def test_purge_dead_letters(database: None) -> None:
+    now = datetime.now(timezone.utc)
+    for days_ago in (1, 40, 50, 60):
+        await DeadLetter(
+            pk=uuid4(),
+            message_type=OnboardPrimaryMIDs.__name__,
+            message={"mid_refs": []},
+            error="oh no",
+            failed_at=now - timedelta(days=days_ago),
+        ).save()
+
+    assert (
+        await purge_dead_letters(older_than=now - timedelta(days=30), batch_size=2) == 3
+    )
+    assert await DeadLetter.count() == 1
+
+
+async def test_table_stats(database: None) -> None:
+    stats = await table_stats()
+    assert [table.table for table in stats] == ["dead_letter", "qbert_job"]
+
+    await collect_table_stats()
+    assert table_size_bytes.value(table="qbert_job", kind="table") >= 0
+
+
+async def test_run_housekeeping(database: None) -> None:
+    await queue.push(OnboardPrimaryMIDs(mid_refs=[]))
+    await Job.update({Job.status: JobStatus.FAILED}, force=True)
+
+    await run_housekeeping()
+
+    assert await Job.count() == 0
+    assert await DeadLetter.count() == 1
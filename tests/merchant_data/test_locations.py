@@ -1,11 +1,16 @@
+from datetime import datetime
 from typing import Any
 from uuid import uuid4
 
 from fastapi import status
 from fastapi.testclient import TestClient
 
+from bullsquid.engine import record_queries
+from bullsquid.merchant_data.enums import ResourceStatus
+from bullsquid.merchant_data.locations.db import list_location_tree, list_locations
 from bullsquid.merchant_data.locations.tables import Location
 from bullsquid.merchant_data.merchants.tables import Merchant
+from bullsquid.merchant_data.payment_schemes.tables import PaymentScheme
 from bullsquid.merchant_data.plans.tables import Plan
 from bullsquid.merchant_data.primary_mids.tables import PrimaryMID
 from bullsquid.merchant_data.secondary_mid_location_links.tables import (
@@ -54,6 +59,8 @@ async def location_to_json(
             if include_sub_locations
             else None
         )
+        data["linked_mids_count"] = None
+        data["linked_secondary_mids_count"] = None
 
     return data
 
@@ -150,6 +157,124 @@ async def test_list_with_sub_locations(
     assert resp.json() == [await location_to_json(expected, include_sub_locations=True)]
 
 
+async def test_list_with_sub_locations_for_many_parents(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    locations = [await location_factory(merchant=merchant) for _ in range(3)]
+    for location in locations[:2]:
+        for _ in range(2):
+            await location_factory(merchant=merchant, parent=location)
+
+    resp = test_client.get(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/locations?include_sub_locations=true"
+    )
+
+    assert resp.status_code == status.HTTP_200_OK
+    sub_location_refs = {
+        location["location_ref"]: [
+            sub_location["location_ref"]
+            for sub_location in location["sub_locations"] or []
+        ]
+        for location in resp.json()
+    }
+    assert sub_location_refs == {
+        str(location.pk): [
+            str(sub_location.pk)
+            for sub_location in await Location.objects().where(
+                Location.parent == location.pk
+            )
+        ]
+        for location in locations
+    }
+
+
+async def test_list_with_sub_locations_query_count(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+
+    counts = []
+    for _ in range(2):
+        location = await location_factory(merchant=merchant)
+        await location_factory(merchant=merchant, parent=location)
+        with record_queries() as stats:
+            await list_locations(
+                plan_ref=plan.pk,
+                merchant_ref=merchant.pk,
+                exclude_secondary_mid=None,
+                include_sub_locations=True,
+                include_counts=False,
+                n=10,
+                p=1,
+            )
+        counts.append(stats.count)
+
+    # the number of queries doesn't grow with the number of locations.
+    assert counts[0] == counts[1] == 2
+
+
+async def test_list_with_counts(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    primary_mid_factory: Factory[PrimaryMID],
+    secondary_mid_factory: Factory[SecondaryMID],
+    secondary_mid_location_link_factory: Factory[SecondaryMIDLocationLink],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    linked, unlinked = [await location_factory(merchant=merchant) for _ in range(2)]
+    for _ in range(2):
+        await primary_mid_factory(merchant=merchant, location=linked)
+    await primary_mid_factory(
+        merchant=merchant, location=linked, status=ResourceStatus.DELETED
+    )
+    await secondary_mid_location_link_factory(
+        location=linked, secondary_mid=await secondary_mid_factory(merchant=merchant)
+    )
+
+    with record_queries() as stats:
+        locations = await list_locations(
+            plan_ref=plan.pk,
+            merchant_ref=merchant.pk,
+            exclude_secondary_mid=None,
+            include_sub_locations=False,
+            include_counts=True,
+            n=10,
+            p=1,
+        )
+
+    assert {
+        location.location_ref: (
+            location.linked_mids_count,
+            location.linked_secondary_mids_count,
+        )
+        for location in locations
+    } == {linked.pk: (2, 1), unlinked.pk: (0, 0)}
+    # one query for the page, and one for each kind of count.
+    assert stats.count == 3
+
+    resp = test_client.get(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/locations",
+        params={"include_counts": True},
+    )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert {
+        location["location_ref"]: location["linked_mids_count"]
+        for location in resp.json()
+    } == {str(linked.pk): 2, str(unlinked.pk): 0}
+
+
 async def test_list_with_invalid_plan(
     merchant_factory: Factory[Merchant],
     test_client: TestClient,
@@ -210,6 +335,40 @@ async def testlist_exclude_secondary_mid(
     assert resp.json() == [await location_to_json(location) for location in expected]
 
 
+async def test_list_exclude_secondary_mid_in_sql(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    secondary_mid_factory: Factory[SecondaryMID],
+    secondary_mid_location_link_factory: Factory[SecondaryMIDLocationLink],
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    secondary_mid = await secondary_mid_factory(merchant=merchant)
+    linked = [await location_factory(merchant=merchant) for _ in range(3)]
+    unlinked = await location_factory(merchant=merchant)
+    for location in linked:
+        await secondary_mid_location_link_factory(
+            location=location, secondary_mid=secondary_mid
+        )
+
+    with record_queries() as stats:
+        locations = await list_locations(
+            plan_ref=plan.pk,
+            merchant_ref=merchant.pk,
+            exclude_secondary_mid=secondary_mid.pk,
+            include_sub_locations=False,
+            include_counts=False,
+            n=10,
+            p=1,
+        )
+
+    assert [location.location_ref for location in locations] == [unlinked.pk]
+    # one query to check the secondary MID, and one for the page. the linked
+    # locations are never loaded.
+    assert stats.count == 2
+
+
 async def test_list_exclude_unlinked_secondary_mid(
     plan_factory: Factory[Plan],
     merchant_factory: Factory[Merchant],
@@ -268,6 +427,169 @@ async def test_list_exclude_secondary_mid_from_wrong_merchant(
     assert_is_not_found_error(resp, loc=["query", "exclude_secondary_mid"])
 
 
+def tree_refs(nodes: list[dict]) -> list[tuple[str, list]]:
+    """Reduces a location tree response to nested (location_ref, children) pairs."""
+    return [(node["location_ref"], tree_refs(node["sub_locations"])) for node in nodes]
+
+
+async def test_tree(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    first, second = [
+        await location_factory(merchant=merchant, created=datetime(2023, 1, day))
+        for day in (1, 2)
+    ]
+    child = await location_factory(merchant=merchant, parent=first)
+    grandchild = await location_factory(merchant=merchant, parent=child)
+    await location_factory(
+        merchant=merchant, parent=first, status=ResourceStatus.DELETED
+    )
+    await location_factory()
+
+    resp = test_client.get(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/locations/tree"
+    )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert tree_refs(resp.json()) == [
+        (str(second.pk), []),
+        (str(first.pk), [(str(child.pk), [(str(grandchild.pk), [])])]),
+    ]
+
+    expected = await Location.objects().get(Location.pk == second.pk)
+    assert expected is not None
+    expected_json = await location_to_json(expected)
+    del expected_json["linked_mids_count"], expected_json["linked_secondary_mids_count"]
+    assert resp.json()[0] == expected_json | {"sub_locations": []}
+
+
+async def test_tree_paginates_roots(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    locations = [
+        await location_factory(merchant=merchant, created=datetime(2023, 1, day))
+        for day in (1, 2, 3)
+    ]
+    children = [
+        await location_factory(merchant=merchant, parent=location)
+        for location in locations
+    ]
+
+    resp = test_client.get(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/locations/tree",
+        params={"n": 2, "p": 2},
+    )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert tree_refs(resp.json()) == [
+        (str(locations[0].pk), [(str(children[0].pk), [])])
+    ]
+
+
+async def test_tree_query_count(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    for _ in range(3):
+        location = await location_factory(merchant=merchant)
+        child = await location_factory(merchant=merchant, parent=location)
+        await location_factory(merchant=merchant, parent=child)
+
+    with record_queries() as stats:
+        tree = await list_location_tree(
+            plan_ref=plan.pk, merchant_ref=merchant.pk, parent_ref=None, n=10, p=1
+        )
+
+    assert len(tree) == 3
+    assert stats.count == 1
+
+
+async def test_subtree(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    location = await location_factory(merchant=merchant)
+    child = await location_factory(merchant=merchant, parent=location)
+    grandchild = await location_factory(merchant=merchant, parent=child)
+    await location_factory(merchant=merchant)
+
+    resp = test_client.get(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/locations/tree",
+        params={"parent_ref": str(location.pk)},
+    )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert tree_refs(resp.json()) == [(str(child.pk), [(str(grandchild.pk), [])])]
+
+
+async def test_subtree_without_children(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    location = await location_factory(merchant=merchant)
+
+    resp = test_client.get(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/locations/tree",
+        params={"parent_ref": str(location.pk)},
+    )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.json() == []
+
+
+async def test_subtree_with_parent_from_wrong_merchant(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    location = await location_factory()
+    await location_factory(parent=location)
+
+    resp = test_client.get(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/locations/tree",
+        params={"parent_ref": str(location.pk)},
+    )
+
+    assert_is_not_found_error(resp, loc=["query", "parent_ref"])
+
+
+async def test_tree_with_invalid_merchant(
+    plan_factory: Factory[Plan],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+
+    resp = test_client.get(
+        f"/api/v1/plans/{plan.pk}/merchants/{uuid4()}/locations/tree"
+    )
+
+    assert_is_not_found_error(resp, loc=["path", "merchant_ref"])
+
+
 async def test_details(
     plan_factory: Factory[Plan],
     merchant_factory: Factory[Merchant],
@@ -1146,6 +1468,62 @@ async def test_unlinked_available_mids(
     ]
 
 
+async def test_available_mids_paginated_in_mid_order(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    primary_mid_factory: Factory[PrimaryMID],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    location = await location_factory(merchant=merchant)
+    for mid in ["3", "1", "2"]:
+        await primary_mid_factory(merchant=merchant, mid=mid)
+
+    url = f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/locations/{location.pk}/available_mids"
+    pages = [test_client.get(url, params={"n": 2, "p": p}) for p in (1, 2)]
+
+    assert [
+        [result["mid"]["mid_value"] for result in page.json()] for page in pages
+    ] == [["1", "2"], ["3"]]
+
+
+async def test_available_mids_search(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    primary_mid_factory: Factory[PrimaryMID],
+    default_payment_schemes: list[PaymentScheme],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    location = await location_factory(merchant=merchant)
+    payment_scheme, other_payment_scheme = default_payment_schemes[:2]
+    for mid, scheme in [
+        ("1234", payment_scheme),
+        ("1299", other_payment_scheme),
+        ("12_4", payment_scheme),
+        ("5123", payment_scheme),
+    ]:
+        await primary_mid_factory(merchant=merchant, mid=mid, payment_scheme=scheme)
+
+    url = f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/locations/{location.pk}/available_mids"
+
+    def search(**params: str) -> list[str]:
+        resp = test_client.get(url, params=params)
+        assert resp.status_code == status.HTTP_200_OK
+        return [result["mid"]["mid_value"] for result in resp.json()]
+
+    assert search(mid_prefix="12") == ["1234", "1299", "12_4"]
+    assert search(mid_prefix="12_") == ["12_4"]
+    assert search(mid_prefix="12", payment_scheme_slug=payment_scheme.slug) == [
+        "1234",
+        "12_4",
+    ]
+
+
 async def test_associated_mids(
     plan_factory: Factory[Plan],
     merchant_factory: Factory[Merchant],
@@ -8,9 +8,11 @@ from fastapi import status
 from fastapi.testclient import TestClient
 from qbert.tables import Job
 
+from bullsquid.db import NoSuchRecord, identity_map
 from bullsquid.merchant_data.enums import ResourceStatus, TXMStatus
 from bullsquid.merchant_data.locations.tables import Location
 from bullsquid.merchant_data.merchants.db import get_merchant
+from bullsquid.merchant_data.plans.db import get_plan
 from bullsquid.merchant_data.merchants.tables import Merchant
 from bullsquid.merchant_data.payment_schemes.tables import PaymentScheme
 from bullsquid.merchant_data.plans.tables import Plan
@@ -542,3 +544,47 @@ async def test_plan_validation() -> None:
     with pytest.raises(ValueError) as ex:
         await get_merchant(uuid4(), plan_ref=None)
     assert ex.value.args[0] == "validate_plan cannot be true if plan_ref is null"
+
+
+async def test_get_merchant_on_other_plan(
+    plan_factory: Factory[Plan], merchant_factory: Factory[Merchant]
+) -> None:
+    merchant = await merchant_factory()
+    other_plan = await plan_factory()
+    with pytest.raises(NoSuchRecord) as ex:
+        await get_merchant(merchant.pk, plan_ref=other_plan.pk)
+    assert ex.value.table is Merchant
+
+
+async def test_get_merchant_on_deleted_plan(
+    plan_factory: Factory[Plan], merchant_factory: Factory[Merchant]
+) -> None:
+    plan = await plan_factory(status=ResourceStatus.DELETED)
+    merchant = await merchant_factory(plan=plan)
+    with pytest.raises(NoSuchRecord) as ex:
+        await get_merchant(merchant.pk, plan_ref=plan.pk)
+    assert ex.value.table is Plan
+
+
+async def test_list_primary_mids_on_deleted_merchant(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    primary_mid_factory: Factory[PrimaryMID],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan, status=ResourceStatus.DELETED)
+    await primary_mid_factory(merchant=merchant)
+    resp = test_client.get(f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/mids")
+    assert_is_not_found_error(resp, loc=["path", "merchant_ref"])
+
+
+async def test_get_merchant_identity_map(
+    plan_factory: Factory[Plan], merchant_factory: Factory[Merchant]
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    with identity_map():
+        loaded = await get_merchant(merchant.pk, plan_ref=plan.pk)
+        assert await get_merchant(merchant.pk, plan_ref=plan.pk) is loaded
+        assert await get_plan(plan.pk) is loaded.plan
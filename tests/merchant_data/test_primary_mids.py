@@ -10,6 +10,7 @@ from fastapi.testclient import TestClient
 import pytest
 from qbert.tables import Job
 
+from bullsquid.engine import record_queries
 from bullsquid.merchant_data.enums import (
     PaymentEnrolmentStatus,
     ResourceStatus,
@@ -19,7 +20,11 @@ from bullsquid.merchant_data.locations.tables import Location
 from bullsquid.merchant_data.merchants.tables import Merchant
 from bullsquid.merchant_data.payment_schemes.tables import PaymentScheme
 from bullsquid.merchant_data.plans.tables import Plan
-from bullsquid.merchant_data.primary_mids.db import detail_response, overview_response
+from bullsquid.merchant_data.primary_mids.db import (
+    delete_primary_mids,
+    detail_response,
+    overview_response,
+)
 from bullsquid.merchant_data.primary_mids.tables import PrimaryMID
 from bullsquid.merchant_data.tasks import (
     OffboardAndDeletePrimaryMIDs,
@@ -251,7 +256,8 @@ async def test_create_without_onboarding(
 
     assert not await Job.exists().where(
         Job.message_type == OnboardPrimaryMIDs.__name__,
-        Job.message == OnboardPrimaryMIDs(mid_refs=[mid_ref]).dict(),
+        Job.message
+        == OnboardPrimaryMIDs(merchant_ref=merchant.pk, mid_refs=[mid_ref]).dict(),
     )
 
 
@@ -344,7 +350,8 @@ async def test_create_and_onboard(
 
     assert await Job.exists().where(
         Job.message_type == OnboardPrimaryMIDs.__name__,
-        Job.message == OnboardPrimaryMIDs(mid_refs=[mid_ref]).dict(),
+        Job.message
+        == OnboardPrimaryMIDs(merchant_ref=merchant.pk, mid_refs=[mid_ref]).dict(),
     )
 
 
@@ -708,7 +715,10 @@ async def test_onboard(
 
     assert await Job.exists().where(
         Job.message_type == OnboardPrimaryMIDs.__name__,
-        Job.message == OnboardPrimaryMIDs(mid_refs=[primary_mid.pk]).dict(),
+        Job.message
+        == OnboardPrimaryMIDs(
+            merchant_ref=merchant.pk, mid_refs=[primary_mid.pk]
+        ).dict(),
     )
 
     await run_worker(burst=True)
@@ -774,7 +784,10 @@ async def test_offboard(
 
     assert await Job.exists().where(
         Job.message_type == OffboardPrimaryMIDs.__name__,
-        Job.message == OffboardPrimaryMIDs(mid_refs=[primary_mid.pk]).dict(),
+        Job.message
+        == OffboardPrimaryMIDs(
+            merchant_ref=merchant.pk, mid_refs=[primary_mid.pk]
+        ).dict(),
     )
 
     await run_worker(burst=True)
@@ -847,7 +860,10 @@ async def test_delete_not_onboarded(
 
     assert not await Job.exists().where(
         Job.message_type == OffboardAndDeletePrimaryMIDs.__name__,
-        Job.message == OffboardAndDeletePrimaryMIDs(mid_refs=[primary_mid.pk]).dict(),
+        Job.message
+        == OffboardAndDeletePrimaryMIDs(
+            merchant_ref=merchant.pk, mid_refs=[primary_mid.pk]
+        ).dict(),
     )
 
 
@@ -880,7 +896,10 @@ async def test_delete_offboarded(
 
     assert not await Job.exists().where(
         Job.message_type == OffboardAndDeletePrimaryMIDs.__name__,
-        Job.message == OffboardAndDeletePrimaryMIDs(mid_refs=[primary_mid.pk]).dict(),
+        Job.message
+        == OffboardAndDeletePrimaryMIDs(
+            merchant_ref=merchant.pk, mid_refs=[primary_mid.pk]
+        ).dict(),
     )
 
 
@@ -913,7 +932,10 @@ async def test_delete_onboarded(
 
     assert await Job.exists().where(
         Job.message_type == OffboardAndDeletePrimaryMIDs.__name__,
-        Job.message == OffboardAndDeletePrimaryMIDs(mid_refs=[primary_mid.pk]).dict(),
+        Job.message
+        == OffboardAndDeletePrimaryMIDs(
+            merchant_ref=merchant.pk, mid_refs=[primary_mid.pk]
+        ).dict(),
     )
 
 
@@ -958,6 +980,64 @@ async def test_delete_nonexistent_mid(
     assert_is_not_found_error(resp, loc=["body", "mid_refs"])
 
 
+async def test_delete_other_merchants_mid(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    primary_mid_factory: Factory[PrimaryMID],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    mid = await primary_mid_factory(
+        merchant=merchant, txm_status=TXMStatus.NOT_ONBOARDED
+    )
+    other_mid = await primary_mid_factory(txm_status=TXMStatus.NOT_ONBOARDED)
+
+    resp = test_client.post(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/mids/deletion",
+        json={"mid_refs": [str(mid.pk), str(other_mid.pk)]},
+    )
+
+    assert_is_not_found_error(resp, loc=["body", "mid_refs"])
+    assert (
+        await PrimaryMID.count().where(PrimaryMID.pk.is_in([mid.pk, other_mid.pk])) == 2
+    )
+
+
+async def test_delete_mixed_in_one_query(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    primary_mid_factory: Factory[PrimaryMID],
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    onboarded = await primary_mid_factory(
+        merchant=merchant, txm_status=TXMStatus.ONBOARDED
+    )
+    not_onboarded = await primary_mid_factory(
+        merchant=merchant, txm_status=TXMStatus.NOT_ONBOARDED
+    )
+
+    with record_queries() as stats:
+        result = await delete_primary_mids(
+            {onboarded.pk, not_onboarded.pk},
+            plan_ref=plan.pk,
+            merchant_ref=merchant.pk,
+        )
+
+    assert result == ({onboarded.pk}, {not_onboarded.pk})
+    assert stats.count == 1
+    assert {
+        row["pk"]: row["status"]
+        for row in await PrimaryMID.all_select(PrimaryMID.pk, PrimaryMID.status).where(
+            PrimaryMID.pk.is_in([onboarded.pk, not_onboarded.pk])
+        )
+    } == {
+        onboarded.pk: ResourceStatus.PENDING_DELETION,
+        not_onboarded.pk: ResourceStatus.DELETED,
+    }
+
+
 async def test_delete_zero_mids(
     plan_factory: Factory[Plan],
     merchant_factory: Factory[Merchant],
@@ -1358,3 +1438,57 @@ async def test_bulk_update_enrolment_status_nonexistent_mid(
     )
 
     assert_is_not_found_error(resp, loc=["body", "mid_refs"])
+
+
+async def test_bulk_update_enrolment_status_partially_missing(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    primary_mid_factory: Factory[PrimaryMID],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    mid = await primary_mid_factory(
+        merchant=merchant, payment_enrolment_status=PaymentEnrolmentStatus.UNKNOWN
+    )
+    other_mid = await primary_mid_factory(
+        payment_enrolment_status=PaymentEnrolmentStatus.UNKNOWN
+    )
+
+    resp = test_client.patch(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/mids",
+        json={
+            "mid_refs": [str(mid.pk), str(other_mid.pk)],
+            "payment_enrolment_status": PaymentEnrolmentStatus.ENROLLED,
+        },
+    )
+
+    assert_is_not_found_error(resp, loc=["body", "mid_refs"])
+
+    # nothing is updated if any of the MIDs are missing.
+    assert (
+        await PrimaryMID.exists().where(
+            PrimaryMID.pk.is_in([mid.pk, other_mid.pk]),
+            PrimaryMID.payment_enrolment_status == PaymentEnrolmentStatus.ENROLLED,
+        )
+        is False
+    )
+
+
+async def test_bulk_update_enrolment_status_nonexistent_merchant(
+    plan_factory: Factory[Plan],
+    primary_mid_factory: Factory[PrimaryMID],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    mid = await primary_mid_factory()
+
+    resp = test_client.patch(
+        f"/api/v1/plans/{plan.pk}/merchants/{uuid4()}/mids",
+        json={
+            "mid_refs": [str(mid.pk)],
+            "payment_enrolment_status": PaymentEnrolmentStatus.ENROLLED,
+        },
+    )
+
+    assert_is_not_found_error(resp, loc=["path", "merchant_ref"])
@@ -224,7 +224,8 @@ async def test_create_without_onboarding(
 
     assert not await Job.exists().where(
         Job.message_type == OnboardPSIMIs.__name__,
-        Job.message == OnboardPSIMIs(psimi_refs=[psimi_ref]).dict(),
+        Job.message
+        == OnboardPSIMIs(merchant_ref=merchant.pk, psimi_refs=[psimi_ref]).dict(),
     )
 
 
@@ -259,7 +260,8 @@ async def test_create_and_onboard(
 
     assert await Job.exists().where(
         Job.message_type == OnboardPSIMIs.__name__,
-        Job.message == OnboardPSIMIs(psimi_refs=[psimi_ref]).dict(),
+        Job.message
+        == OnboardPSIMIs(merchant_ref=merchant.pk, psimi_refs=[psimi_ref]).dict(),
     )
 
 
@@ -455,7 +457,8 @@ async def test_onboard(
 
     assert await Job.exists().where(
         Job.message_type == OnboardPSIMIs.__name__,
-        Job.message == OnboardPSIMIs(psimi_refs=[psimi.pk]).dict(),
+        Job.message
+        == OnboardPSIMIs(merchant_ref=merchant.pk, psimi_refs=[psimi.pk]).dict(),
     )
 
     await run_worker(burst=True)
@@ -519,7 +522,8 @@ async def test_offboard(
 
     assert await Job.exists().where(
         Job.message_type == OffboardPSIMIs.__name__,
-        Job.message == OffboardPSIMIs(psimi_refs=[psimi.pk]).dict(),
+        Job.message
+        == OffboardPSIMIs(merchant_ref=merchant.pk, psimi_refs=[psimi.pk]).dict(),
     )
 
     await run_worker(burst=True)
@@ -613,7 +617,10 @@ async def test_delete_not_onboarded_psimi(
 
     assert not await Job.exists().where(
         Job.message_type == OffboardAndDeletePSIMIs.__name__,
-        Job.message == OffboardAndDeletePSIMIs(psimi_refs=[psimi.pk]).dict(),
+        Job.message
+        == OffboardAndDeletePSIMIs(
+            merchant_ref=merchant.pk, psimi_refs=[psimi.pk]
+        ).dict(),
     )
 
 
@@ -641,7 +648,10 @@ async def test_delete_offboarded_psimi(
 
     assert not await Job.exists().where(
         Job.message_type == OffboardAndDeletePSIMIs.__name__,
-        Job.message == OffboardAndDeletePSIMIs(psimi_refs=[psimi.pk]).dict(),
+        Job.message
+        == OffboardAndDeletePSIMIs(
+            merchant_ref=merchant.pk, psimi_refs=[psimi.pk]
+        ).dict(),
     )
 
 
@@ -669,7 +679,10 @@ async def test_delete_onboarded_psimi(
 
     assert await Job.exists().where(
         Job.message_type == OffboardAndDeletePSIMIs.__name__,
-        Job.message == OffboardAndDeletePSIMIs(psimi_refs=[psimi.pk]).dict(),
+        Job.message
+        == OffboardAndDeletePSIMIs(
+            merchant_ref=merchant.pk, psimi_refs=[psimi.pk]
+        ).dict(),
     )
 
 
@@ -0,0 +1,165 @@
+from uuid import uuid4
+
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from bullsquid.engine import record_queries
+from bullsquid.merchant_data.enums import ResourceStatus, ResourceType
+from bullsquid.merchant_data.locations.tables import Location
+from bullsquid.merchant_data.merchants.tables import Merchant
+from bullsquid.merchant_data.plans.tables import Plan
+from bullsquid.merchant_data.primary_mids.tables import PrimaryMID
+from bullsquid.merchant_data.psimis.tables import PSIMI
+from bullsquid.merchant_data.search.db import search
+from bullsquid.merchant_data.secondary_mids.tables import SecondaryMID
+from tests.helpers import Factory, assert_is_not_found_error
+
+
+def result_refs(resp_json: list[dict]) -> list[tuple[str, str]]:
+    return [(result["resource_type"], result["resource_ref"]) for result in resp_json]
+
+
+async def test_search_ranks_matches(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan, name="Bean There")
+    contains = await location_factory(merchant=merchant, name="The Coffee Shop")
+    exact = await location_factory(merchant=merchant, name="coffee")
+    prefix = await location_factory(merchant=merchant, name="Coffee Corner")
+    await location_factory(merchant=merchant, name="Tea Room")
+
+    resp = test_client.get(f"/api/v1/plans/{plan.pk}/search", params={"q": "Coffee"})
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert result_refs(resp.json()) == [
+        ("location", str(exact.pk)),
+        ("location", str(prefix.pk)),
+        ("location", str(contains.pk)),
+    ]
+
+
+async def test_search_all_resource_types(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    primary_mid_factory: Factory[PrimaryMID],
+    secondary_mid_factory: Factory[SecondaryMID],
+    psimi_factory: Factory[PSIMI],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan, name="Findme Foods")
+    location = await location_factory(
+        merchant=merchant, name="Depot", postcode="FINDME 1"
+    )
+    sub_location = await location_factory(
+        merchant=merchant, parent=location, name="findme annex"
+    )
+    primary_mid = await primary_mid_factory(merchant=merchant, mid="findme-mid")
+    secondary_mid = await secondary_mid_factory(
+        merchant=merchant, secondary_mid="findme-secondary"
+    )
+    psimi = await psimi_factory(merchant=merchant, value="findme-psimi")
+
+    resp = test_client.get(f"/api/v1/plans/{plan.pk}/search", params={"q": "findme"})
+
+    assert resp.status_code == status.HTTP_200_OK
+    results = {result["resource_ref"]: result for result in resp.json()}
+    assert {
+        ref: (result["resource_type"], result["merchant_ref"], result["parent_ref"])
+        for ref, result in results.items()
+    } == {
+        str(merchant.pk): (ResourceType.MERCHANT, str(merchant.pk), None),
+        str(location.pk): (ResourceType.LOCATION, str(merchant.pk), None),
+        str(sub_location.pk): (
+            ResourceType.LOCATION,
+            str(merchant.pk),
+            str(location.pk),
+        ),
+        str(primary_mid.pk): (ResourceType.PRIMARY_MID, str(merchant.pk), None),
+        str(secondary_mid.pk): (ResourceType.SECONDARY_MID, str(merchant.pk), None),
+        str(psimi.pk): (ResourceType.PSIMI, str(merchant.pk), None),
+    }
+    assert results[str(primary_mid.pk)]["title"] == "findme-mid"
+
+
+async def test_search_excludes_other_plans_and_deleted(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    primary_mid_factory: Factory[PrimaryMID],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    deleted_merchant = await merchant_factory(plan=plan, status=ResourceStatus.DELETED)
+    location = await location_factory(merchant=merchant, name="Hidden Gem")
+    await location_factory(
+        merchant=merchant, name="Hidden Deleted", status=ResourceStatus.DELETED
+    )
+    await location_factory(merchant=deleted_merchant, name="Hidden Orphan")
+    await primary_mid_factory(merchant=deleted_merchant, mid="hidden-mid")
+    await location_factory(name="Hidden Elsewhere")
+
+    resp = test_client.get(f"/api/v1/plans/{plan.pk}/search", params={"q": "hidden"})
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert result_refs(resp.json()) == [("location", str(location.pk))]
+
+
+async def test_search_escapes_wildcards(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    location = await location_factory(merchant=merchant, name="100% Juice")
+    await location_factory(merchant=merchant, name="1000 Juices")
+
+    resp = test_client.get(f"/api/v1/plans/{plan.pk}/search", params={"q": "00%"})
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert result_refs(resp.json()) == [("location", str(location.pk))]
+
+
+async def test_search_paginates(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    location_factory: Factory[Location],
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    locations = [
+        await location_factory(merchant=merchant, name=f"Branch {i}") for i in range(3)
+    ]
+
+    with record_queries() as stats:
+        results = await search("branch", plan_ref=plan.pk, n=2, p=2)
+
+    assert [result.resource_ref for result in results] == [locations[2].pk]
+    assert stats.count == 1
+
+
+async def test_search_with_invalid_plan(
+    database: None, test_client: TestClient
+) -> None:
+    resp = test_client.get(f"/api/v1/plans/{uuid4()}/search", params={"q": "test"})
+
+    assert_is_not_found_error(resp, loc=["path", "plan_ref"])
+
+
+async def test_search_too_short(
+    plan_factory: Factory[Plan],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+
+    resp = test_client.get(f"/api/v1/plans/{plan.pk}/search", params={"q": "ab"})
+
+    assert resp.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
@@ -337,7 +337,10 @@ async def test_create_without_onboarding(
 
     assert not await Job.exists().where(
         Job.message_type == OnboardSecondaryMIDs.__name__,
-        Job.message == OnboardSecondaryMIDs(secondary_mid_refs=[mid_ref]).dict(),
+        Job.message
+        == OnboardSecondaryMIDs(
+            merchant_ref=merchant.pk, secondary_mid_refs=[mid_ref]
+        ).dict(),
     )
 
 
@@ -373,7 +376,10 @@ async def test_create_and_onboard(
 
     assert await Job.exists().where(
         Job.message_type == OnboardSecondaryMIDs.__name__,
-        Job.message == OnboardSecondaryMIDs(secondary_mid_refs=[mid_ref]).dict(),
+        Job.message
+        == OnboardSecondaryMIDs(
+            merchant_ref=merchant.pk, secondary_mid_refs=[mid_ref]
+        ).dict(),
     )
 
 
@@ -645,7 +651,9 @@ async def test_onboard(
     assert await Job.exists().where(
         Job.message_type == OnboardSecondaryMIDs.__name__,
         Job.message
-        == OnboardSecondaryMIDs(secondary_mid_refs=[secondary_mid.pk]).dict(),
+        == OnboardSecondaryMIDs(
+            merchant_ref=merchant.pk, secondary_mid_refs=[secondary_mid.pk]
+        ).dict(),
     )
 
     await run_worker(burst=True)
@@ -714,7 +722,9 @@ async def test_offboard(
     assert await Job.exists().where(
         Job.message_type == OffboardSecondaryMIDs.__name__,
         Job.message
-        == OffboardSecondaryMIDs(secondary_mid_refs=[secondary_mid.pk]).dict(),
+        == OffboardSecondaryMIDs(
+            merchant_ref=merchant.pk, secondary_mid_refs=[secondary_mid.pk]
+        ).dict(),
     )
 
     await run_worker(burst=True)
@@ -844,6 +854,7 @@ async def test_delete_not_onboarded(
         Job.message_type == OffboardAndDeleteSecondaryMIDs.__name__,
         Job.message
         == OffboardAndDeleteSecondaryMIDs(
+            merchant_ref=merchant.pk,
             secondary_mid_refs=[mid.pk],
         ).dict(),
     )
@@ -881,6 +892,7 @@ async def test_delete_offboarded(
         Job.message_type == OffboardAndDeleteSecondaryMIDs.__name__,
         Job.message
         == OffboardAndDeleteSecondaryMIDs(
+            merchant_ref=merchant.pk,
             secondary_mid_refs=[mid.pk],
         ).dict(),
     )
@@ -916,6 +928,7 @@ async def test_delete_onboarded(
         Job.message_type == OffboardAndDeleteSecondaryMIDs.__name__,
         Job.message
         == OffboardAndDeleteSecondaryMIDs(
+            merchant_ref=merchant.pk,
             secondary_mid_refs=[mid.pk],
         ).dict(),
     )
@@ -1096,6 +1109,45 @@ async def test_associate_same_location_twice(
     assert resp1.json()[0]["link_ref"] == resp2.json()[0]["link_ref"]
 
 
+async def test_associate_new_and_existing_locations(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    secondary_mid_factory: Factory[SecondaryMID],
+    location_factory: Factory[Location],
+    secondary_mid_location_link_factory: Factory[SecondaryMIDLocationLink],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    secondary_mid = await secondary_mid_factory(merchant=merchant)
+    existing_location, new_location = [
+        await location_factory(merchant=merchant) for _ in range(2)
+    ]
+    existing_link = await secondary_mid_location_link_factory(
+        secondary_mid=secondary_mid, location=existing_location
+    )
+
+    resp = test_client.post(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/secondary_mids/{secondary_mid.pk}/secondary_mid_location_links",
+        json={"location_refs": [str(new_location.pk), str(existing_location.pk)]},
+    )
+
+    assert resp.status_code == status.HTTP_201_CREATED
+    new_link, existing = resp.json()
+    assert new_link["location_ref"] == str(new_location.pk)
+    assert existing == {
+        "link_ref": str(existing_link.pk),
+        "location_ref": str(existing_location.pk),
+        "location_title": existing_location.display_text,
+    }
+    assert (
+        await SecondaryMIDLocationLink.count().where(
+            SecondaryMIDLocationLink.secondary_mid == secondary_mid
+        )
+        == 2
+    )
+
+
 async def test_associated_locations(
     plan_factory: Factory[Plan],
     merchant_factory: Factory[Merchant],
@@ -1320,3 +1372,40 @@ async def test_bulk_update_enrolment_status_nonexistent_mid(
     )
 
     assert_is_not_found_error(resp, loc=["body", "secondary_mid_refs"])
+
+
+async def test_bulk_update_enrolment_status_many(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    secondary_mid_factory: Factory[SecondaryMID],
+    test_client: TestClient,
+) -> None:
+    plan = await plan_factory()
+    merchant = await merchant_factory(plan=plan)
+    secondary_mids = [
+        await secondary_mid_factory(
+            merchant=merchant, payment_enrolment_status=PaymentEnrolmentStatus.UNKNOWN
+        )
+        for _ in range(3)
+    ]
+
+    resp = test_client.patch(
+        f"/api/v1/plans/{plan.pk}/merchants/{merchant.pk}/secondary_mids",
+        json={
+            "secondary_mid_refs": [str(mid.pk) for mid in secondary_mids],
+            "payment_enrolment_status": PaymentEnrolmentStatus.ENROLLED,
+        },
+    )
+
+    assert resp.status_code == status.HTTP_200_OK, resp.json()
+    assert resp.json() == [
+        await secondary_mid_to_json(mid)
+        for mid in await SecondaryMID.objects().where(
+            SecondaryMID.pk.is_in([mid.pk for mid in secondary_mids])
+        )
+    ]
+    assert all(
+        mid["secondary_mid_metadata"]["payment_enrolment_status"]
+        == PaymentEnrolmentStatus.ENROLLED
+        for mid in resp.json()
+    )
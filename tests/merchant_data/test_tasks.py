@@ -1,25 +1,48 @@
 """Tests for the task worker."""
 
-from unittest.mock import patch
-
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from uuid import UUID, uuid4
+from unittest.mock import AsyncMock, patch
+
+import aiohttp
 import pytest
 from qbert.enums import JobStatus
+from qbert.queue import Job as QueuedJob
 from qbert.tables import Job
 
+from bullsquid.merchant_data.csv_upload.models import LocationFileRecord
 from bullsquid.merchant_data.enums import ResourceStatus, TXMStatus
 from bullsquid.merchant_data.locations.tables import Location
 from bullsquid.merchant_data.merchants.tables import Merchant
 from bullsquid.merchant_data.plans.tables import Plan
 from bullsquid.merchant_data.primary_mids.tables import PrimaryMID
+from bullsquid.merchant_data.psimis.tables import PSIMI
+from bullsquid.merchant_data.secondary_mids.tables import SecondaryMID
+from bullsquid.merchant_data.service.txm import txm
 from bullsquid.merchant_data.tasks import (
     OffboardAndDeleteMerchant,
     OffboardAndDeletePlan,
     OffboardAndDeletePrimaryMIDs,
     OffboardPrimaryMIDs,
     OnboardPrimaryMIDs,
+    ImportLocationFileRecord,
+    partition_jobs,
+    partition_key,
     queue,
     run_worker,
+    stage_jobs,
+)
+from bullsquid.merchant_data.tasks.offboarding import delete_fully_offboarded_merchants
+from bullsquid.merchant_data.tasks.metrics import (
+    collect_queue_jobs,
+    jobs_total,
+    queue_jobs,
 )
+from bullsquid.merchant_data.tasks.tables import DeadLetter
+from bullsquid.settings import settings
 from tests.helpers import Factory
 
 
@@ -48,16 +71,235 @@ async def test_run_worker_exceptions(primary_mid_factory: Factory[PrimaryMID]) -
     with patch("bullsquid.merchant_data.tasks.txm.onboard_mids", side_effect=Exception):
         await run_worker(burst=True)
 
+    # non-retryable errors go straight to the dead letter store.
+    assert await Job.count().where(Job.message_type == OnboardPrimaryMIDs.__name__) == 0
     assert (
-        await Job.count().where(
-            Job.message_type == OnboardPrimaryMIDs.__name__,
-            Job.status.is_in([JobStatus.QUEUED, JobStatus.FAILED]),
-            Job.failed_attempts == 1,
+        await DeadLetter.count().where(
+            DeadLetter.message_type == OnboardPrimaryMIDs.__name__,
+            DeadLetter.failed_attempts == 1,
         )
         == 1
     )
 
 
+async def test_run_worker_retryable_exceptions(
+    primary_mid_factory: Factory[PrimaryMID],
+) -> None:
+    primary_mid = await primary_mid_factory()
+    await queue.push(OnboardPrimaryMIDs(mid_refs=[primary_mid.pk]))
+
+    with patch(
+        "bullsquid.merchant_data.tasks.txm.onboard_mids",
+        side_effect=aiohttp.ServerDisconnectedError,
+    ):
+        await run_worker(burst=True)
+
+    job = await Job.objects().where(Job.message_type == OnboardPrimaryMIDs.__name__)
+    assert len(job) == 1
+    assert job[0].status == JobStatus.QUEUED
+    assert job[0].failed_attempts == 1
+    assert job[0].scheduled_for > datetime.now(timezone.utc)
+    assert await DeadLetter.count() == 0
+
+
+async def test_run_worker_metrics(primary_mid_factory: Factory[PrimaryMID]) -> None:
+    primary_mid = await primary_mid_factory()
+    labels = {"message_type": OnboardPrimaryMIDs.__name__}
+    succeeded = jobs_total.value(**labels, outcome="succeeded")
+    failed = jobs_total.value(**labels, outcome="failed")
+
+    await queue.push(OnboardPrimaryMIDs(mid_refs=[primary_mid.pk]))
+    await run_worker(burst=True)
+
+    await queue.push(OnboardPrimaryMIDs(mid_refs=[primary_mid.pk]))
+    with patch("bullsquid.merchant_data.tasks.txm.onboard_mids", side_effect=Exception):
+        await run_worker(burst=True)
+
+    assert jobs_total.value(**labels, outcome="succeeded") == succeeded + 1
+    assert jobs_total.value(**labels, outcome="failed") == failed + 1
+
+
+async def test_collect_queue_jobs(primary_mid_factory: Factory[PrimaryMID]) -> None:
+    primary_mid = await primary_mid_factory()
+    await queue.push(OnboardPrimaryMIDs(mid_refs=[primary_mid.pk]))
+    await queue.push(OffboardPrimaryMIDs(mid_refs=[primary_mid.pk]))
+    await queue.push(OffboardPrimaryMIDs(mid_refs=[primary_mid.pk]))
+
+    await collect_queue_jobs()
+
+    assert (
+        queue_jobs.value(message_type=OnboardPrimaryMIDs.__name__, state="pending") == 1
+    )
+    assert (
+        queue_jobs.value(message_type=OffboardPrimaryMIDs.__name__, state="pending")
+        == 2
+    )
+
+
+def test_partition_key() -> None:
+    merchant_ref = uuid4()
+    plan_ref = uuid4()
+
+    assert (
+        partition_key(OnboardPrimaryMIDs(merchant_ref=merchant_ref, mid_refs=[]))
+        == f"merchant:{merchant_ref}"
+    )
+    assert (
+        partition_key(OffboardAndDeleteMerchant(merchant_ref=merchant_ref))
+        == f"merchant:{merchant_ref}"
+    )
+    assert partition_key(OffboardAndDeletePlan(plan_ref=plan_ref)) == f"plan:{plan_ref}"
+    assert partition_key(OnboardPrimaryMIDs(mid_refs=[])) is None
+
+
+def test_partition_jobs() -> None:
+    merchant_a, merchant_b = uuid4(), uuid4()
+    jobs = [
+        QueuedJob(
+            id=uuid4(), message=OnboardPrimaryMIDs(merchant_ref=merchant_a, mid_refs=[])
+        ),
+        QueuedJob(
+            id=uuid4(), message=OnboardPrimaryMIDs(merchant_ref=merchant_b, mid_refs=[])
+        ),
+        QueuedJob(id=uuid4(), message=OnboardPrimaryMIDs(mid_refs=[])),
+        QueuedJob(id=uuid4(), message=OnboardPrimaryMIDs(mid_refs=[])),
+        QueuedJob(
+            id=uuid4(),
+            message=OffboardPrimaryMIDs(merchant_ref=merchant_a, mid_refs=[]),
+        ),
+    ]
+
+    assert partition_jobs(jobs) == [
+        [jobs[0], jobs[4]],
+        [jobs[1]],
+        [jobs[2]],
+        [jobs[3]],
+    ]
+
+
+async def test_run_worker_partitions(database: None) -> None:
+    merchant_a, merchant_b = uuid4(), uuid4()
+    merchants = {}
+    for merchant_ref in (merchant_a, merchant_a, merchant_b, merchant_b):
+        mid_ref = uuid4()
+        merchants[mid_ref] = merchant_ref
+        await queue.push(
+            OnboardPrimaryMIDs(merchant_ref=merchant_ref, mid_refs=[mid_ref])
+        )
+
+    running: list[UUID] = []
+    max_running = 0
+    overlapped = False
+
+    async def onboard_mids(mid_refs: set[UUID]) -> None:
+        nonlocal max_running, overlapped
+        (merchant_ref,) = {merchants[mid_ref] for mid_ref in mid_refs}
+        overlapped |= merchant_ref in running
+
+        running.append(merchant_ref)
+        max_running = max(max_running, len(running))
+        await asyncio.sleep(0.05)
+        running.remove(merchant_ref)
+
+    with patch(
+        "bullsquid.merchant_data.tasks.txm.onboard_mids", side_effect=onboard_mids
+    ):
+        await run_worker(burst=True)
+
+    # each merchant's jobs run one at a time, but the two merchants run together.
+    assert not overlapped
+    assert max_running == 2
+    assert await Job.count() == 0
+
+
+def test_stage_jobs() -> None:
+    plan_ref, merchant_ref = uuid4(), uuid4()
+    jobs = [
+        QueuedJob(
+            id=uuid4(),
+            message=OnboardPrimaryMIDs(merchant_ref=merchant_ref, mid_refs=[]),
+        ),
+        QueuedJob(id=uuid4(), message=OffboardAndDeletePlan(plan_ref=plan_ref)),
+        QueuedJob(id=uuid4(), message=OffboardAndDeletePlan(plan_ref=uuid4())),
+        QueuedJob(
+            id=uuid4(), message=OffboardAndDeleteMerchant(merchant_ref=merchant_ref)
+        ),
+        QueuedJob(id=uuid4(), message=OnboardPrimaryMIDs(mid_refs=[])),
+    ]
+
+    assert stage_jobs(jobs) == [[jobs[0]], [jobs[1], jobs[2]], [jobs[3], jobs[4]]]
+
+
+async def test_run_worker_plan_and_merchant_jobs_do_not_overlap(
+    database: None,
+) -> None:
+    plan_ref, merchant_ref = uuid4(), uuid4()
+    await queue.push(OffboardAndDeleteMerchant(merchant_ref=merchant_ref))
+    await queue.push(OffboardAndDeletePlan(plan_ref=plan_ref))
+    await queue.push(
+        ImportLocationFileRecord(
+            plan_ref=plan_ref,
+            merchant_ref=None,
+            record=LocationFileRecord(
+                merchant_name="test merchant",
+                parent_name=None,
+                name="test location",
+                location_id="test-location",
+                merchant_internal_id="test-internal-id",
+                is_physical=False,
+                address_line_1=None,
+                address_line_2=None,
+                town_city=None,
+                county=None,
+                country=None,
+                postcode=None,
+                visa_mids="",
+                amex_mids="",
+                mastercard_mids="",
+                visa_secondary_mids="",
+                mastercard_secondary_mids="",
+            ),
+        )
+    )
+    await queue.push(OffboardAndDeleteMerchant(merchant_ref=merchant_ref))
+
+    running: list[str] = []
+    order: list[str] = []
+    overlapped = False
+
+    def track(name: str) -> Any:
+        async def run(*_: Any, **__: Any) -> None:
+            nonlocal overlapped
+            overlapped |= bool(running)
+            running.append(name)
+            order.append(name)
+            await asyncio.sleep(0.05)
+            running.remove(name)
+
+        return run
+
+    with (
+        patch(
+            "bullsquid.merchant_data.tasks.offboard_and_delete_merchants",
+            side_effect=track("merchant"),
+        ),
+        patch(
+            "bullsquid.merchant_data.tasks.offboard_and_delete_plan",
+            side_effect=track("plan"),
+        ),
+        patch(
+            "bullsquid.merchant_data.tasks.import_location_file_record",
+            side_effect=track("import"),
+        ),
+    ):
+        await run_worker(burst=True)
+
+    # the plan-scoped jobs don't run alongside the merchant's offboarding.
+    assert not overlapped
+    assert order == ["merchant", "plan", "import", "merchant"]
+    assert await Job.count() == 0
+
+
 async def test_run_worker_sleep(primary_mid_factory: Factory[PrimaryMID]) -> None:
     primary_mid = await primary_mid_factory()
     await queue.push(OnboardPrimaryMIDs(mid_refs=[primary_mid.pk]))
@@ -143,10 +385,6 @@ async def test_offboard_delete_merchant(
 
     await queue.push(OffboardAndDeleteMerchant(merchant_ref=merchant.pk))
 
-    # run this twice; once for OffboardAndDeleteMerchant and once more for
-    # OffboardAndDeletePrimaryMIDs.
-    # TODO: fix burst mode
-    await run_worker(burst=True)
     await run_worker(burst=True)
 
     expected_merchant = await Merchant.all_objects().get(Merchant.pk == merchant.pk)
@@ -173,13 +411,7 @@ async def test_offboard_delete_plan(
 
     await queue.push(OffboardAndDeletePlan(plan_ref=plan.pk))
 
-    # run this three times
-    # 1. OffboardAndDeletePlan
-    # 2. OffboardAndDeleteMerchant
-    # 3. OffboardAndDeletePrimaryMIDs
-    # TODO: fix burst mode
-    for _ in range(3):
-        await run_worker(burst=True)
+    await run_worker(burst=True)
 
     expected_plan = await Plan.all_objects().get(Plan.pk == plan.pk)
     assert expected_plan is not None
@@ -194,3 +426,161 @@ async def test_offboard_delete_plan(
     assert expected.status == ResourceStatus.DELETED
     assert expected_merchant.status == ResourceStatus.DELETED
     assert expected_plan.status == ResourceStatus.DELETED
+
+
+async def test_offboard_delete_plan_in_chunks(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    primary_mid_factory: Factory[PrimaryMID],
+    secondary_mid_factory: Factory[SecondaryMID],
+    psimi_factory: Factory[PSIMI],
+) -> None:
+    plan = await plan_factory(status=ResourceStatus.PENDING_DELETION)
+    merchants = [await merchant_factory(plan=plan) for _ in range(3)]
+    primary_mids = [
+        await primary_mid_factory(merchant=merchant, txm_status=TXMStatus.ONBOARDED)
+        for merchant in merchants
+        for _ in range(2)
+    ]
+    await secondary_mid_factory(merchant=merchants[0], txm_status=TXMStatus.ONBOARDED)
+    await psimi_factory(merchant=merchants[1], txm_status=TXMStatus.ONBOARDED)
+
+    # a merchant with nothing to offboard should still be deleted.
+    empty_merchant = await merchant_factory(plan=plan)
+
+    await queue.push(OffboardAndDeletePlan(plan_ref=plan.pk))
+    with (
+        patch.object(settings, "worker_offboard_chunk_size", 4),
+        patch(
+            "bullsquid.merchant_data.tasks.offboarding.txm", new_callable=AsyncMock
+        ) as txm,
+    ):
+        await run_worker(burst=True)
+
+    # six primary MIDs in chunks of four.
+    assert txm.offboard_mids.await_count == 2
+    assert {
+        ref for call in txm.offboard_mids.await_args_list for ref in call.args[0]
+    } == {primary_mid.pk for primary_mid in primary_mids}
+    assert txm.offboard_secondary_mids.await_count == 1
+    assert txm.offboard_psimis.await_count == 1
+
+    assert not await PrimaryMID.exists().where(
+        PrimaryMID.txm_status == TXMStatus.ONBOARDED
+    )
+    assert (
+        await Merchant.all_count().where(
+            Merchant.pk.is_in(
+                [merchant.pk for merchant in merchants + [empty_merchant]]
+            ),
+            Merchant.status == ResourceStatus.DELETED,
+        )
+        == 4
+    )
+    expected_plan = await Plan.all_objects().get(Plan.pk == plan.pk)
+    assert expected_plan is not None
+    assert expected_plan.status == ResourceStatus.DELETED
+
+
+async def test_offboard_in_chunks_with_distinct_created(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    primary_mid_factory: Factory[PrimaryMID],
+) -> None:
+    plan = await plan_factory(status=ResourceStatus.PENDING_DELETION)
+    merchant = await merchant_factory(plan=plan)
+    # creation order is unrelated to primary key order.
+    primary_mids = [
+        await primary_mid_factory(
+            merchant=merchant,
+            txm_status=TXMStatus.ONBOARDED,
+            created=datetime(2023, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=i),
+        )
+        for i in random.sample(range(40), 40)
+    ]
+
+    await queue.push(OffboardAndDeletePlan(plan_ref=plan.pk))
+    with (
+        patch.object(settings, "worker_offboard_chunk_size", 4),
+        patch(
+            "bullsquid.merchant_data.tasks.offboarding.txm", new_callable=AsyncMock
+        ) as txm,
+    ):
+        await run_worker(burst=True)
+
+    assert txm.offboard_mids.await_count == 10
+    assert {
+        ref for call in txm.offboard_mids.await_args_list for ref in call.args[0]
+    } == {primary_mid.pk for primary_mid in primary_mids}
+    assert not await PrimaryMID.all_objects().where(
+        PrimaryMID.txm_status == TXMStatus.ONBOARDED
+    )
+
+
+async def test_delete_fully_offboarded_merchants_keeps_onboarded_plan(
+    plan_factory: Factory[Plan],
+    merchant_factory: Factory[Merchant],
+    primary_mid_factory: Factory[PrimaryMID],
+) -> None:
+    plan = await plan_factory(status=ResourceStatus.PENDING_DELETION)
+    offboarded = await merchant_factory(
+        plan=plan, status=ResourceStatus.PENDING_DELETION
+    )
+    onboarded = await merchant_factory(
+        plan=plan, status=ResourceStatus.PENDING_DELETION
+    )
+    await primary_mid_factory(merchant=onboarded, txm_status=TXMStatus.ONBOARDED)
+
+    await delete_fully_offboarded_merchants({offboarded.pk, onboarded.pk})
+
+    statuses = {
+        row["pk"]: row["status"]
+        for row in await Merchant.all_select(Merchant.pk, Merchant.status).where(
+            Merchant.plan == plan.pk
+        )
+    }
+    assert statuses == {
+        offboarded.pk: ResourceStatus.DELETED,
+        onboarded.pk: ResourceStatus.PENDING_DELETION,
+    }
+
+    expected_plan = await Plan.all_objects().get(Plan.pk == plan.pk)
+    assert expected_plan is not None
+    assert expected_plan.status == ResourceStatus.PENDING_DELETION
+
+
+async def test_run_worker_logs_expensive_jobs(
+    primary_mid_factory: Factory[PrimaryMID],
+) -> None:
+    primary_mid = await primary_mid_factory()
+    await queue.push(OnboardPrimaryMIDs(mid_refs=[primary_mid.pk]))
+
+    with (
+        patch.object(settings, "worker_job_query_count_threshold", 0),
+        patch("bullsquid.engine.logger") as mock_logger,
+    ):
+        await run_worker(burst=True)
+
+    (message,), _ = mock_logger.warning.call_args
+    assert message.startswith(f"{OnboardPrimaryMIDs.__name__} job")
+
+
+async def test_run_worker_logs_expensive_failed_jobs(
+    primary_mid_factory: Factory[PrimaryMID],
+) -> None:
+    primary_mid = await primary_mid_factory()
+    await queue.push(OnboardPrimaryMIDs(mid_refs=[primary_mid.pk]))
+
+    async def fail(*_: Any, **__: Any) -> None:
+        await PrimaryMID.count()
+        raise ValueError("bad job")
+
+    with (
+        patch.object(settings, "worker_job_query_count_threshold", 0),
+        patch.object(txm, "onboard_mids", side_effect=fail),
+        patch("bullsquid.engine.logger") as mock_logger,
+    ):
+        await run_worker(burst=True)
+
+    (message,), _ = mock_logger.warning.call_args
+    assert message.startswith(f"{OnboardPrimaryMIDs.__name__} job")
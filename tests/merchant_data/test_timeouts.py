@@ -0,0 +1,108 @@
+"""Tests for job timeouts and the stuck job watchdog."""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from uuid import UUID
+
+import pytest
+from qbert.enums import JobStatus
+from qbert.tables import Job
+
+from bullsquid.merchant_data.primary_mids.tables import PrimaryMID
+from bullsquid.merchant_data.tasks import (
+    OffboardAndDeletePlan,
+    OnboardPrimaryMIDs,
+    queue,
+    run_worker,
+)
+from bullsquid.merchant_data.tasks.metrics import stuck_jobs
+from bullsquid.merchant_data.tasks.tables import DeadLetter
+from bullsquid.merchant_data.tasks.timeouts import (
+    JobTimeoutError,
+    job_timeout,
+    report_stuck_jobs,
+    run_with_timeout,
+)
+from bullsquid.settings import settings
+from tests.helpers import Factory
+
+
+def test_job_timeout() -> None:
+    with (
+        patch.object(settings, "worker_job_timeout", timedelta(minutes=1)),
+        patch.object(
+            settings,
+            "worker_job_timeouts",
+            {OffboardAndDeletePlan.__name__: timedelta(hours=1)},
+        ),
+    ):
+        assert job_timeout(OnboardPrimaryMIDs.__name__) == timedelta(minutes=1)
+        assert job_timeout(OffboardAndDeletePlan.__name__) == timedelta(hours=1)
+
+
+async def test_run_with_timeout() -> None:
+    with (
+        patch.object(settings, "worker_job_timeout", timedelta(milliseconds=10)),
+        pytest.raises(JobTimeoutError),
+    ):
+        await run_with_timeout(OnboardPrimaryMIDs.__name__, asyncio.sleep(1))
+
+
+async def test_run_with_timeout_inner_timeout() -> None:
+    async def job() -> None:
+        raise asyncio.TimeoutError
+
+    with pytest.raises(asyncio.TimeoutError) as ex_info:
+        await run_with_timeout(OnboardPrimaryMIDs.__name__, job())
+
+    assert not isinstance(ex_info.value, JobTimeoutError)
+
+
+async def test_run_worker_job_timeout(primary_mid_factory: Factory[PrimaryMID]) -> None:
+    primary_mid = await primary_mid_factory()
+    await queue.push(OnboardPrimaryMIDs(mid_refs=[primary_mid.pk]))
+
+    async def hang(_mid_refs: set[UUID]) -> None:
+        await asyncio.sleep(10)
+
+    with (
+        patch.object(settings, "worker_job_timeout", timedelta(milliseconds=50)),
+        patch("bullsquid.merchant_data.tasks.txm.onboard_mids", side_effect=hang),
+    ):
+        await run_worker(burst=True)
+
+    # timed out jobs are retryable, so they go back on the queue.
+    job = await Job.objects().first()
+    assert job is not None
+    assert job.status == JobStatus.QUEUED
+    assert job.failed_attempts == 1
+    assert await DeadLetter.count() == 0
+
+
+async def lock_job(message: OnboardPrimaryMIDs, *, locked_for: timedelta) -> UUID:
+    await queue.push(message)
+    job = await Job.objects().where(Job.status == JobStatus.QUEUED).first()
+    assert job is not None
+    await Job.update(
+        {
+            Job.status: JobStatus.RUNNING,
+            Job.updated_at: datetime.now(timezone.utc) - locked_for,
+        }
+    ).where(Job.id == job.id)
+    return job.id
+
+
+async def test_report_stuck_jobs(database: None) -> None:
+    timeout = settings.worker_job_timeout + settings.worker_watchdog_grace
+    stuck = await lock_job(
+        OnboardPrimaryMIDs(mid_refs=[]), locked_for=timeout + timedelta(minutes=1)
+    )
+    await lock_job(
+        OnboardPrimaryMIDs(mid_refs=[]), locked_for=timeout - timedelta(minutes=1)
+    )
+
+    jobs = await report_stuck_jobs()
+
+    assert [job["id"] for job in jobs] == [stuck]
+    assert stuck_jobs.value(message_type=OnboardPrimaryMIDs.__name__) == 1
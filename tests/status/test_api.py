@@ -1,6 +1,7 @@
 """Tests the liveness and readiness endpoints in the status API."""
 
 from asyncio import Future
+from datetime import datetime, timedelta, timezone
 from typing import Generator
 from unittest.mock import patch
 
@@ -9,6 +10,8 @@ from fastapi import status
 from fastapi.testclient import TestClient
 from piccolo.apps.migrations.commands.check import MigrationStatus
 
+from bullsquid.merchant_data.tasks import OffboardPrimaryMIDs, OnboardPrimaryMIDs, queue
+
 
 @pytest.fixture
 def latest_migrations() -> Generator[None, None, None]:
@@ -66,3 +69,52 @@ def test_readiness_probe_no_engine(test_client: TestClient) -> None:
         engine_finder.return_value = None
         resp = test_client.get("/readyz")
         assert resp.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+async def test_queue_check_empty(database: None, test_client: TestClient) -> None:
+    resp = test_client.get("/queuez")
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.headers["Cache-Control"] == "no-store"
+    assert resp.json() == {
+        "pending": 0,
+        "scheduled": 0,
+        "running": 0,
+        "oldest_pending_age": None,
+        "message_types": [],
+    }
+
+
+async def test_queue_check(database: None, test_client: TestClient) -> None:
+    now = datetime.now(timezone.utc)
+    await queue.push(OnboardPrimaryMIDs(mid_refs=[]), now - timedelta(minutes=10))
+    await queue.push(OnboardPrimaryMIDs(mid_refs=[]), now - timedelta(minutes=1))
+    await queue.push(OnboardPrimaryMIDs(mid_refs=[]), now + timedelta(minutes=5))
+    await queue.push(OffboardPrimaryMIDs(mid_refs=[]))
+    await queue.pull(1)
+
+    resp = test_client.get("/queuez")
+    assert resp.status_code == status.HTTP_200_OK
+
+    result = resp.json()
+    assert result["pending"] == 2
+    assert result["scheduled"] == 1
+    assert result["running"] == 1
+    assert result["oldest_pending_age"] == pytest.approx(60, abs=10)
+
+    offboard, onboard = result["message_types"]
+    assert offboard == {
+        "message_type": OffboardPrimaryMIDs.__name__,
+        "pending": 1,
+        "scheduled": 0,
+        "running": 0,
+        "oldest_pending_age": pytest.approx(0, abs=10),
+    }
+    assert onboard["message_type"] == OnboardPrimaryMIDs.__name__
+    assert (onboard["pending"], onboard["scheduled"], onboard["running"]) == (1, 1, 1)
+
+
+def test_pool_check_closed(test_client: TestClient) -> None:
+    resp = test_client.get("/poolz")
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.headers["Cache-Control"] == "no-store"
+    assert resp.json() == {"pool": None, "replica": None}
@@ -1,12 +1,26 @@
 """Test for the top level database module."""
 
+import asyncio
 from typing import Any, AsyncGenerator, Type
+from unittest.mock import patch
 
 import pytest
 from piccolo.columns import Text
 from piccolo.table import Table, create_db_tables, drop_db_tables
 
-from bullsquid.db import paginate
+from bullsquid.db import (
+    close_connection_pool,
+    collect_pool_stats,
+    identity_map,
+    load,
+    paginate,
+    pool_connections,
+    pool_max_connections,
+    pool_stats,
+    prime,
+    start_connection_pool,
+)
+from bullsquid.settings import settings
 
 
 @pytest.fixture
@@ -82,3 +96,85 @@ async def test_paginate_p_negative(test_table: Table) -> None:
         await paginate(query, n=5, p=-3)
 
     assert str(ex.value) == "p must be >= 1"
+
+
+async def test_load_without_identity_map() -> None:
+    calls = 0
+
+    async def fetch() -> int:
+        nonlocal calls
+        calls += 1
+        return calls
+
+    assert await load("key", fetch) == 1
+    assert await load("key", fetch) == 2
+
+
+async def test_load_with_identity_map() -> None:
+    calls = 0
+
+    async def fetch() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        return calls
+
+    with identity_map():
+        results = await asyncio.gather(load("key", fetch), load("key", fetch))
+        assert results == [1, 1]
+        assert await load("key", fetch) == 1
+        assert await load("other", fetch) == 2
+
+    assert await load("key", fetch) == 3
+
+
+async def test_load_memoises_errors() -> None:
+    calls = 0
+
+    async def fetch() -> int:
+        nonlocal calls
+        calls += 1
+        raise LookupError("nope")
+
+    with identity_map():
+        for _ in range(2):
+            with pytest.raises(LookupError):
+                await load("key", fetch)
+
+    assert calls == 1
+
+
+async def test_prime() -> None:
+    async def fetch() -> str:
+        raise AssertionError("primed values should not be fetched")
+
+    prime("key", "ignored")
+    with identity_map():
+        prime("key", "primed")
+        prime("key", "ignored")
+        assert await load("key", fetch) == "primed"
+
+
+async def test_connection_pool() -> None:
+    assert pool_stats() is None
+
+    with (
+        patch.object(settings.database, "pool_min_size", 1),
+        patch.object(settings.database, "pool_max_size", 3),
+    ):
+        await start_connection_pool()
+    try:
+        stats = pool_stats()
+        assert stats is not None
+        assert (stats.size, stats.idle, stats.busy) == (1, 1, 0)
+        assert (stats.min_size, stats.max_size) == (1, 3)
+        assert pool_stats(replica=True) is None
+
+        await collect_pool_stats()
+        assert pool_connections.value(state="idle") == 1
+        assert pool_connections.value(state="busy") == 0
+        assert pool_max_connections.value() == 3
+    finally:
+        await close_connection_pool()
+
+    assert pool_stats() is None
@@ -0,0 +1,269 @@
+"""Tests for the replica routing database engine."""
+
+import asyncio
+from datetime import timedelta
+from typing import AsyncIterator, Generator
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from asyncpg import Record
+from fastapi.testclient import TestClient
+from piccolo.engine import engine_finder
+from piccolo.engine.postgres import PostgresEngine
+from piccolo.querystring import QueryString
+
+from bullsquid.engine import (
+    QueryStats,
+    RoutingPostgresEngine,
+    StreamsBusy,
+    read_from_replica,
+    record_queries,
+    use_primary,
+)
+from bullsquid.settings import settings
+
+
+@pytest.fixture
+def engine() -> Generator[RoutingPostgresEngine, None, None]:
+    """A routing engine for the test database with a mocked replica."""
+    primary = engine_finder()
+    assert isinstance(primary, PostgresEngine)
+
+    engine = RoutingPostgresEngine(primary.config)
+    engine.replica = MagicMock(spec=PostgresEngine)
+    engine.replica.run_querystring = AsyncMock(return_value=[{"node": "replica"}])
+    yield engine
+
+
+async def run(engine: RoutingPostgresEngine, query: str) -> list[dict]:
+    return [dict(row) for row in await engine.run_querystring(QueryString(query))]
+
+
+async def test_reads_use_primary_by_default(engine: RoutingPostgresEngine) -> None:
+    assert await run(engine, "SELECT 'primary' AS node") == [{"node": "primary"}]
+
+
+async def test_reads_use_replica(engine: RoutingPostgresEngine) -> None:
+    with read_from_replica():
+        assert await run(engine, "SELECT 'primary' AS node") == [{"node": "replica"}]
+
+
+async def test_read_your_writes(engine: RoutingPostgresEngine) -> None:
+    with read_from_replica():
+        await run(engine, "SET application_name = 'bullsquid-test'")
+        assert await run(engine, "SELECT 'primary' AS node") == [{"node": "primary"}]
+
+    with read_from_replica():
+        assert await run(engine, "SELECT 'primary' AS node") == [{"node": "replica"}]
+
+
+async def test_cte_reads_use_replica(engine: RoutingPostgresEngine) -> None:
+    with read_from_replica():
+        assert await run(
+            engine, "WITH RECURSIVE n AS (SELECT 1) SELECT 'primary' AS node"
+        ) == [{"node": "replica"}]
+        # reads after it can still go to the replica.
+        assert await run(engine, "SELECT 'primary' AS node") == [{"node": "replica"}]
+
+
+async def test_cte_writes_use_primary(
+    database: None, engine: RoutingPostgresEngine
+) -> None:
+    with read_from_replica():
+        assert await run(
+            engine,
+            "WITH updated AS (UPDATE plan SET status = status WHERE false RETURNING 1) "
+            "SELECT 'primary' AS node",
+        ) == [{"node": "primary"}]
+        assert await run(engine, "SELECT 'primary' AS node") == [{"node": "primary"}]
+
+
+@pytest.mark.parametrize(
+    "clause", ["FOR UPDATE", "FOR NO KEY UPDATE", "FOR SHARE", "for key share"]
+)
+async def test_locking_reads_use_primary(
+    database: None, engine: RoutingPostgresEngine, clause: str
+) -> None:
+    with read_from_replica():
+        assert await run(engine, f"SELECT 'primary' AS node FROM plan {clause}") == []
+    engine.replica.run_querystring.assert_not_awaited()  # type: ignore
+
+
+async def test_use_primary(engine: RoutingPostgresEngine) -> None:
+    with read_from_replica(), use_primary():
+        assert await run(engine, "SELECT 'primary' AS node") == [{"node": "primary"}]
+
+
+async def test_transactions_use_primary(engine: RoutingPostgresEngine) -> None:
+    with read_from_replica():
+        async with engine.transaction():
+            result = await run(engine, "SELECT 'primary' AS node")
+    assert result == [{"node": "primary"}]
+
+
+async def test_no_replica(engine: RoutingPostgresEngine) -> None:
+    engine.replica = None
+    with read_from_replica():
+        assert await run(engine, "SELECT 'primary' AS node") == [{"node": "primary"}]
+
+
+@pytest.mark.parametrize(
+    "method,headers,routed",
+    [
+        ("get", {}, True),
+        ("get", {"X-Read-Primary": "true"}, False),
+        ("post", {}, False),
+    ],
+)
+def test_route_reads_middleware(
+    test_client: TestClient, method: str, headers: dict[str, str], routed: bool
+) -> None:
+    with patch("bullsquid.api.app.read_from_replica") as mock_read_from_replica:
+        test_client.request(method, "/livez", headers=headers)
+    assert mock_read_from_replica.called == routed
+
+
+async def test_record_queries(engine: RoutingPostgresEngine) -> None:
+    with record_queries() as stats:
+        await run(engine, "SELECT 1")
+        with read_from_replica():
+            await run(engine, "SELECT 2")
+
+    await run(engine, "SELECT 3")
+
+    assert stats.count == 2
+    assert stats.duration > 0
+    assert sorted(query for _, query in stats.slowest) == ["SELECT 1", "SELECT 2"]
+    assert stats.server_timing().endswith('desc="2 queries"')
+
+
+async def test_stream(engine: RoutingPostgresEngine) -> None:
+    query = "SELECT n FROM generate_series(1, $1) AS n"
+    with record_queries() as stats:
+        rows = [row["n"] async for row in engine.stream(query, 5, prefetch=2)]
+
+    assert rows == [1, 2, 3, 4, 5]
+    # the cursor's fetches are recorded as a single query.
+    assert stats.count == 1
+    assert stats.slowest[0][1] == query
+
+
+async def _collect(rows: AsyncIterator[Record]) -> list[dict]:
+    return [dict(row) async for row in rows]
+
+
+async def test_stream_uses_own_connection_with_timeouts(
+    engine: RoutingPostgresEngine,
+) -> None:
+    await engine.start_connection_pool(min_size=1, max_size=1)
+    try:
+        query = (
+            "SELECT current_setting('statement_timeout') AS statement,"
+            " current_setting('idle_in_transaction_session_timeout') AS idle"
+        )
+        with (
+            patch.object(settings.database, "stream_statement_timeout", 1.5),
+            patch.object(settings.database, "stream_idle_timeout", 0.5),
+        ):
+            # with the only pooled connection taken, streaming from the pool
+            # would wait forever.
+            assert engine.pool is not None
+            async with engine.pool.acquire():
+                rows = await asyncio.wait_for(
+                    _collect(engine.stream(query, prefetch=1)), timeout=5
+                )
+    finally:
+        await engine.close_connection_pool()
+
+    assert rows == [{"statement": "1500ms", "idle": "500ms"}]
+
+
+async def test_stream_concurrency_limit(engine: RoutingPostgresEngine) -> None:
+    engine._streams = asyncio.Semaphore(1)
+    query = "SELECT n FROM generate_series(1, 2) AS n"
+    first = engine.stream(query, prefetch=1)
+    second = engine.stream(query, prefetch=1)
+
+    assert (await anext(first))["n"] == 1
+    waiting = asyncio.ensure_future(anext(second))
+    await asyncio.sleep(0.1)
+    assert not waiting.done()
+
+    await first.aclose()
+    assert (await waiting)["n"] == 1
+    await second.aclose()
+
+
+async def test_reserve_stream(engine: RoutingPostgresEngine) -> None:
+    engine._streams = asyncio.Semaphore(1)
+    query = "SELECT n FROM generate_series(1, 2) AS n"
+    slot = await engine.reserve_stream()
+
+    with pytest.raises(StreamsBusy):
+        await engine.reserve_stream()
+
+    # the stream runs in the reserved slot, and gives it back when finished.
+    rows = await _collect(engine.stream(query, prefetch=1, slot=slot))
+    assert rows == [{"n": 1}, {"n": 2}]
+    assert not engine._streams.locked()
+
+    # releasing the slot again doesn't free another one.
+    slot.release()
+    await engine.reserve_stream()
+    with pytest.raises(StreamsBusy):
+        await engine.reserve_stream()
+
+
+async def test_slow_query_logging(engine: RoutingPostgresEngine) -> None:
+    with (
+        patch.object(settings, "slow_query_threshold", timedelta()),
+        patch("bullsquid.engine.logger") as mock_logger,
+    ):
+        await run(engine, "SELECT 1")
+    (message,), _ = mock_logger.warning.call_args
+    assert message.startswith("Slow query") and message.endswith("SELECT 1")
+
+
+def test_query_stats_slowest() -> None:
+    stats = QueryStats()
+    for duration in (0.1, 0.5, 0.2, 0.4, 0.3):
+        stats.record(f"SELECT {duration}", duration)
+
+    assert stats.count == 5
+    assert stats.duration == pytest.approx(1.5)
+    assert stats.slowest == [
+        (0.5, "SELECT 0.5"),
+        (0.4, "SELECT 0.4"),
+        (0.3, "SELECT 0.3"),
+    ]
+    assert stats.server_timing() == 'db;dur=1500.0;desc="5 queries"'
+
+
+@pytest.mark.parametrize(
+    "max_count,max_duration,expensive",
+    [
+        (5, timedelta(seconds=2), False),
+        (4, timedelta(seconds=2), True),
+        (5, timedelta(seconds=1), True),
+    ],
+)
+def test_query_stats_log_if_expensive(
+    max_count: int, max_duration: timedelta, expensive: bool
+) -> None:
+    stats = QueryStats()
+    for _ in range(5):
+        stats.record("SELECT 1", 0.3)
+
+    with patch("bullsquid.engine.logger") as mock_logger:
+        assert (
+            stats.log_if_expensive(
+                "GET /", max_count=max_count, max_duration=max_duration
+            )
+            == expensive
+        )
+    assert mock_logger.warning.called == expensive
+
+
+def test_server_timing_header(test_client: TestClient) -> None:
+    resp = test_client.get("/livez")
+    assert resp.headers["Server-Timing"] == 'db;dur=0.0;desc="0 queries"'
@@ -0,0 +1,101 @@
+"""Tests for the metrics registry."""
+
+import pytest
+
+from bullsquid.metrics import Counter, Gauge, Histogram, Metric, Registry
+
+
+async def test_counter_render() -> None:
+    registry = Registry()
+    jobs = Counter("test_jobs", "Test jobs.", ["message_type"])
+    registry.register(jobs)
+
+    jobs.inc(message_type="A")
+    jobs.inc(2, message_type="A")
+    jobs.inc(message_type="B")
+
+    assert await registry.render() == (
+        "# HELP test_jobs Test jobs.\n"
+        "# TYPE test_jobs counter\n"
+        'test_jobs_total{message_type="A"} 3.0\n'
+        'test_jobs_total{message_type="B"} 1.0\n'
+    )
+
+
+def test_counter_cannot_decrease() -> None:
+    jobs = Counter("test_jobs", "Test jobs.")
+    with pytest.raises(ValueError):
+        jobs.inc(-1)
+
+
+def test_wrong_labels() -> None:
+    jobs = Counter("test_jobs", "Test jobs.", ["message_type"])
+    with pytest.raises(ValueError):
+        jobs.inc(outcome="failed")
+
+
+async def test_gauge_label_escaping() -> None:
+    registry = Registry()
+    depth = Gauge("test_depth", "Test depth.", ["name"])
+    registry.register(depth)
+
+    depth.set(5, name='a "quoted"\nname')
+
+    assert await registry.render() == (
+        "# HELP test_depth Test depth.\n"
+        "# TYPE test_depth gauge\n"
+        'test_depth{name="a \\"quoted\\"\\nname"} 5.0\n'
+    )
+
+
+async def test_histogram_render() -> None:
+    registry = Registry()
+    duration = Histogram("test_duration", "Test duration.", buckets=[0.1, 1.0])
+    registry.register(duration)
+
+    duration.observe(0.05)
+    duration.observe(0.5)
+    duration.observe(5)
+
+    assert duration.count() == 3
+    assert await registry.render() == (
+        "# HELP test_duration Test duration.\n"
+        "# TYPE test_duration histogram\n"
+        'test_duration_bucket{le="0.1"} 1.0\n'
+        'test_duration_bucket{le="1.0"} 2.0\n'
+        'test_duration_bucket{le="+Inf"} 3.0\n'
+        "test_duration_sum 5.55\n"
+        "test_duration_count 3.0\n"
+    )
+
+
+async def test_collectors_run_on_render() -> None:
+    registry = Registry()
+    depth = Gauge("test_depth", "Test depth.")
+    registry.register(depth)
+
+    async def collect() -> None:
+        depth.set(42)
+
+    async def broken() -> None:
+        raise Exception("oh no")
+
+    registry.add_collector(broken)
+    registry.add_collector(collect)
+
+    assert "test_depth 42.0" in await registry.render()
+
+
+def test_duplicate_metric_name() -> None:
+    registry = Registry()
+    registry.register(Gauge("test_depth", "Test depth."))
+    with pytest.raises(ValueError):
+        registry.register(Gauge("test_depth", "Test depth."))
+
+
+def test_metric_without_samples() -> None:
+    class Incomplete(Metric):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete", "Missing samples.")  # type: ignore[abstract]